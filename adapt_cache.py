@@ -0,0 +1,142 @@
+"""
+    Content-addressed cache of Caddy's `/adapt` results.
+    Adapting the same Caddyfile twice gives the same JSON and the same warnings, so results are
+    cached under a hash of the content type and the normalized config text. The cache is a
+    least-recently-used map bounded both by its number of entries and by the bytes it holds.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def normalize_config(config):
+    """
+    Normalize a configuration so edits that do not change it map to the same cache key.
+
+    Args:
+        config (dict or str): The configuration, parsed JSON or text such as a Caddyfile.
+
+    Returns:
+        bytes: The normalized configuration. Text has its line endings unified and trailing
+            whitespace at its end removed; other values are encoded as canonical JSON.
+    """
+    if isinstance(config, bytes):
+        config = config.decode('utf-8')
+    if isinstance(config, str):
+        return config.replace('\r\n', '\n').rstrip().encode('utf-8')
+    return json.dumps(config, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def cache_key(config, content_type):
+    """
+    Get the cache key of an adapt request.
+
+    Args:
+        config (dict or str): The configuration to adapt.
+        content_type (str): The Content-Type naming the adapter, e.g. `text/caddyfile`.
+
+    Returns:
+        str: The SHA-256 hex digest of the adapter name and the normalized configuration.
+    """
+    adapter = (content_type or '').split(';', 1)[0].strip().lower()
+    digest = hashlib.sha256(adapter.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_config(config))
+    return digest.hexdigest()
+
+
+class AdaptCache:
+    """
+    An LRU cache of encoded `/adapt` responses, i.e. the adapted `result` together with Caddy's `warnings`.
+
+    Attributes:
+        max_entries (int): The maximum number of cached results.
+        max_bytes (int): The maximum total size of the cached results.
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that were not.
+        evictions (int): The number of results evicted to stay within the bounds.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=16 * 1024 * 1024):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_entries (int, optional): The maximum number of cached results. Defaults to 128.
+            max_bytes (int, optional): The maximum total size of the cached results. Defaults to 16 MiB.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a cached response and mark it as recently used.
+
+        Args:
+            key (str): The key from `cache_key`.
+
+        Returns:
+            bytes: The encoded response, or None if it is not cached.
+        """
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        """
+        Cache a response, evicting the least recently used ones beyond the bounds.
+        Responses larger than `max_bytes` are not cached.
+
+        Args:
+            key (str): The key from `cache_key`.
+            body (bytes): The encoded response.
+        """
+        if len(body) > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all cached responses.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: The number of entries and bytes held, hits, misses, evictions and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,463 @@
+"""
+    ASGI serving mode for Birdie.
+    `BirdieASGI` serves the endpoints of a `BirdieServer` from an asyncio event loop, so one process
+    can hold thousands of idle config change long-polls and Server-Sent Events streams open: those
+    wait on the event loop and hold no thread while they wait. The endpoints that pass requests to
+    Caddy (`/config`, `/load`, `/adapt`, `/config/apply`, the PKI and upstream reads, ...) are served
+    natively with `AsyncCaddyAPI`, so a slow Caddy holds no thread either. Every other endpoint runs
+    in the Flask app, bridged by a2wsgi on its own thread pool, with the same responses in both modes.
+
+    Usage, from the repository root, with the environment variables of the gunicorn app:
+        uvicorn asgi:app --host 0.0.0.0 --port 5002
+        uvicorn --factory asgi:create_app --host 0.0.0.0 --port 5002
+"""
+import contextlib
+import os
+import threading
+import time
+from a2wsgi import WSGIMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Router
+from werkzeug.datastructures import MultiDict
+import json_codec
+from async_caddy_api import AsyncCaddyAPI
+from caddy_api import ConfigConflictError
+from config_tree import ConfigPathError, query_node
+from server import HTTP_ERRORS, HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, HTTP_REQUESTS, HTTP_RESPONSE_BYTES
+from sse import AsyncSubscriber
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def json_response(value, status=200):
+    """
+    Build a JSON response encoded with the codec of the Flask app, with its sorted keys.
+    """
+    return Response(json_codec.dumps(value, sort_keys=True), status, media_type='application/json')
+
+
+def raw_response(raw, status=200):
+    """
+    Build a response that sends a raw Caddy API body through unchanged, with Caddy's Etag.
+    """
+    return Response(raw.body, status, {'Etag': raw.etag} if raw.etag else None, media_type=raw.content_type)
+
+
+def error_response(error, status=500):
+    """
+    Build the JSON error response of the Flask app.
+    """
+    return json_response({'error': str(error)}, status)
+
+
+async def json_body(request):
+    """
+    Decode the JSON body of a request.
+
+    Returns:
+        any: The decoded body, or None if the body is empty or not JSON.
+    """
+    try:
+        return json_codec.loads(await request.body())
+    except ValueError:
+        return None
+
+
+def missing_fields(data, *fields):
+    """
+    Get the error message for a JSON body that lacks one of the required fields, as the Flask app words it.
+
+    Returns:
+        str: The message, or None if every field is present.
+    """
+    if isinstance(data, dict) and data and all(field in data for field in fields):
+        return None
+    names = [f'"{field}"' for field in fields]
+    if len(names) > 2:
+        listed = ', '.join(names[:-1]) + ', and ' + names[-1]
+    else:
+        listed = ' and '.join(names)
+    return f"Invalid request. {listed} {'is' if len(names) == 1 else 'are'} required."
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    A Server-Sent Events response that streams a subscription until the client disconnects, and
+    unsubscribes it however the response ends, even before the first event was sent.
+    """
+
+    def __init__(self, subscription, heartbeat=15):
+        """
+        Initializes the response.
+
+        Args:
+            subscription (EventSubscription): The subscription, with an `AsyncSubscriber`.
+            heartbeat (float, optional): Seconds between keepalive comments. Defaults to 15.
+        """
+        super().__init__(subscription.stream_async(heartbeat), media_type='text/event-stream', headers=SSE_HEADERS)
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self.subscription.close()
+
+
+class BirdieASGI:
+    """
+    ASGI app serving the endpoints of a BirdieServer.
+
+    Attributes:
+        birdie (BirdieServer): The server whose endpoints are served.
+        caddy_api (AsyncCaddyAPI): The non-blocking client of the Caddy instance of the server.
+        heartbeat (float): Seconds of silence after which SSE streams send a keepalive comment.
+        workers (int): The number of threads running the Flask app.
+        router (Router): Routes the native endpoints, and everything else to the Flask app.
+    """
+
+    def __init__(self, birdie, caddy_api=None, pool_size=100, heartbeat=15, workers=32):
+        """
+        Initializes the app.
+
+        Args:
+            birdie (BirdieServer): The server whose endpoints are served.
+            caddy_api (AsyncCaddyAPI, optional): The non-blocking client. Defaults to one sharing the
+                settings, caches and mutation listeners of the server's CaddyAPI client.
+            pool_size (int, optional): The connections to Caddy of the default client. Defaults to 100.
+            heartbeat (float, optional): Seconds between SSE keepalive comments. Defaults to 15.
+            workers (int, optional): The threads running the Flask app. Defaults to 32.
+        """
+        self.birdie = birdie
+        self.caddy_api = caddy_api or AsyncCaddyAPI(birdie.caddy_api, pool_size=pool_size)
+        self.heartbeat = heartbeat
+        self.workers = workers
+        prefix = birdie.url_prefix.rstrip('/')
+        routes = []
+        for rule, method, endpoint in (
+            ('/config', 'GET', self.get_config),
+            ('/config', 'POST', self.update_config),
+            ('/config', 'DELETE', self.delete_config),
+            ('/stop', 'POST', self.stop_server),
+            ('/config/changes', 'GET', self.get_config_changes),
+            ('/config/changes/stream', 'GET', self.stream_config_changes),
+            ('/config/array', 'POST', self.add_to_config_array),
+            ('/config/array/insert', 'POST', self.insert_into_config_array),
+            ('/adapt', 'POST', self.adapt_config),
+            ('/pki/ca', 'GET', self.get_pki_ca),
+            ('/pki/ca/certificates', 'GET', self.get_pki_ca_certificates),
+            ('/reverse_proxy/upstreams', 'GET', self.get_proxy_upstreams),
+            ('/reverse_proxy/upstreams/stream', 'GET', self.stream_proxy_upstreams),
+            ('/config/apply', 'POST', self.apply_config),
+            ('/config/plan', 'POST', self.plan_config),
+            ('/load', 'POST', self.load_config),
+            ('/import/<job_id>/events', 'GET', self.stream_import),
+            ('/stats', 'GET', self.get_stats),
+        ):
+            path = prefix + rule.replace('<', '{').replace('>', '}')
+            routes.append(Route(path, self._measured(prefix + rule, endpoint), methods=[method]))
+        # Flask answers unknown paths and trailing slashes itself, so the router must not redirect them
+        self.router = Router(routes, redirect_slashes=False, default=WSGIMiddleware(birdie.app, workers=workers),
+                             lifespan=self._lifespan)
+
+    async def __call__(self, scope, receive, send):
+        await self.router(scope, receive, send)
+
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app):
+        """
+        Close the connections to Caddy when the server shuts down.
+        """
+        try:
+            yield
+        finally:
+            await self.caddy_api.close()
+
+    @staticmethod
+    def _measured(rule, endpoint):
+        """
+        Wrap an endpoint to record the same request metrics as the Flask app, under its Flask rule.
+        """
+        async def measured(request):
+            started = time.perf_counter()
+            HTTP_IN_FLIGHT.inc()
+            try:
+                response = await endpoint(request)
+            except Exception:
+                HTTP_IN_FLIGHT.dec()
+                HTTP_ERRORS.labels(request.method, rule).inc()
+                raise
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUEST_DURATION.labels(request.method, rule).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(request.method, rule, str(response.status_code)).inc()
+            # Streamed responses have no length until they are sent
+            if not isinstance(response, StreamingResponse):
+                HTTP_RESPONSE_BYTES.labels(request.method, rule).observe(len(response.body))
+            return response
+        return measured
+
+    async def get_config(self, request):
+        """
+        Endpoint to get the current Caddy configuration or a specific configuration path, paged,
+        projected and filtered as by the Flask endpoint.
+        """
+        path = request.query_params.get('path')
+        try:
+            query = self.birdie._config_query(MultiDict(request.query_params.multi_items()))
+        except ValueError as e:
+            return error_response(e, 400)
+        try:
+            if query:
+                node = await self.caddy_api.get_config(path)
+                # Filtering a large array is CPU bound
+                return json_response(await run_in_threadpool(query_node, node, **query))
+            return raw_response(await self.caddy_api.get_config(path, raw=True))
+        except ConfigPathError as e:
+            return error_response(e.args[0], 400)
+        except Exception as e:
+            return error_response(e)
+
+    async def update_config(self, request):
+        """
+        Endpoint to update the Caddy configuration.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'path', 'value')
+        if error:
+            return error_response(error, 400)
+        try:
+            return json_response(await self.caddy_api.replace_config_value(data['path'], data['value']))
+        except Exception as e:
+            return error_response(e)
+
+    async def delete_config(self, request):
+        """
+        Endpoint to delete the Caddy configuration at a specific path or the entire configuration.
+        """
+        try:
+            return json_response(await self.caddy_api.delete_config(request.query_params.get('path')))
+        except Exception as e:
+            return error_response(e)
+
+    async def stop_server(self, request):
+        """
+        Endpoint to gracefully shut down the Caddy server.
+        """
+        try:
+            return json_response(await self.caddy_api.stop_server())
+        except Exception as e:
+            return error_response(e)
+
+    async def add_to_config_array(self, request):
+        """
+        Endpoint to add items to an array in the Caddy configuration.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'path', 'items')
+        if error:
+            return error_response(error, 400)
+        try:
+            return json_response(await self.caddy_api.add_to_config_array(data['path'], data['items']))
+        except Exception as e:
+            self.birdie.logger.error(f"Error adding to config array: {e}")
+            return error_response(e)
+
+    async def insert_into_config_array(self, request):
+        """
+        Endpoint to insert an item into an array in the Caddy configuration.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'path', 'index', 'item')
+        if error:
+            return error_response(error, 400)
+        try:
+            return json_response(await self.caddy_api.insert_into_config_array(data['path'], data['index'], data['item']))
+        except Exception as e:
+            return error_response(e)
+
+    async def adapt_config(self, request):
+        """
+        Endpoint to adapt a configuration, as JSON under `config` or as text such as a Caddyfile, to Caddy JSON.
+        """
+        content_type = request.headers.get('Content-Type', 'application/json')
+        body = await request.body()
+        if not body:
+            return error_response('Invalid request. Configuration content is required.', 400)
+        if content_type == 'application/json':
+            try:
+                data = json_codec.loads(body)
+            except ValueError:
+                return error_response('Invalid JSON format.', 400)
+            if not isinstance(data, dict) or 'config' not in data:
+                return error_response('Invalid request. "config" is required in JSON.', 400)
+            config = data['config']
+        else:
+            config = body.decode('utf-8')
+        try:
+            return raw_response(await self.caddy_api.adapt_config(config, content_type, raw=True))
+        except Exception as e:
+            self.birdie.logger.error(f"Error adapting configuration: {e}")
+            return error_response(e)
+
+    async def _get_pki(self, request, get):
+        ca_id = request.query_params.get('id')
+        if not ca_id:
+            return error_response('"id" query parameter is required.', 400)
+        try:
+            return raw_response(await get(ca_id, raw=True))
+        except Exception as e:
+            return error_response(e)
+
+    async def get_pki_ca(self, request):
+        """
+        Endpoint to get the current PKI CA configuration.
+        """
+        return await self._get_pki(request, self.caddy_api.get_pki_ca)
+
+    async def get_pki_ca_certificates(self, request):
+        """
+        Endpoint to get the current PKI CA certificates.
+        """
+        return await self._get_pki(request, self.caddy_api.get_pki_ca_certificates)
+
+    async def get_proxy_upstreams(self, request):
+        """
+        Endpoint to get the current proxy upstreams.
+        """
+        try:
+            return raw_response(await self.caddy_api.get_proxy_upstreams(raw=True))
+        except Exception as e:
+            return error_response(e)
+
+    async def apply_config(self, request):
+        """
+        Endpoint to change the Caddy configuration to the given one with minimal narrow operations.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'config')
+        if error:
+            return error_response(error, 400)
+        dry_run = bool(data.get('dry_run', False))
+        try:
+            operations = await self.caddy_api.apply_config(data['config'], dry_run=dry_run)
+            return json_response({'operations': operations, 'applied': not dry_run})
+        except ConfigConflictError as e:
+            return error_response(e, 409)
+        except Exception as e:
+            return error_response(e)
+
+    async def plan_config(self, request):
+        """
+        Endpoint to get the operations that would change the Caddy configuration to the given one.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'config')
+        if error:
+            return error_response(error, 400)
+        try:
+            return json_response({'operations': await self.caddy_api.apply_config(data['config'], dry_run=True)})
+        except Exception as e:
+            return error_response(e)
+
+    async def load_config(self, request):
+        """
+        Endpoint to load a new Caddy configuration.
+        """
+        data = await json_body(request)
+        error = missing_fields(data, 'config')
+        if error:
+            return error_response(error, 400)
+        content_type = request.headers.get('Content-Type', 'application/json')
+        try:
+            return json_response(await self.caddy_api.load_config(data['config'], content_type))
+        except Exception as e:
+            return error_response(e)
+
+    async def get_stats(self, request):
+        """
+        Endpoint to get the statistics of the server, with those of the non-blocking client under `async_client`.
+        """
+        stats = await run_in_threadpool(self.birdie.stats)
+        stats['async_client'] = self.caddy_api.stats()
+        return json_response(stats)
+
+    async def get_config_changes(self, request):
+        """
+        Endpoint to long-poll for config changes after generation `since`, as the Flask endpoint
+        does, but waiting on the event loop instead of in a thread.
+        """
+        since, timeout = self.birdie.long_poll_args(MultiDict(request.query_params.multi_items()))
+        feed = self.birdie.change_feed
+        try:
+            await run_in_threadpool(feed.start)
+            return json_response(await feed.changes_async(since, timeout))
+        except Exception as e:
+            return json_response({'error': str(e)}, 500)
+
+    async def stream_config_changes(self, request):
+        """
+        Endpoint to stream config changes as Server-Sent Events, resuming after `Last-Event-ID` or `since`.
+        """
+        since = request.headers.get('Last-Event-ID') or request.query_params.get('since')
+        subscription = await run_in_threadpool(self.birdie.subscribe_config_changes, since, AsyncSubscriber())
+        return EventStreamResponse(subscription, self.heartbeat)
+
+    async def stream_proxy_upstreams(self, request):
+        """
+        Endpoint to stream the samples of the proxy upstreams as Server-Sent Events.
+        """
+        node = request.query_params.get('node', 'default')
+        try:
+            subscription = await run_in_threadpool(self.birdie.subscribe_upstream_samples, node, AsyncSubscriber())
+        except KeyError as e:
+            return json_response({'error': f'Unknown fleet node: {e}'}, 404)
+        return EventStreamResponse(subscription, self.heartbeat)
+
+    async def stream_import(self, request):
+        """
+        Endpoint to follow the progress of a bulk site import as Server-Sent Events.
+        The stream ends with a `completed` or `failed` event.
+        """
+        job_id = request.path_params['job_id']
+        subscription = self.birdie.subscribe_import(job_id, AsyncSubscriber())
+        if not subscription:
+            return json_response({'error': f'Unknown import: {job_id}'}, 404)
+        return EventStreamResponse(subscription, self.heartbeat)
+
+
+def create_app(birdie=None, **options):
+    """
+    Create the ASGI app of a BirdieServer, e.g. `uvicorn --factory asgi:create_app`.
+
+    Args:
+        birdie (BirdieServer, optional): The server whose endpoints are served. Defaults to the one
+            the server module creates from the environment.
+        **options: Further options of `BirdieASGI`. The worker threads default to `BIRDIE_ASGI_WORKERS`
+            and the connections to Caddy to `CADDY_ASYNC_POOL_SIZE`.
+
+    Returns:
+        BirdieASGI: The ASGI app.
+    """
+    if birdie is None:
+        import server
+        birdie = server.birdie
+    options.setdefault('workers', int(os.getenv('BIRDIE_ASGI_WORKERS', '32')))
+    options.setdefault('pool_size', int(os.getenv('CADDY_ASYNC_POOL_SIZE', '100')))
+    return BirdieASGI(birdie, **options)
+
+
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """
+    Create `app` for uvicorn and hypercorn the first time it is used rather than on import.
+    """
+    if name != 'app':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
@@ -0,0 +1,281 @@
+"""
+    Static asset pipeline for Birdie.
+    At startup every file below the static folder is read once, fingerprinted with a hash of its
+    content and compressed with gzip and, if the `brotli` package is installed, brotli by
+    `AssetPipeline.compress`, which `BirdieServer` runs while it starts unless prewarming is turned
+    off; an asset that is not compressed yet is compressed on its first request. Assets are
+    then served from memory under their fingerprinted URL with immutable caching, and rendered
+    pages are kept in memory in the same precompressed form, so repeat page loads cost almost no CPU.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from functools import cached_property
+from flask import Response, render_template
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def compress(body, mimetype, min_size=256):
+    """
+    Compress a body with every available encoding that makes it smaller.
+
+    Args:
+        body (bytes): The body.
+        mimetype (str): Its MIME type; only text-like types are compressed.
+        min_size (int, optional): Bodies smaller than this are not compressed. Defaults to 256.
+
+    Returns:
+        dict: Mapping of content encoding, "br" or "gzip", to the compressed body.
+    """
+    if len(body) < min_size or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return {}
+    encodings = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(body, quality=11)
+    return {encoding: data for encoding, data in encodings.items() if len(data) < len(body)}
+
+
+class Asset:
+    """
+    A body held in memory with its precompressed variants.
+
+    Attributes:
+        body (bytes): The uncompressed body.
+        mimetype (str): The MIME type of the body.
+        etag (str): The strong ETag, a hash of the uncompressed body.
+        encodings (dict): Mapping of content encoding to the compressed body, compressed on first use.
+        mtime (float): The modification time of the source file, if it has one.
+    """
+
+    def __init__(self, body, mimetype, mtime=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.etag = self.digest[:32]
+        self.mtime = mtime
+
+    @cached_property
+    def encodings(self):
+        return compress(self.body, self.mimetype)
+
+    @property
+    def compressed(self):
+        """
+        bool: Whether the compressed variants have been built.
+        """
+        return 'encodings' in self.__dict__
+
+    @cached_property
+    def text(self):
+        """
+        str: The body decoded as UTF-8.
+        """
+        return self.body.decode('utf-8')
+
+    def response(self, request, cache_control):
+        """
+        Build the response for a request, choosing the best encoding the client accepts.
+
+        Args:
+            request (Request): The Flask request.
+            cache_control (str): The Cache-Control header of the response.
+
+        Returns:
+            Response: 304 Not Modified if the client has the body, else the body in the chosen encoding.
+        """
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in self.encodings and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = f'{self.etag}-{encoding}' if encoding else self.etag
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.encodings[encoding] if encoding else self.body, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class AssetPipeline:
+    """
+    Fingerprinted, precompressed static assets and rendered pages served from memory.
+
+    Attributes:
+        root (str): The static folder.
+        url_prefix (str): The URL prefix of the Birdie blueprint the `/assets` route is registered on.
+        auto_reload (bool): Pick up changed files and re-render pages on every request, for development.
+    """
+
+    def __init__(self, root, url_prefix='', auto_reload=False):
+        """
+        Initializes an empty pipeline; call `build` to load the assets.
+
+        Args:
+            root (str): The static folder.
+            url_prefix (str, optional): The URL prefix of the Birdie blueprint. Defaults to ''.
+            auto_reload (bool, optional): Pick up changed files on every request. Defaults to False.
+        """
+        self.root = root
+        self.url_prefix = url_prefix
+        self.auto_reload = auto_reload
+        self.logger = logging.getLogger(__name__)
+        self._assets = {}
+        self._fingerprinted = {}
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(path, asset):
+        """
+        Get the fingerprinted name of an asset, e.g. `js/routes.3f2a9c1b0d4e.js`.
+        """
+        base, extension = os.path.splitext(path)
+        return f'{base}.{asset.digest[:12]}{extension}'
+
+    def _load(self, path):
+        full_path = os.path.join(self.root, path)
+        with open(full_path, 'rb') as f:
+            body = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            mimetype += '; charset=utf-8'
+        asset = Asset(body, mimetype, os.path.getmtime(full_path))
+        with self._lock:
+            previous = self._assets.get(path)
+            if previous is not None:
+                self._fingerprinted.pop(self.fingerprint(path, previous), None)
+            self._assets[path] = asset
+            self._fingerprinted[self.fingerprint(path, asset)] = path
+        return asset
+
+    def build(self):
+        """
+        Load and fingerprint every file below the static folder.
+
+        Returns:
+            int: The number of assets loaded.
+        """
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                self._load(os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/'))
+        self.logger.debug('Loaded %d static assets, brotli %s', len(self._assets), 'enabled' if brotli else 'unavailable')
+        return len(self._assets)
+
+    def compress(self):
+        """
+        Compress every asset now instead of on its first request, e.g. while a worker starts.
+
+        Returns:
+            int: The number of assets compressed.
+        """
+        with self._lock:
+            assets = list(self._assets.values())
+        for asset in assets:
+            asset.encodings
+        return len(assets)
+
+    def get(self, path):
+        """
+        Get an asset by its path below the static folder, e.g. `templates/route_templates.html`.
+
+        Returns:
+            Asset: The asset, or None if there is no such file.
+        """
+        asset = self._assets.get(path)
+        if self.auto_reload:
+            full_path = os.path.join(self.root, path)
+            if asset is None or not os.path.isfile(full_path):
+                return self._load(path) if os.path.isfile(full_path) else None
+            if os.path.getmtime(full_path) != asset.mtime:
+                asset = self._load(path)
+        return asset
+
+    def url(self, path):
+        """
+        Get the fingerprinted URL of an asset, for the `asset_url` template global.
+
+        Args:
+            path (str): The path below the static folder, e.g. `js/routes.js`.
+
+        Returns:
+            str: The fingerprinted URL, or the plain `/static` URL if the asset is unknown.
+        """
+        asset = self.get(path)
+        if asset is None:
+            return f'/static/{path}'
+        return f'{self.url_prefix}/assets/{self.fingerprint(path, asset)}'
+
+    def serve(self, name, request):
+        """
+        Serve an asset by its fingerprinted name with immutable caching.
+
+        Args:
+            name (str): The fingerprinted name, e.g. `js/routes.3f2a9c1b0d4e.js`.
+            request (Request): The Flask request.
+
+        Returns:
+            Response: The asset, or None if the name is unknown.
+        """
+        path = self._fingerprinted.get(name)
+        asset = self.get(path) if path is not None else None
+        if asset is None or self.fingerprint(path, asset) != name:
+            return None
+        return asset.response(request, IMMUTABLE)
+
+    def page(self, request, template, **context):
+        """
+        Serve a rendered template. Pages do not depend on the request, so each is rendered and
+        compressed once and revalidated by ETag afterwards.
+
+        Args:
+            request (Request): The Flask request.
+            template (str): The template name.
+            **context: The hashable template variables.
+
+        Returns:
+            Response: The rendered page.
+        """
+        key = (template, tuple(sorted(context.items())))
+        page = None if self.auto_reload else self._pages.get(key)
+        if page is None:
+            page = Asset(render_template(template, **context).encode('utf-8'), 'text/html; charset=utf-8')
+            self._pages[key] = page
+        # Pages link to fingerprinted assets, so they must be revalidated to pick up new ones
+        return page.response(request, 'no-cache')
+
+    def stats(self):
+        """
+        Get the size of the pipeline.
+
+        Returns:
+            dict: The number of assets and cached pages, how many are compressed yet and their
+                uncompressed and compressed bytes.
+        """
+        with self._lock:
+            assets = list(self._assets.values()) + list(self._pages.values())
+        return {
+            'assets': len(self._assets),
+            'pages': len(self._pages),
+            'compressed': sum(1 for asset in assets if asset.compressed),
+            'bytes': sum(len(asset.body) for asset in assets),
+            'compressed_bytes': {
+                encoding: sum(len(asset.encodings.get(encoding, b'')) for asset in assets if asset.compressed)
+                for encoding in ('gzip', 'br')
+            },
+        }
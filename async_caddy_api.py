@@ -0,0 +1,587 @@
+"""
+    Non-blocking Caddy API client.
+    This module provides a class `AsyncCaddyAPI` with the methods of `CaddyAPI` as coroutines, so one
+    event loop can wait on any number of slow admin calls, such as `/load` or `/adapt`, without
+    holding a thread for each. It wraps a `CaddyAPI` and shares its config cache, circuit breaker,
+    adapt cache and mutation listeners, so changes made through either client reach the route index,
+    the change feed and the config history alike. Only the transport differs: a pooled
+    `httpx.AsyncClient`, over TCP, TLS or the unix socket of the blocking client. Errors are raised
+    as the same `requests` exceptions, so callers handle both clients alike.
+"""
+import asyncio
+import copy
+import logging
+import random
+import time
+import httpx
+import requests
+import json_codec
+from adapt_cache import cache_key
+from caddy_api import (CADDY_ERRORS, CADDY_IN_FLIGHT, CADDY_REQUEST_BYTES, CADDY_REQUEST_DURATION, CADDY_RESPONSE_BYTES,
+                       ConfigConflictError, LogPayload, RawResponse, endpoint_label)
+from caddy_transport import CaddyUnavailableError
+from config_diff import apply_operations as apply_to_tree, common_root, diff_config, relative_operations
+from config_tree import get_node, split_path
+
+# Bodies larger than this are decoded in a worker thread, so a large config never stalls the event loop
+OFFLOAD_BYTES = 256 * 1024
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent identical coroutine calls on one event loop, as `SingleFlight` does for threads.
+
+    Attributes:
+        leaders (int): The number of calls that did the work.
+        coalesced (int): The number of calls that shared the result of another call.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+
+    async def do(self, key, function):
+        """
+        Await a coroutine function once for all concurrent callers with the same key.
+        The work runs in its own task, so any caller giving up, the first one included, leaves it
+        running for the others.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            function (callable): Returns the coroutine to await, without arguments.
+
+        Returns:
+            any: The result of the coroutine, shared by all concurrent callers.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        del self._calls[key]
+        if not task.cancelled():
+            # Mark the error as retrieved for the case every caller gave up waiting for it
+            task.exception()
+
+    def stats(self):
+        """
+        Get the coalescing counters.
+
+        Returns:
+            dict: The number of leading and coalesced calls and of calls in flight.
+        """
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+class AsyncCaddyAPI:
+    """
+    A non-blocking client of the Caddy API, with the methods of `CaddyAPI` as coroutines.
+    An instance belongs to the event loop it is first used on.
+
+    Attributes:
+        caddy_api (CaddyAPI): The blocking client whose settings, caches and listeners are shared.
+        singleflight (AsyncSingleFlight): Coalesces concurrent identical GET requests.
+        client (httpx.AsyncClient): The pooled connections to the admin API.
+    """
+
+    def __init__(self, caddy_api, pool_size=100, transport=None):
+        """
+        Initializes the client of the Caddy instance of a blocking client.
+
+        Args:
+            caddy_api (CaddyAPI): The blocking client.
+            pool_size (int, optional): The maximum number of open connections. Defaults to 100.
+            transport (httpx.AsyncBaseTransport, optional): Replaces the pooled transport, e.g. in tests.
+        """
+        self.caddy_api = caddy_api
+        self.singleflight = AsyncSingleFlight()
+        connect_timeout, read_timeout = caddy_api.timeout
+        if transport is None:
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            transport = httpx.AsyncHTTPTransport(uds=caddy_api.socket_path, limits=limits)
+        self.client = httpx.AsyncClient(base_url=caddy_api.base_url, headers=caddy_api.headers, transport=transport,
+                                        timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+        self.logger = logging.getLogger(__name__)
+
+    async def _request(self, method, endpoint, body=None, headers=None):
+        """
+        Helper method to make a request to the Caddy API.
+        Args:
+            method (str): The HTTP method to use (GET, POST, PUT, PATCH, DELETE).
+            endpoint (str): The API endpoint to call.
+            body (bytes, optional): The encoded request body.
+            headers (dict, optional): Headers to send in addition to the default ones.
+        Returns:
+            httpx.Response: The response from the API.
+        Raises:
+            requests.RequestException: If the request fails.
+        """
+        if method == 'GET':
+            # Concurrent callers asking for the same resource share one upstream request
+            key = (endpoint, (headers or {}).get('If-None-Match'))
+            return await self.singleflight.do(key, lambda: self._send(method, endpoint, body, headers))
+        return await self._send(method, endpoint, body, headers)
+
+    async def _send(self, method, endpoint, body, headers):
+        """
+        Send a request to the Caddy API, retrying idempotent requests and honouring the circuit
+        breaker, as `CaddyAPI._send` does.
+        """
+        caddy_api = self.caddy_api
+        self.logger.debug('Making %s request to %s with body: %s', method, endpoint, LogPayload(body, caddy_api.log_payload_limit))
+        attempts = caddy_api.retries + 1 if method in caddy_api.idempotent_methods else 1
+        label = endpoint_label(endpoint)
+        try:
+            for attempt in range(attempts):
+                if not caddy_api.breaker.allow():
+                    CADDY_ERRORS.labels(method, label, 'circuit_open').inc()
+                    raise CaddyUnavailableError(f'Caddy admin API at {caddy_api.api_url} is unavailable, not retrying yet.')
+                last_attempt = attempt + 1 == attempts
+                CADDY_IN_FLIGHT.inc()
+                start = time.perf_counter()
+                try:
+                    response = await self.client.request(method, endpoint, content=body, headers=headers)
+                except httpx.TransportError as e:
+                    caddy_api.breaker.record_failure()
+                    error = (requests.Timeout if isinstance(e, httpx.TimeoutException) else requests.ConnectionError)(
+                        f'{method} {endpoint} failed: {e!r}')
+                    CADDY_ERRORS.labels(method, label, type(error).__name__).inc()
+                    if last_attempt:
+                        raise error from e
+                    self.logger.warning('Retrying %s %s after error: %s', method, endpoint, error)
+                    await self._sleep_backoff(attempt)
+                    continue
+                except BaseException:
+                    # A trial call of the breaker must be settled on every way out, or it stays half-open
+                    caddy_api.breaker.record_failure()
+                    raise
+                finally:
+                    CADDY_IN_FLIGHT.dec()
+                    CADDY_REQUEST_DURATION.labels(method, label).observe(time.perf_counter() - start)
+                caddy_api.breaker.record_success()
+                if body:
+                    CADDY_REQUEST_BYTES.labels(method, label).observe(len(body))
+                CADDY_RESPONSE_BYTES.labels(method, label).observe(len(response.content))
+                if response.status_code >= 400:
+                    CADDY_ERRORS.labels(method, label, str(response.status_code)).inc()
+                if response.status_code in caddy_api.retry_statuses and not last_attempt:
+                    self.logger.warning('Retrying %s %s after status %s', method, endpoint, response.status_code)
+                    await self._sleep_backoff(attempt)
+                    continue
+                break
+            if response.status_code >= 400:
+                kind = 'Client' if response.status_code < 500 else 'Server'
+                raise requests.HTTPError(f'{response.status_code} {kind} Error: {response.reason_phrase} for url: '
+                                         f'{response.url}', response=response)
+            self.logger.debug('Response: %s - %s', response.status_code, LogPayload(response.content, caddy_api.log_payload_limit))
+            return response
+        except requests.RequestException as e:
+            self.logger.error(f'Error making request to {endpoint}: {e}')
+            raise
+
+    async def _sleep_backoff(self, attempt):
+        """
+        Sleep before a retry, using exponential backoff with full jitter.
+        Args:
+            attempt (int): The number of the attempt that failed, starting at 0.
+        """
+        await asyncio.sleep(random.uniform(0, min(self.caddy_api.max_backoff, self.caddy_api.backoff * 2 ** attempt)))
+
+    async def _decode(self, content):
+        """
+        Decode a JSON body, in a worker thread if it is large.
+        Args:
+            content (bytes): The body.
+        Returns:
+            any: The decoded body, or None if the body is empty.
+        """
+        if not content:
+            return None
+        if len(content) > OFFLOAD_BYTES:
+            return await asyncio.to_thread(json_codec.loads, content)
+        return json_codec.loads(content)
+
+    async def _encode(self, value, offload=False):
+        """
+        Encode a JSON request body, in a worker thread for values as large as a whole config.
+        """
+        if offload:
+            return await asyncio.to_thread(json_codec.dumps, value)
+        return json_codec.dumps(value)
+
+    async def _mutating(self, *paths):
+        # The listeners of the blocking client may block, e.g. to invalidate the route index
+        await asyncio.to_thread(self.caddy_api.notify_mutation, list(paths), True)
+
+    async def _mutated(self, *paths):
+        await asyncio.to_thread(self.caddy_api.notify_mutation, list(paths))
+
+    async def _fetch_snapshot(self):
+        """
+        Get a snapshot of the full Caddy configuration from the cache of the blocking client,
+        downloading it again once it is older than `cache_ttl`.
+        Returns:
+            ConfigSnapshot: The snapshot of the full Caddy configuration.
+        """
+        cached, generation, fresh = self.caddy_api._cached_snapshot()
+        if fresh:
+            return cached
+        response = await self._request('GET', '/config/', headers=self.caddy_api._revalidation_headers(cached))
+        if len(response.content) > OFFLOAD_BYTES:
+            return await asyncio.to_thread(self.caddy_api._update_snapshot, cached, generation, response)
+        return self.caddy_api._update_snapshot(cached, generation, response)
+
+    def stats(self):
+        """
+        Get the runtime statistics of this client.
+        Returns:
+            dict: The coalesced requests and the transport.
+        """
+        return {'singleflight': self.singleflight.stats(), 'transport': 'httpx'}
+
+    async def close(self):
+        """
+        Close the pooled connections.
+        """
+        await self.client.aclose()
+
+    async def get_config(self, path=None, raw=False):
+        """
+        Get the current Caddy configuration or a specific configuration at the given path.
+        When config caching is enabled the path is resolved against the cached config tree.
+        Args:
+            path (str, optional): The configuration path to retrieve. Defaults to None.
+            raw (bool, optional): Return the encoded JSON instead of the parsed value. Defaults to False.
+        Returns:
+            dict: The current Caddy configuration or the configuration at the specified path.
+            RawResponse: The encoded configuration, if `raw` is set.
+        """
+        if self.caddy_api.cache_config:
+            snapshot = await self._fetch_snapshot()
+            if raw:
+                # Caddy's Etags name the path they were read from, so only the whole config has one
+                return RawResponse(snapshot.encode(path), etag=None if split_path(path) else snapshot.etag)
+            return get_node(snapshot.config, path)
+        response = await self._request('GET', f'/config/{path}' if path else '/config')
+        if raw:
+            return RawResponse(response.content, response.headers.get('Content-Type', 'application/json'),
+                               etag=response.headers.get('Etag'))
+        return await self._decode(response.content)
+
+    async def current_config(self):
+        """
+        Get the full configuration together with its Etag.
+        Returns:
+            tuple: The configuration (read-only) and the Etag Caddy returned for it.
+        """
+        if self.caddy_api.cache_config:
+            snapshot = await self._fetch_snapshot()
+            return snapshot.config, snapshot.etag
+        response = await self._request('GET', '/config/')
+        return await self._decode(response.content), response.headers.get('Etag')
+
+    async def apply_operations(self, operations, etag=None, base=None):
+        """
+        Apply planned configuration operations as one guarded change, chaining, collapsing and
+        rolling back plans as `CaddyAPI.apply_operations` does.
+
+        Args:
+            operations (list): The operations, as returned by `config_diff.diff_config`.
+            etag (str, optional): The Etag of the configuration the operations were planned against,
+                sent as `If-Match` so the plan is rejected if the configuration changed in the meantime.
+            base (dict, optional): The configuration the operations were planned against, used to
+                collapse and roll back plans of several operations. Defaults to the cached configuration.
+
+        Raises:
+            ConfigConflictError: If the configuration no longer matches the Etag.
+        """
+        if not operations:
+            return
+        caddy_api = self.caddy_api
+        paths = [operation['path'] for operation in operations]
+        root = before = None
+        if len(operations) > 1:
+            if base is None:
+                base, base_etag = await self.current_config()
+                if etag and base_etag != etag:
+                    raise ConfigConflictError('The Caddy configuration changed since it was read.')
+            root = common_root(operations)
+            before = get_node(base, root)
+        await self._mutating(*paths)
+        applied = 0
+        try:
+            if len(operations) == 1 or (len(operations) <= caddy_api.max_chained_operations
+                                        and caddy_api.mutation_etags is not False):
+                for operation in operations:
+                    response = await self._write_operation(operation, etag)
+                    applied += 1
+                    if etag and applied < len(operations):
+                        etag = response.headers.get('Etag')
+                        caddy_api.mutation_etags = etag is not None
+                        if etag is None:
+                            break
+            if applied < len(operations):
+                done = relative_operations(operations[:applied], root)
+                if applied:
+                    # Chaining stopped without an Etag: read the new one and check nobody else wrote since
+                    caddy_api.invalidate_config_cache()
+                    current, etag = await self.current_config()
+                    expected = await asyncio.to_thread(apply_to_tree, copy.deepcopy(before), done)
+                    if get_node(current, root) != expected:
+                        raise ConfigConflictError('The Caddy configuration changed while the plan was applied.')
+                # Copying and patching a subtree as large as the whole config would stall the event loop
+                after = await asyncio.to_thread(
+                    apply_to_tree, copy.deepcopy(before), done + relative_operations(operations[applied:], root))
+                await self._write_operation({'op': 'PATCH' if root else 'POST', 'path': '/'.join(root), 'value': after},
+                                            etag)
+                applied = len(operations)
+        except Exception as e:
+            # Nothing was applied if the first request was answered with an error
+            if before is not None and (applied or not isinstance(e, requests.HTTPError)):
+                await self._restore(root, before)
+            raise
+        finally:
+            await self._mutated(*paths)
+
+    async def _write_operation(self, operation, etag=None):
+        """
+        Send one planned operation, guarded by an Etag.
+
+        Returns:
+            httpx.Response: The response from the API.
+
+        Raises:
+            ConfigConflictError: If the configuration no longer matches the Etag.
+        """
+        headers = {'If-Match': etag} if etag else None
+        value = operation.get('value')
+        body = None if value is None else await self._encode(value, offload=not operation['path'])
+        try:
+            return await self._request(operation['op'], f"/config/{operation['path']}", body, headers)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 412:
+                raise ConfigConflictError('The Caddy configuration changed since it was read.', response=e.response)
+            raise
+
+    async def _restore(self, root, before):
+        """
+        Write the subtree at a path back to its state before a failed plan, if it changed.
+        """
+        path = '/'.join(root)
+        try:
+            self.caddy_api.invalidate_config_cache()
+            current, _ = await self.current_config()
+            if get_node(current, root) != before:
+                self.logger.warning(f'Rolling back a partly applied plan at /{path}')
+                await self._write_operation({'op': 'PATCH' if root else 'POST', 'path': path, 'value': before})
+        except requests.RequestException as e:
+            self.logger.error(f'Error rolling back a partly applied plan at /{path}: {e}')
+
+    async def apply_config(self, config, dry_run=False):
+        """
+        Change the Caddy configuration to the given one with the smallest set of narrow operations,
+        instead of reloading the whole configuration. The diff is computed in a worker thread.
+
+        Args:
+            config (dict): The desired Caddy configuration.
+            dry_run (bool, optional): Only plan the operations without applying them. Defaults to False.
+
+        Returns:
+            list: The planned operations.
+
+        Raises:
+            ConfigConflictError: If the configuration changed while the operations were applied.
+        """
+        current, etag = await self.current_config()
+        operations = await asyncio.to_thread(diff_config, current, config)
+        self.logger.debug(f'Planned {len(operations)} operations to apply config')
+        if not dry_run:
+            await self.apply_operations(operations, etag, current)
+        return operations
+
+    async def add_to_config_array(self, path, items):
+        """
+        Add one or more items to an array in the Caddy configuration.
+
+        Args:
+            path (str): The configuration path to the array.
+            items (list): The items to add to the array.
+
+        Returns:
+            int: The HTTP status code of the response.
+        """
+        if not isinstance(items, list):
+            raise ValueError("Items must be a list.")
+        body = await self._encode(items)
+        await self._mutating(path)
+        response = await self._request('POST', f'/config/{path}/...', body)
+        await self._mutated(path)
+        return response.status_code
+
+    async def insert_into_config_array(self, path, index, item):
+        """
+        Insert an item into an array in the Caddy configuration at a specific index.
+
+        Args:
+            path (str): The configuration path to the array.
+            index (int): The index at which to insert the item.
+            item (any): The item to insert.
+
+        Returns:
+            dict: The response from the Caddy server.
+        """
+        body = await self._encode(item)
+        await self._mutating(path)
+        response = await self._request('PUT', f'/config/{path}/{index}', body)
+        await self._mutated(path)
+        return await self._decode(response.content)
+
+    async def replace_config_value(self, path, value):
+        """
+        Replace a value in the Caddy configuration.
+
+        Args:
+            path (str): The configuration path to replace the value.
+            value (any): The new value to set.
+
+        Returns:
+            dict: The response from the Caddy server.
+        """
+        body = await self._encode(value)
+        await self._mutating(path)
+        response = await self._request('PATCH', f'/config/{path}', body)
+        await self._mutated(path)
+        return await self._decode(response.content)
+
+    async def delete_config(self, path=None):
+        """
+        Delete the Caddy configuration at the specified path or the entire configuration if no path is provided.
+
+        Args:
+            path (str, optional): The configuration path to delete. Defaults to None.
+
+        Returns:
+            dict: The response from the Caddy server.
+        """
+        await self._mutating(path or '')
+        response = await self._request('DELETE', f'/config/{path}' if path else '/config')
+        await self._mutated(path or '')
+        return await self._decode(response.content)
+
+    async def _config_body(self, config, content_type):
+        """
+        Encode a whole configuration: as JSON, or as the text of another format such as a Caddyfile.
+        """
+        if content_type == 'application/json' or not isinstance(config, (str, bytes)):
+            return await self._encode(config, offload=True)
+        return config.encode('utf-8') if isinstance(config, str) else config
+
+    async def adapt_config(self, config, content_type='application/json', raw=False):
+        """
+        Adapt a configuration to Caddy JSON without loading or running it.
+        Results are cached by content in the adapt cache of the blocking client, and concurrent
+        identical requests share one call to Caddy.
+
+        Args:
+            config (dict or str): The configuration, as a dictionary or as text (e.g., a Caddyfile).
+            content_type (str): The Content-Type header specifying the configuration format. Defaults to 'application/json'.
+            raw (bool, optional): Return the encoded response instead of the parsed value. Defaults to False.
+
+        Returns:
+            dict: The adapted Caddy configuration under `result`, with Caddy's `warnings` if there are any.
+            RawResponse: The encoded response, if `raw` is set.
+        """
+        async def adapt():
+            body = await self._config_body(config, content_type)
+            response = await self._request('POST', '/adapt', body, {'Content-Type': content_type})
+            return response.content
+
+        adapt_cache = self.caddy_api.adapt_cache
+        if adapt_cache is None:
+            body = await adapt()
+        else:
+            key = cache_key(config, content_type)
+            body = adapt_cache.get(key)
+            if body is None:
+                body = await self.singleflight.do(('adapt', key), adapt)
+                adapt_cache.put(key, body)
+        if raw:
+            return RawResponse(body)
+        return await self._decode(body)
+
+    async def _get(self, endpoint, raw):
+        response = await self._request('GET', endpoint)
+        if raw:
+            return RawResponse(response.content, response.headers.get('Content-Type', 'application/json'),
+                               etag=response.headers.get('Etag'))
+        return await self._decode(response.content)
+
+    async def get_pki_ca(self, id, raw=False):
+        """
+        Get the current PKI CA configuration.
+        Args:
+            id (str): The ID of the CA.
+            raw (bool, optional): Return the undecoded response body instead. Defaults to False.
+        Returns:
+            dict: The current PKI CA configuration.
+            RawResponse: The response body, if `raw` is set.
+        """
+        return await self._get(f'/pki/ca/{id}', raw)
+
+    async def get_pki_ca_certificates(self, id, raw=False):
+        """
+        Get the current PKI CA certificates.
+        Args:
+            id (str): The ID of the CA.
+            raw (bool, optional): Return the undecoded response body instead. Defaults to False.
+        Returns:
+            dict: The current PKI CA certificates.
+            RawResponse: The response body, if `raw` is set.
+        """
+        return await self._get(f'/pki/ca/{id}/certificates', raw)
+
+    async def get_proxy_upstreams(self, raw=False):
+        """
+        Get the current proxy upstreams.
+        Args:
+            raw (bool, optional): Return the undecoded response body instead. Defaults to False.
+        Returns:
+            dict: The current proxy upstreams.
+            RawResponse: The response body, if `raw` is set.
+        """
+        return await self._get('/reverse_proxy/upstreams', raw)
+
+    async def load_config(self, config, content_type='application/json'):
+        """
+        Set Caddy's configuration, overriding any previous configuration.
+
+        Args:
+            config (dict or str): The new Caddy configuration. Can be a dictionary or a string (e.g., Caddyfile).
+            content_type (str): The Content-Type header specifying the configuration format. Defaults to 'application/json'.
+
+        Returns:
+            dict: The response from the Caddy server.
+        """
+        body = await self._config_body(config, content_type)
+        await self._mutating('')
+        response = await self._request('POST', '/load', body, {'Content-Type': content_type})
+        await self._mutated('')
+        return await self._decode(response.content)
+
+    async def stop_server(self):
+        """
+        Gracefully shuts down the Caddy server and exits the process.
+
+        Returns:
+            dict: The response from the Caddy server.
+        """
+        await self._mutating('')
+        response = await self._request('POST', '/stop')
+        await self._mutated('')
+        return await self._decode(response.content)
@@ -0,0 +1,11 @@
+"""
+    Benchmarks for Birdie.
+    The suite runs Birdie against a local stand-in for the Caddy admin API, loaded with synthetic
+    configurations of 100 to 100k routes, and drives every BirdieServer endpoint at a set
+    concurrency. Results are written as JSON so runs can be compared with `benchmarks.compare`.
+
+    Usage, from the repository root:
+        python -m benchmarks.run --routes 100,10000 --concurrency 8 --output before.json
+        python -m benchmarks.run --routes 100,10000 --concurrency 8 --output after.json
+        python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,68 @@
+"""
+    Micro-benchmark of the JSON backends of `json_codec` on synthetic configurations.
+    Times encoding and decoding a full configuration with the standard library and, if it is
+    installed, orjson, and recalling a remembered encoding, as a cached config is sent again.
+
+    Usage, from the repository root:
+        python -m benchmarks.codec --routes 1000,10000,100000 --repeat 5
+"""
+import argparse
+import json
+import sys
+import time
+import json_codec
+from benchmarks.configs import generate_config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def best_of(function, repeat):
+    """
+    Get the fastest of several runs of a function, in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the JSON backends on synthetic Caddy configurations.')
+    parser.add_argument('--routes', default='1000,10000', help='Comma separated configuration sizes.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of runs; the fastest one is reported.')
+    args = parser.parse_args(argv)
+
+    backends = {'stdlib': (lambda value: json.dumps(value, separators=(',', ':')).encode('utf-8'), json.loads)}
+    if orjson is not None:
+        backends['orjson'] = (lambda value: orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS), orjson.loads)
+    results = []
+    for routes in [int(size) for size in args.routes.split(',')]:
+        config = generate_config(routes)
+        encoded = json.dumps(config).encode('utf-8')
+        for name, (dumps, loads) in backends.items():
+            results.append({
+                'routes': routes,
+                'backend': name,
+                'bytes': len(encoded),
+                'encode_ms': round(best_of(lambda: dumps(config), args.repeat), 3),
+                'decode_ms': round(best_of(lambda: loads(encoded), args.repeat), 3),
+            })
+        key = ('benchmark', routes)
+        json_codec.remember(key, config, encoded)
+        results.append({'routes': routes, 'backend': 'remembered', 'bytes': len(encoded),
+                        'encode_ms': round(best_of(lambda: json_codec.recall(key), args.repeat), 3), 'decode_ms': None})
+        json_codec.forget(key)
+    for result in results:
+        print(f"{result['routes']:>7} routes  {result['backend']:<10} encode {result['encode_ms']:>9.3f} ms  "
+              f"decode {result['decode_ms'] if result['decode_ms'] is not None else '-':>9} ms", file=sys.stderr)
+    json.dump({'default_backend': json_codec.BACKEND, 'results': results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
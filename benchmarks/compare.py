@@ -0,0 +1,88 @@
+"""
+    Compares two benchmark result files written by `benchmarks.run`.
+    Prints the change in throughput, p50 and p99 latency and peak RSS of every scenario present in
+    both, and exits with status 1 if any of them regressed by more than the threshold.
+
+    Usage, from the repository root:
+        python -m benchmarks.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metric, how to read it from a result, and whether higher values are better
+METRICS = (
+    ('throughput_rps', lambda result: result['throughput_rps'], True),
+    ('p50_ms', lambda result: result['latency_ms']['p50'], False),
+    ('p99_ms', lambda result: result['latency_ms']['p99'], False),
+    ('peak_rss_mb', lambda result: result['peak_rss_bytes'] / 2 ** 20 if result['peak_rss_bytes'] else None, False),
+)
+
+
+def load_results(path):
+    """
+    Load a result file keyed by scenario, configuration size and concurrency.
+    """
+    with open(path) as results:
+        report = json.load(results)
+    return {(result['scenario'], result['routes'], result['concurrency']): result for result in report['results']}
+
+
+def change(before, after):
+    """
+    Get the relative change between two values in percent, or None if it is undefined.
+    """
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare two sets of results.
+
+    Args:
+        baseline (dict): The results to compare against, see `load_results`.
+        current (dict): The new results.
+        threshold (float): The change in percent beyond which a metric counts as regressed.
+
+    Returns:
+        tuple: The table rows and the list of regressions.
+    """
+    rows, regressions = [], []
+    for key in sorted(set(baseline) & set(current), key=lambda key: (key[1], key[2], key[0])):
+        row = [key[0], str(key[1]), str(key[2])]
+        for name, read, higher_is_better in METRICS:
+            before, after = read(baseline[key]), read(current[key])
+            delta = change(before, after)
+            row.append(f'{after:.2f} ({delta:+.1f}%)' if delta is not None else (f'{after:.2f}' if after is not None else '-'))
+            if delta is not None and (-delta if higher_is_better else delta) > threshold:
+                regressions.append(f'{key[0]} @ {key[1]} routes, concurrency {key[2]}: {name} {delta:+.1f}%')
+        rows.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline', help='The result file to compare against.')
+    parser.add_argument('current', help='The new result file.')
+    parser.add_argument('--threshold', type=float, default=10.0, help='The change in percent that counts as a regression.')
+    args = parser.parse_args(argv)
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    rows, regressions = compare(baseline, current, args.threshold)
+    header = ['scenario', 'routes', 'conc'] + [name for name, _, _ in METRICS]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print('  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    for key in sorted(set(baseline) ^ set(current)):
+        print(f'only in {"baseline" if key in baseline else "current"}: {key[0]} @ {key[1]} routes, concurrency {key[2]}')
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold}%:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+    Synthetic Caddy configurations for the benchmarks.
+    The generated configurations are deterministic for a given size, so results of different
+    runs are comparable, and mix the shapes Birdie sees in practice: exact and wildcard hosts,
+    path matchers, subroutes and reverse proxies with several upstreams.
+"""
+import argparse
+import json
+import sys
+
+SIZES = (100, 1000, 10000, 100000)
+
+
+def route_host(index):
+    """
+    Get the hostname of a generated route.
+
+    Args:
+        index (int): The position of the route.
+
+    Returns:
+        str: The hostname, e.g. `site42.bench.test`.
+    """
+    return f'site{index}.bench.test'
+
+
+def route_dial(index, upstream=0):
+    """
+    Get the dial address of an upstream of a generated route.
+
+    Args:
+        index (int): The position of the route.
+        upstream (int, optional): The position of the upstream. Defaults to 0.
+
+    Returns:
+        str: The dial address, e.g. `10.0.0.42:8080`.
+    """
+    return f'10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}:{8080 + upstream}'
+
+
+def generate_route(index, upstreams=2):
+    """
+    Generate one route. Every tenth route matches a wildcard host and proxies through a subroute,
+    every fifth one also matches a path.
+
+    Args:
+        index (int): The position of the route, which makes its hosts, `@id` and upstreams unique.
+        upstreams (int, optional): The number of upstreams of the reverse proxy. Defaults to 2.
+
+    Returns:
+        dict: The route.
+    """
+    proxy = {
+        'handler': 'reverse_proxy',
+        'upstreams': [{'dial': route_dial(index, upstream)} for upstream in range(upstreams)],
+    }
+    matcher = {'host': [route_host(index)]}
+    if index % 5 == 0:
+        matcher['path'] = [f'/api/v{index % 3 + 1}/*']
+    route = {'@id': f'route-{index}', 'match': [matcher], 'terminal': True}
+    if index % 10 == 0:
+        matcher['host'].append(f'*.tenant{index}.bench.test')
+        route['handle'] = [{
+            'handler': 'subroute',
+            'routes': [
+                {'handle': [{'handler': 'headers', 'response': {'set': {'X-Route': [str(index)]}}}]},
+                {'handle': [proxy]},
+            ],
+        }]
+    else:
+        route['handle'] = [proxy]
+    return route
+
+
+def generate_config(routes=100, servers=1, upstreams=2):
+    """
+    Generate a full Caddy configuration.
+
+    Args:
+        routes (int, optional): The total number of routes. Defaults to 100.
+        servers (int, optional): The number of HTTP servers the routes are spread over. Defaults to 1.
+        upstreams (int, optional): The number of upstreams per reverse proxy. Defaults to 2.
+
+    Returns:
+        dict: The configuration, with the routes under `apps/http/servers/srv<n>/routes`
+            and a `local` certificate authority.
+    """
+    http_servers = {}
+    for server in range(servers):
+        http_servers[f'srv{server}'] = {
+            'listen': [f':{443 + server}'],
+            'routes': [generate_route(index, upstreams) for index in range(server, routes, servers)],
+        }
+    return {
+        'admin': {'listen': 'localhost:2019'},
+        'apps': {
+            'http': {'servers': http_servers},
+            'pki': {'certificate_authorities': {'local': {'name': 'Birdie Benchmark CA'}}},
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic Caddy configuration to stdout.')
+    parser.add_argument('--routes', type=int, default=100, help='The number of routes.')
+    parser.add_argument('--servers', type=int, default=1, help='The number of HTTP servers.')
+    parser.add_argument('--upstreams', type=int, default=2, help='The number of upstreams per route.')
+    args = parser.parse_args(argv)
+    json.dump(generate_config(args.routes, args.servers, args.upstreams), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
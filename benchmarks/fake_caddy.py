@@ -0,0 +1,444 @@
+"""
+    A stand-in for the Caddy admin API.
+    `FakeCaddy` serves `/config` (with Etag, If-Match and optionally If-None-Match), `/load`, `/adapt`,
+    `/stop`, `/reverse_proxy/upstreams` and `/pki/ca/<id>` from an in-memory configuration, with a
+    configurable latency, so Birdie can be benchmarked without a Caddy binary. It follows the admin
+    API semantics Birdie relies on: POST appends to arrays (`/...` appends many), PUT creates keys or
+    inserts into arrays, PATCH replaces and DELETE removes.
+
+    Usage, from the repository root:
+        python -m benchmarks.fake_caddy --port 2019 --routes 10000 --latency 0.002
+"""
+import argparse
+import copy
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.configs import generate_config
+
+# A self-signed ECDSA certificate, so certificate parsing is benchmarked on real DER
+CA_CERTIFICATE = '''-----BEGIN CERTIFICATE-----
+MIIBnDCCAUOgAwIBAgIUVGLtdb5ttH2CIxYHQaIC6KWmEFUwCgYIKoZIzj0EAwIw
+IzEhMB8GA1UEAwwYQmlyZGllIEJlbmNobWFyayBSb290IENBMCAXDTI2MTAxODA1
+NTIyNFoYDzIxMjYwOTI0MDU1MjI0WjAjMSEwHwYDVQQDDBhCaXJkaWUgQmVuY2ht
+YXJrIFJvb3QgQ0EwWTATBgcqhkjOPQIBBggqhkjOPQMBBwNCAASJov+9I1O6PYFv
+zrAOYAsauyYjaIZp7G3qaLA5EzOHfpoNhJUkGyl2CjqsoxW+NaHvUggh65nrBE5c
+5/Zmz7Pjo1MwUTAdBgNVHQ4EFgQUvI19xY33h21gC1Ov5NeNiOnPXmUwHwYDVR0j
+BBgwFoAUvI19xY33h21gC1Ov5NeNiOnPXmUwDwYDVR0TAQH/BAUwAwEB/zAKBggq
+hkjOPQQDAgNHADBEAiBbf1BHk+8jpHzFSYWxTsA/yKEwPwQKvKnDpcThhtXiewIg
+Qt/2yXF5SrFDLD4gUONkB3LZ60ToelluR4xLQp9ikc0=
+-----END CERTIFICATE-----
+'''
+
+
+class AdminAPIError(Exception):
+    """
+    An error answered with an HTTP status and a JSON error body, like Caddy does.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def adapt_caddyfile(text):
+    """
+    Adapt a simple Caddyfile to JSON: every `host { reverse_proxy upstream... }` block becomes a route.
+
+    Args:
+        text (str): The Caddyfile.
+
+    Returns:
+        tuple: The adapted configuration and the list of warnings.
+    """
+    routes, warnings, hosts, upstreams = [], [], None, []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if words[-1] == '{' and hosts is None:
+            hosts, upstreams = [word.rstrip(',') for word in words[:-1]], []
+        elif words[0] == '}' and hosts is not None:
+            handle = [{'handler': 'reverse_proxy', 'upstreams': [{'dial': dial} for dial in upstreams]}] if upstreams else []
+            routes.append({'match': [{'host': hosts}], 'handle': handle, 'terminal': True})
+            hosts = None
+        elif words[0] == 'reverse_proxy' and hosts is not None:
+            upstreams.extend(words[1:])
+        else:
+            warnings.append({'file': 'Caddyfile', 'line': number, 'message': f'unrecognized directive: {words[0]}'})
+    config = {'apps': {'http': {'servers': {'srv0': {'listen': [':443'], 'routes': routes}}}}}
+    return config, warnings
+
+
+class FakeCaddy:
+    """
+    An in-memory Caddy admin API served over HTTP in a background thread.
+
+    Attributes:
+        config (dict): The current configuration.
+        latency (float): Seconds added to every request.
+        jitter (float): The maximum random fraction of `latency` added on top of it.
+        etags (bool): Send Etag headers and honour If-Match, like Caddy 2.7 and newer.
+        not_modified (bool): Answer a matching If-None-Match with 304 Not Modified, which Caddy does not.
+        mutation_etags (bool): Return the Etag of the new configuration after a change.
+        requests (dict): The number of requests served per method.
+    """
+
+    def __init__(self, config=None, latency=0.0, jitter=0.0, etags=True, not_modified=False, mutation_etags=False,
+                 host='127.0.0.1', port=0):
+        """
+        Initializes the fake server without starting it.
+
+        Args:
+            config (dict, optional): The initial configuration. Defaults to an empty one.
+            latency (float, optional): Seconds added to every request. Defaults to 0.
+            jitter (float, optional): The maximum random fraction of `latency` added on top of it. Defaults to 0.
+            etags (bool, optional): Send Etag headers and honour If-Match. Defaults to True.
+            not_modified (bool, optional): Answer a matching If-None-Match with 304. Defaults to False, like Caddy.
+            mutation_etags (bool, optional): Return the new Etag after a change. Defaults to False.
+            host (str, optional): The address to listen on. Defaults to 127.0.0.1.
+            port (int, optional): The port to listen on. Defaults to a free port.
+        """
+        self.config = config if config is not None else {}
+        self.latency = latency
+        self.jitter = jitter
+        self.etags = etags
+        self.not_modified = not_modified
+        self.mutation_etags = mutation_etags
+        self.requests = {}
+        self._lock = threading.RLock()
+        self._encoded = {}
+        self._dials = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        str: The base URL of the admin API.
+        """
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Serve requests in a daemon thread.
+
+        Returns:
+            FakeCaddy: The server, for chaining.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-caddy', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def load(self, config):
+        """
+        Replace the configuration, e.g. to reset it between benchmark scenarios.
+
+        Args:
+            config (dict): The new configuration.
+        """
+        with self._lock:
+            self.config = config
+            self._changed()
+
+    def _changed(self):
+        self._encoded.clear()
+        self._dials = None
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency * (1 + random.random() * self.jitter))
+
+    @staticmethod
+    def _split(path):
+        return [part for part in path.split('/') if part]
+
+    def _walk(self, parts):
+        node = self.config
+        for part in parts:
+            try:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            except (KeyError, IndexError, ValueError, TypeError):
+                raise AdminAPIError(400, f'invalid traversal path at: /config/{"/".join(parts)}')
+        return node
+
+    def read(self, path):
+        """
+        Encode the configuration at a path and compute its Etag, memoized until the next change.
+
+        Args:
+            path (str): The request path, e.g. `/config/apps/http/`.
+
+        Returns:
+            tuple: The JSON body and the Etag.
+        """
+        with self._lock:
+            cached = self._encoded.get(path)
+            if cached is None:
+                body = json.dumps(self._walk(self._split(path)[1:])).encode('utf-8') + b'\n'
+                cached = self._encoded[path] = (body, f'"{path} {hashlib.sha1(body).hexdigest()}"')
+            return cached
+
+    def check_if_match(self, if_match):
+        """
+        Check an If-Match precondition the way Caddy does: the Etag embeds the path it was read from.
+
+        Raises:
+            AdminAPIError: 412 if the configuration at that path has changed.
+        """
+        try:
+            path, _ = if_match.strip('"').rsplit(' ', 1)
+        except ValueError:
+            raise AdminAPIError(400, f'malformed If-Match header: {if_match}')
+        if self.read(path)[1] != if_match:
+            raise AdminAPIError(412, 'If-Match header did not match current config hash')
+
+    def mutate(self, method, path, value):
+        """
+        Change the configuration at a path.
+
+        Args:
+            method (str): POST, PUT, PATCH or DELETE.
+            path (str): The request path, e.g. `/config/apps/http/servers/srv0/routes/...`.
+            value (any): The decoded request body.
+        """
+        parts = self._split(path)[1:]
+        with self._lock:
+            if not parts:
+                if method == 'DELETE':
+                    self.config = {}
+                elif method in ('POST', 'PATCH'):
+                    self.config = value
+                else:
+                    raise AdminAPIError(409, 'config already exists')
+                self._changed()
+                return
+            ellipsis = parts[-1] == '...'
+            if ellipsis:
+                parts = parts[:-1]
+                if method != 'POST' or not isinstance(value, list):
+                    raise AdminAPIError(400, 'the ellipsis is only allowed when POSTing an array')
+            parent = self._walk(parts[:-1])
+            key = parts[-1]
+            if isinstance(parent, list):
+                try:
+                    key = int(key)
+                except ValueError:
+                    raise AdminAPIError(400, f'invalid array index: {key}')
+            exists = (0 <= key < len(parent)) if isinstance(parent, list) else key in parent
+            if method == 'POST':
+                target = parent[key] if exists else None
+                if ellipsis:
+                    if not isinstance(target, list):
+                        raise AdminAPIError(400, 'cannot append to a non-array')
+                    target.extend(value)
+                elif isinstance(target, list):
+                    target.append(value)
+                elif isinstance(parent, list) and not exists:
+                    raise AdminAPIError(400, f'array index out of bounds: {key}')
+                else:
+                    parent[key] = value
+            elif method == 'PUT':
+                if isinstance(parent, list):
+                    if not 0 <= key <= len(parent):
+                        raise AdminAPIError(400, f'array index out of bounds: {key}')
+                    parent.insert(key, value)
+                elif exists:
+                    raise AdminAPIError(409, f'key already exists: {key}')
+                else:
+                    parent[key] = value
+            elif method == 'PATCH':
+                if not exists:
+                    raise AdminAPIError(404, f'key does not exist: {key}')
+                parent[key] = value
+            elif method == 'DELETE':
+                if not exists:
+                    raise AdminAPIError(404, f'key does not exist: {key}')
+                del parent[key]
+            self._changed()
+
+    def upstreams(self):
+        """
+        Report every upstream dial of the configuration with varying counters.
+
+        Returns:
+            list: The upstreams in the format of `/reverse_proxy/upstreams`.
+        """
+        with self._lock:
+            if self._dials is None:
+                dials, stack = set(), [self.config]
+                while stack:
+                    node = stack.pop()
+                    if isinstance(node, dict):
+                        if isinstance(node.get('dial'), str):
+                            dials.add(node['dial'])
+                        stack.extend(node.values())
+                    elif isinstance(node, list):
+                        stack.extend(node)
+                self._dials = sorted(dials)
+            dials = self._dials
+        tick = int(time.time())
+        return [{'address': dial, 'num_requests': (tick + index) % 17, 'fails': (tick + index) % 31 == 0}
+                for index, dial in enumerate(dials)]
+
+    def certificate_authority(self, ca_id):
+        """
+        Describe a certificate authority of the `pki` app.
+
+        Raises:
+            AdminAPIError: 404 if the CA is not configured.
+        """
+        with self._lock:
+            authorities = ((self.config.get('apps') or {}).get('pki') or {}).get('certificate_authorities') or {}
+            if ca_id not in authorities:
+                raise AdminAPIError(404, f'no certificate authority configured with id: {ca_id}')
+            name = (authorities[ca_id] or {}).get('name', ca_id)
+        return {
+            'id': ca_id,
+            'name': name,
+            'root_common_name': 'Birdie Benchmark Root CA',
+            'intermediate_common_name': 'Birdie Benchmark Root CA',
+            'root_certificate': CA_CERTIFICATE,
+            'intermediate_certificate': CA_CERTIFICATE,
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, body=b'', content_type='application/json', headers=None):
+                self.send_response(status)
+                if body:
+                    self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def handle_method(self, method):
+                with fake._lock:
+                    fake.requests[method] = fake.requests.get(method, 0) + 1
+                fake._sleep()
+                path = self.path.split('?', 1)[0]
+                try:
+                    self.route(method, path)
+                except AdminAPIError as e:
+                    self.reply(e.status, json.dumps({'error': str(e)}).encode('utf-8'))
+                except (ValueError, json.JSONDecodeError) as e:
+                    self.reply(400, json.dumps({'error': str(e)}).encode('utf-8'))
+
+            def route(self, method, path):
+                if path == '/config' or path.startswith('/config/'):
+                    if not path.endswith('/'):
+                        path += '/'
+                    if method == 'GET':
+                        body, etag = fake.read(path)
+                        headers = {'Etag': etag} if fake.etags else {}
+                        if fake.not_modified and fake.etags and self.headers.get('If-None-Match') == etag:
+                            return self.reply(304, headers=headers)
+                        return self.reply(200, body, headers=headers)
+                    body = self.read_body()
+                    with fake._lock:
+                        if fake.etags and self.headers.get('If-Match'):
+                            fake.check_if_match(self.headers['If-Match'])
+                        fake.mutate(method, path.rstrip('/'), json.loads(body) if body else None)
+                        headers = {'Etag': fake.read('/config/')[1]} if fake.etags and fake.mutation_etags else {}
+                    return self.reply(200, headers=headers)
+                if path == '/load' and method == 'POST':
+                    body = self.read_body()
+                    if 'json' in (self.headers.get('Content-Type') or 'application/json'):
+                        config = json.loads(body)
+                    else:
+                        config, _ = adapt_caddyfile(body.decode('utf-8'))
+                    fake.load(config)
+                    return self.reply(200)
+                if path == '/adapt' and method == 'POST':
+                    config, warnings = adapt_caddyfile(self.read_body().decode('utf-8'))
+                    result = {'result': config}
+                    if warnings:
+                        result['warnings'] = warnings
+                    return self.reply(200, json.dumps(result).encode('utf-8'))
+                if path == '/stop' and method == 'POST':
+                    # Stopping would end the benchmark, so only acknowledge it
+                    return self.reply(200)
+                if path == '/reverse_proxy/upstreams' and method == 'GET':
+                    return self.reply(200, json.dumps(fake.upstreams()).encode('utf-8'))
+                if path.startswith('/pki/ca/') and method == 'GET':
+                    ca_id, _, rest = path[len('/pki/ca/'):].partition('/')
+                    authority = fake.certificate_authority(ca_id)
+                    if rest == 'certificates':
+                        chain = authority['intermediate_certificate'] + authority['root_certificate']
+                        return self.reply(200, chain.encode('ascii'), 'application/pem-certificate-chain')
+                    if not rest:
+                        return self.reply(200, json.dumps(authority).encode('utf-8'))
+                raise AdminAPIError(404, f'resource not found: {path}')
+
+            def do_GET(self):
+                self.handle_method('GET')
+
+            def do_POST(self):
+                self.handle_method('POST')
+
+            def do_PUT(self):
+                self.handle_method('PUT')
+
+            def do_PATCH(self):
+                self.handle_method('PATCH')
+
+            def do_DELETE(self):
+                self.handle_method('DELETE')
+
+        return Handler
+
+    def snapshot(self):
+        """
+        Get a deep copy of the current configuration.
+        """
+        with self._lock:
+            return copy.deepcopy(self.config)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake Caddy admin API with a synthetic configuration.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2019)
+    parser.add_argument('--routes', type=int, default=100, help='The number of generated routes.')
+    parser.add_argument('--servers', type=int, default=1, help='The number of HTTP servers the routes are spread over.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='The maximum random fraction of the latency added on top of it.')
+    parser.add_argument('--no-etags', action='store_true', help='Do not send Etags or honour If-Match.')
+    parser.add_argument('--not-modified', action='store_true', help='Answer If-None-Match with 304, which Caddy does not.')
+    args = parser.parse_args(argv)
+    fake = FakeCaddy(generate_config(args.routes, args.servers), args.latency, args.jitter,
+                     etags=not args.no_etags, not_modified=args.not_modified, host=args.host, port=args.port)
+    print(f'Fake Caddy admin API with {args.routes} routes listening on {fake.url}', flush=True)
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
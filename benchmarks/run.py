@@ -0,0 +1,307 @@
+"""
+    Benchmark runner.
+    For every configuration size the runner starts a fake Caddy admin API loaded with a synthetic
+    configuration and a BirdieServer in a child process, then drives the selected scenarios at a
+    set concurrency. For each scenario it reports throughput, latency percentiles, the response
+    statuses and the peak RSS of the Birdie process, as JSON.
+
+    Usage, from the repository root:
+        python -m benchmarks.run --routes 100,10000 --concurrency 8 --requests 500 --output results.json
+        python -m benchmarks.run --scenarios 'routes_*,config_get' --latency 0.002
+        python -m benchmarks.run --list
+        python -m benchmarks.run --scenarios 'load,config_get*' --routes 10000 --json-backend stdlib
+        python -m benchmarks.run --scenarios 'config_*,upstreams_stream' --concurrency 64 --asgi
+"""
+import argparse
+import copy
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import requests
+from benchmarks.configs import generate_config
+from benchmarks.fake_caddy import FakeCaddy
+from benchmarks.scenarios import SCENARIOS, encode
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_context(routes, config):
+    """
+    Build the context shared by the scenarios of one configuration size.
+
+    Args:
+        routes (int): The number of routes in the configuration.
+        config (dict): The generated configuration.
+
+    Returns:
+        dict: The route count and the request bodies scenarios reuse, encoded once.
+    """
+    variants = []
+    for listen in (':8443', ':443'):
+        variant = copy.deepcopy(config)
+        variant['apps']['http']['servers']['srv0']['listen'] = [listen]
+        variants.append(encode({'config': variant}))
+    return {'routes': routes, 'encoded_variants': variants, 'encoded_load': encode({'config': config})}
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of sorted values by the nearest-rank method.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def read_status(pid, field):
+    """
+    Read a memory field of a process in bytes from /proc, e.g. `VmHWM` for the peak RSS.
+
+    Returns:
+        int: The value in bytes, or None where /proc is not available.
+    """
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss(pid):
+    """
+    Reset the peak RSS of a process so it can be measured per scenario. Linux only.
+
+    Returns:
+        bool: Whether the peak was reset.
+    """
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class BirdieProcess:
+    """
+    A BirdieServer running in a child process, see `benchmarks.serve`.
+    """
+
+    def __init__(self, caddy_url, sampler_interval=1, verbose=False, json_backend=None, asgi=False):
+        env = dict(os.environ)
+        if json_backend:
+            env['BIRDIE_JSON_BACKEND'] = json_backend
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.serve', '--caddy', caddy_url, '--sampler-interval', str(sampler_interval)]
+            + (['--asgi'] if asgi else []),
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=None if verbose else subprocess.DEVNULL,
+            text=True,
+        )
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError('Birdie exited before it was ready')
+        ready = json.loads(line)
+        self.url = ready['url']
+        self.pid = ready['pid']
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_scenario(scenario, base_url, context, concurrency, total, warmup=0):
+    """
+    Run the iterations of a scenario on a pool of worker threads, each with its own session.
+
+    Args:
+        scenario (Scenario): The scenario to run.
+        base_url (str): The base URL of the Birdie server.
+        context (dict): The context of the configuration size.
+        concurrency (int): The number of concurrent workers.
+        total (int): The number of measured iterations.
+        warmup (int, optional): The number of unmeasured iterations run first. Defaults to 0.
+
+    Returns:
+        dict: The wall time, the latency of every iteration and the count of every status.
+    """
+    session = requests.Session()
+    for iteration in range(warmup):
+        try:
+            scenario.run(session, base_url, context, total + iteration)
+        except requests.RequestException:
+            pass
+    session.close()
+
+    lock = threading.Lock()
+    position = iter(range(total))
+    latencies, statuses = [], {}
+
+    def worker():
+        local_latencies, local_statuses = [], {}
+        with requests.Session() as worker_session:
+            while True:
+                with lock:
+                    iteration = next(position, None)
+                if iteration is None:
+                    break
+                start = time.perf_counter()
+                try:
+                    status = str(scenario.run(worker_session, base_url, context, iteration))
+                except requests.RequestException as e:
+                    status = type(e).__name__
+                local_latencies.append(time.perf_counter() - start)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'duration': time.perf_counter() - start, 'latencies': latencies, 'statuses': statuses}
+
+
+def summarize(scenario, routes, concurrency, run, peak_rss):
+    """
+    Reduce the raw measurements of a scenario run to a result record.
+    """
+    latencies = sorted(run['latencies'])
+    count = len(latencies)
+    errors = sum(n for status, n in run['statuses'].items() if not status.isdigit() or int(status) >= 400)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'scenario': scenario.name,
+        'routes': routes,
+        'concurrency': concurrency,
+        'requests': count,
+        'errors': errors,
+        'statuses': run['statuses'],
+        'duration_s': round(run['duration'], 4),
+        'throughput_rps': round(count / run['duration'], 2) if run['duration'] else None,
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / count) if count else None,
+            'p50': to_ms(percentile(latencies, 0.50)),
+            'p90': to_ms(percentile(latencies, 0.90)),
+            'p99': to_ms(percentile(latencies, 0.99)),
+            'max': to_ms(latencies[-1]) if latencies else None,
+        },
+        'peak_rss_bytes': peak_rss,
+    }
+
+
+def select_scenarios(patterns):
+    """
+    Select scenarios by comma separated names or glob patterns, e.g. `routes_*,config_get`.
+    """
+    if not patterns:
+        return list(SCENARIOS)
+    wanted = [pattern.strip() for pattern in patterns.split(',') if pattern.strip()]
+    selected = [scenario for scenario in SCENARIOS if any(fnmatch.fnmatchcase(scenario.name, pattern) for pattern in wanted)]
+    if not selected:
+        raise SystemExit(f'No scenario matches {patterns!r}, see --list')
+    return selected
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Birdie against a fake Caddy admin API.')
+    parser.add_argument('--routes', default='100,1000', help='Comma separated configuration sizes, e.g. 100,10000,100000.')
+    parser.add_argument('--servers', type=int, default=1, help='The number of HTTP servers the routes are spread over.')
+    parser.add_argument('--concurrency', type=int, default=8, help='The number of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=200, help='The number of measured iterations per scenario.')
+    parser.add_argument('--warmup', type=int, default=5, help='The number of unmeasured iterations per scenario.')
+    parser.add_argument('--scenarios', help='Comma separated scenario names or glob patterns. Defaults to all.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the fake Caddy adds to every request.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='The maximum random fraction of the latency added on top of it.')
+    parser.add_argument('--no-etags', action='store_true', help='The fake Caddy sends no Etags, like Caddy before 2.7.')
+    parser.add_argument('--not-modified', action='store_true',
+                        help='The fake Caddy answers If-None-Match with 304, which Caddy does not.')
+    parser.add_argument('--json-backend', choices=('orjson', 'stdlib'),
+                        help='The JSON backend of Birdie, see json_codec. Defaults to the fastest installed one.')
+    parser.add_argument('--asgi', action='store_true', help='Serve Birdie with uvicorn and the ASGI app.')
+    parser.add_argument('--output', help='Write the results to this file instead of stdout.')
+    parser.add_argument('--list', action='store_true', help='List the scenarios and exit.')
+    parser.add_argument('--verbose', action='store_true', help="Show Birdie's output.")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(scenario.name)
+        return
+    scenarios = select_scenarios(args.scenarios)
+    results = []
+    for routes in [int(size) for size in args.routes.split(',')]:
+        config = generate_config(routes, args.servers)
+        context = make_context(routes, config)
+        fake = FakeCaddy(copy.deepcopy(config), args.latency, args.jitter,
+                         etags=not args.no_etags, not_modified=args.not_modified).start()
+        birdie = BirdieProcess(fake.url, verbose=args.verbose, json_backend=args.json_backend, asgi=args.asgi)
+        try:
+            for scenario in scenarios:
+                total = args.requests if scenario.limit is None else min(args.requests, scenario.limit(context))
+                can_reset = reset_peak_rss(birdie.pid)
+                run = run_scenario(scenario, birdie.url, context, args.concurrency, total, args.warmup)
+                peak_rss = read_status(birdie.pid, 'VmHWM' if can_reset else 'VmRSS')
+                result = summarize(scenario, routes, args.concurrency, run, peak_rss)
+                results.append(result)
+                print(f"{routes:>7} routes  {scenario.name:<28} {result['throughput_rps'] or 0:>10.1f} req/s  "
+                      f"p50 {result['latency_ms']['p50'] or 0:>9.2f} ms  p99 {result['latency_ms']['p99'] or 0:>9.2f} ms  "
+                      f"errors {result['errors']}", file=sys.stderr)
+                if scenario.mutates:
+                    fake.load(copy.deepcopy(config))
+        finally:
+            birdie.stop()
+            fake.stop()
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'latency': args.latency,
+            'etags': not args.no_etags,
+            'not_modified': args.not_modified,
+            'json_backend': args.json_backend or 'default',
+            'asgi': args.asgi,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+    Benchmark scenarios, one or more per BirdieServer endpoint.
+    A scenario describes a single request, or a short sequence of requests such as opening,
+    filling and committing a change set, that the runner repeats at a set concurrency.
+    Scenarios guarded by the config Etag (`config_apply`, `changeset_commit`) answer some requests
+    with 409 Conflict when run concurrently; those are counted in the statuses of the results.
+"""
+import json
+from benchmarks.configs import generate_route, route_dial, route_host
+
+ROUTES_PATH = 'apps/http/servers/srv0/routes'
+
+CADDYFILE = '\n'.join(
+    f'adapt{index}.bench.test {{\n\treverse_proxy 10.1.0.{index}:8080 10.1.1.{index}:8080\n}}\n' for index in range(25)
+)
+
+
+class Scenario:
+    """
+    A request, or sequence of requests, repeated by the benchmark runner.
+
+    Attributes:
+        name (str): The unique name of the scenario.
+        method (str): The HTTP method.
+        path (str or callable): The endpoint path, or a function of (context, iteration) returning it.
+        params (dict or callable, optional): The query parameters, or a function returning them.
+        json (any or callable, optional): The JSON body, or a function returning it.
+        data (bytes or callable, optional): The raw body, or a function returning it.
+        headers (dict, optional): Additional request headers.
+        limit (callable, optional): A function of the context returning the maximum number of
+            iterations, for scenarios that consume the configuration, e.g. deleting routes.
+        mutates (bool): Whether the scenario changes the configuration, so it is reset afterwards.
+    """
+
+    def __init__(self, name, method, path, params=None, json=None, data=None, headers=None, limit=None, mutates=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.params = params
+        self.json = json
+        self.data = data
+        self.headers = headers
+        self.limit = limit
+        self.mutates = mutates
+
+    @staticmethod
+    def _resolve(value, context, iteration):
+        return value(context, iteration) if callable(value) else value
+
+    def run(self, session, base_url, context, iteration):
+        """
+        Make the request of one iteration.
+
+        Args:
+            session (requests.Session): The session of the calling worker.
+            base_url (str): The base URL of the Birdie server.
+            context (dict): The benchmark context, see `benchmarks.run.make_context`.
+            iteration (int): The number of the iteration, to vary hosts, IDs and bodies.
+
+        Returns:
+            int: The HTTP status code of the response.
+        """
+        response = session.request(
+            self.method,
+            base_url + self._resolve(self.path, context, iteration),
+            params=self._resolve(self.params, context, iteration),
+            json=self._resolve(self.json, context, iteration),
+            data=self._resolve(self.data, context, iteration),
+            headers=self.headers,
+        )
+        # Read the whole body, as a client would, so transfer time is part of the latency
+        response.content
+        return response.status_code
+
+
+class StreamScenario(Scenario):
+    """
+    Connects to a Server-Sent Events endpoint and waits for the first event.
+    """
+
+    def run(self, session, base_url, context, iteration):
+        with session.get(base_url + self._resolve(self.path, context, iteration), stream=True, timeout=30) as response:
+            for line in response.iter_lines():
+                if line.startswith(b'data:'):
+                    break
+            return response.status_code
+
+
+class ChangeSetScenario(Scenario):
+    """
+    Opens a change set, queues a batch of operations and commits them.
+    """
+
+    def __init__(self, name, batch=10):
+        super().__init__(name, 'POST', '/changesets', mutates=True)
+        self.batch = batch
+
+    def run(self, session, base_url, context, iteration):
+        response = session.post(base_url + '/changesets')
+        if response.status_code != 201:
+            return response.status_code
+        changeset_id = response.json()['id']
+        first = context['routes'] + iteration * self.batch
+        operations = [
+            {'action': 'add', 'path': ROUTES_PATH, 'items': [generate_route(first + offset)]} for offset in range(self.batch)
+        ]
+        response = session.post(f'{base_url}/changesets/{changeset_id}/operations', json={'operations': operations})
+        if response.status_code != 200:
+            return response.status_code
+        response = session.post(f'{base_url}/changesets/{changeset_id}/commit')
+        response.content
+        return response.status_code
+
+
+class ImportScenario(Scenario):
+    """
+    Creates a site import and uploads a batch of sites as NDJSON.
+    """
+
+    def __init__(self, name, sites=100):
+        super().__init__(name, 'POST', '/import', mutates=True)
+        self.sites = sites
+
+    def run(self, session, base_url, context, iteration):
+        response = session.post(base_url + '/import', json={'batch_size': self.sites})
+        if response.status_code != 201:
+            return response.status_code
+        first = context['routes'] + iteration * self.sites
+        body = ''.join(json.dumps({'siteURL': f'import{index}.bench.test', 'proxyURL': f'10.2.{index // 250 % 250}.{index % 250}:8080'}) + '\n'
+                       for index in range(first, first + self.sites))
+        response = session.post(f"{base_url}/import/{response.json()['id']}/upload", data=body.encode('utf-8'),
+                                headers={'Content-Type': 'application/x-ndjson'})
+        response.content
+        return response.status_code
+
+
+def _route_index(context, iteration):
+    # Spread lookups over the whole configuration
+    return iteration * 7919 % context['routes']
+
+
+def _new_route(context, iteration):
+    return generate_route(context['routes'] + iteration)
+
+
+def _listen(context, iteration):
+    return [f':{8443 if iteration % 2 else 443}']
+
+
+SCENARIOS = [
+    Scenario('config_get', 'GET', '/config'),
+    Scenario('config_get_path', 'GET', '/config',
+             params=lambda context, iteration: {'path': f'{ROUTES_PATH}/{_route_index(context, iteration)}'}),
+    Scenario('config_page', 'GET', '/config',
+             params=lambda context, iteration: {'path': ROUTES_PATH, 'offset': _route_index(context, iteration),
+                                                'limit': 50, 'fields': '@id,match'}),
+    Scenario('config_filter', 'GET', '/config',
+             params={'path': ROUTES_PATH, 'match.host': '*.tenant1*.bench.test', 'limit': 50, 'depth': 2}),
+    Scenario('config_changes', 'GET', '/config/changes', params={'since': '0', 'timeout': 0}),
+    Scenario('config_update', 'POST', '/config', mutates=True,
+             json=lambda context, iteration: {'path': 'apps/http/servers/srv0/listen', 'value': _listen(context, iteration)}),
+    Scenario('config_delete', 'DELETE', '/config', params={'path': f'{ROUTES_PATH}/0'}, mutates=True,
+             limit=lambda context: context['routes']),
+    Scenario('config_array_add', 'POST', '/config/array', mutates=True,
+             json=lambda context, iteration: {'path': ROUTES_PATH, 'items': [_new_route(context, iteration)]}),
+    Scenario('config_array_insert', 'POST', '/config/array/insert', mutates=True,
+             json=lambda context, iteration: {'path': ROUTES_PATH, 'index': 0, 'item': _new_route(context, iteration)}),
+    Scenario('config_plan', 'POST', '/config/plan', headers={'Content-Type': 'application/json'},
+             data=lambda context, iteration: context['encoded_variants'][iteration % 2]),
+    Scenario('config_apply', 'POST', '/config/apply', headers={'Content-Type': 'application/json'}, mutates=True,
+             data=lambda context, iteration: context['encoded_variants'][iteration % 2]),
+    Scenario('load', 'POST', '/load', headers={'Content-Type': 'application/json'}, mutates=True,
+             data=lambda context, iteration: context['encoded_load']),
+    Scenario('adapt', 'POST', '/adapt', data=CADDYFILE.encode('utf-8'), headers={'Content-Type': 'text/caddyfile'}),
+    Scenario('stop', 'POST', '/stop'),
+    Scenario('pki_ca', 'GET', '/pki/ca', params={'id': 'local'}),
+    Scenario('pki_ca_certificates', 'GET', '/pki/ca/certificates', params={'id': 'local'}),
+    Scenario('pki_inventory', 'GET', '/pki/inventory'),
+    Scenario('pki_inventory_expiring', 'GET', '/pki/inventory/expiring', params={'days': 30}),
+    Scenario('upstreams', 'GET', '/reverse_proxy/upstreams'),
+    Scenario('upstreams_history', 'GET', '/reverse_proxy/upstreams/history'),
+    StreamScenario('upstreams_stream', 'GET', '/reverse_proxy/upstreams/stream'),
+    ChangeSetScenario('changeset_commit'),
+    ImportScenario('site_import'),
+    Scenario('routes_lookup_host', 'GET', '/routes/lookup',
+             params=lambda context, iteration: {'host': route_host(_route_index(context, iteration))}),
+    Scenario('routes_lookup_path', 'GET', '/routes/lookup', params={'path': '/api/v1/users'}),
+    Scenario('routes_upstream', 'GET', '/routes/upstream',
+             params=lambda context, iteration: {'dial': route_dial(_route_index(context, iteration))}),
+    Scenario('routes_id', 'GET', lambda context, iteration: f'/routes/id/route-{_route_index(context, iteration)}'),
+    Scenario('routes_search', 'GET', '/routes/search', params={'kind': 'host', 'prefix': 'site1', 'limit': 50}),
+    Scenario('stats', 'GET', '/stats'),
+    Scenario('metrics', 'GET', '/metrics'),
+    Scenario('fleet_nodes', 'GET', '/fleet/nodes'),
+    Scenario('fleet_config_get', 'GET', '/fleet/config', params={'path': 'apps/http/servers/srv0/listen'}),
+    Scenario('fleet_config_update', 'POST', '/fleet/config', mutates=True,
+             json=lambda context, iteration: {'path': 'apps/http/servers/srv0/listen', 'value': _listen(context, iteration)}),
+    Scenario('fleet_config_array', 'POST', '/fleet/config/array', mutates=True,
+             json=lambda context, iteration: {'path': ROUTES_PATH, 'items': [_new_route(context, iteration)]}),
+    Scenario('fleet_load', 'POST', '/fleet/load', headers={'Content-Type': 'application/json'}, mutates=True,
+             data=lambda context, iteration: context['encoded_load']),
+    Scenario('fleet_upstreams', 'GET', '/fleet/reverse_proxy/upstreams'),
+    Scenario('fleet_pki_ca', 'GET', '/fleet/pki/ca', params={'id': 'local'}),
+    Scenario('fleet_pki_ca_certificates', 'GET', '/fleet/pki/ca/certificates', params={'id': 'local'}),
+    Scenario('page_test', 'GET', '/test'),
+    Scenario('page_add_site', 'GET', '/add_site'),
+    Scenario('page_dragdrop', 'GET', '/dragdrop'),
+]
+
+
+def encode(value):
+    """
+    Encode a request body once, so the load generator does not dominate large-config scenarios.
+    """
+    return json.dumps(value).encode('utf-8')
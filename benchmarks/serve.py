@@ -0,0 +1,69 @@
+"""
+    Runs a BirdieServer for the benchmark runner in its own process, so its memory can be measured
+    apart from the load generator. Prints the URL it listens on as a JSON line once it is ready.
+    It serves the Flask app with a threaded WSGI server, or with `--asgi` the ASGI app with uvicorn.
+
+    Usage, from the repository root:
+        python -m benchmarks.serve --caddy http://127.0.0.1:2019 --port 5002
+        python -m benchmarks.serve --caddy http://127.0.0.1:2019 --port 5002 --asgi
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+from werkzeug.serving import make_server
+
+
+def serve_asgi(birdie, host, port, workers):
+    """
+    Serve the ASGI app of a BirdieServer with uvicorn until interrupted, printing the ready line first.
+    """
+    import uvicorn
+    from asgi import create_app
+
+    # asyncio only disables Nagle's algorithm on sockets created with an explicit TCP protocol
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    # Listening before uvicorn starts queues the first connections instead of refusing them
+    sock.listen(2048)
+    print(json.dumps({'url': f'http://{host}:{sock.getsockname()[1]}', 'pid': os.getpid(),
+                      'startup': birdie.startup}), flush=True)
+    config = uvicorn.Config(create_app(birdie, workers=workers), log_level='warning', access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Birdie with a threaded WSGI server or uvicorn for benchmarking.')
+    parser.add_argument('--caddy', required=True, help='The URL of the Caddy admin API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='The port to listen on. Defaults to a free port.')
+    parser.add_argument('--sampler-interval', type=float, default=5, help='Seconds between samples of the proxy upstreams.')
+    parser.add_argument('--no-prewarm', action='store_true',
+                        help='Skip compressing the assets and loading the Caddy config before serving.')
+    parser.add_argument('--asgi', action='store_true', help='Serve the ASGI app with uvicorn.')
+    parser.add_argument('--workers', type=int, default=32, help='The threads running the Flask app in ASGI mode.')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Records below this level are dropped, so the terminal does not dominate the results.')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.getLevelName(args.log_level.upper()) - 1)
+    from server import BirdieServer
+
+    birdie = BirdieServer(args.caddy, host=args.host, port=args.port, sampler_interval=args.sampler_interval,
+                          prewarm=not args.no_prewarm)
+    if args.asgi:
+        serve_asgi(birdie, args.host, args.port, args.workers)
+        return
+    httpd = make_server(args.host, args.port, birdie.app, threaded=True)
+    print(json.dumps({'url': f'http://{args.host}:{httpd.server_port}', 'pid': os.getpid(),
+                      'startup': birdie.startup}), flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+    Cold start benchmark.
+    Starts fresh Birdie processes against a fake Caddy admin API, with and without prewarming, and
+    reports how long each took until it was ready, its startup steps as the server measured them,
+    and the latency of the first requests it served, which hit cold caches unless it was prewarmed.
+
+    Usage, from the repository root:
+        python -m benchmarks.startup --routes 100,10000 --repeat 5
+"""
+import argparse
+import copy
+import json
+import subprocess
+import sys
+import time
+import requests
+from benchmarks.configs import generate_config
+from benchmarks.fake_caddy import FakeCaddy
+from benchmarks.run import REPO_ROOT
+
+FIRST_REQUESTS = ('/config', '/dragdrop', '/routes/search?prefix=site')
+
+
+def cold_start(caddy_url, prewarm):
+    """
+    Start a Birdie process and time it until it has served its first requests.
+
+    Returns:
+        dict: The milliseconds until the process was ready, of its startup steps and of each first request.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--caddy', caddy_url] + ([] if prewarm else ['--no-prewarm']),
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError('Birdie exited before it was ready')
+        ready_ms = (time.perf_counter() - start) * 1000
+        ready = json.loads(line)
+        first = {}
+        with requests.Session() as session:
+            for path in FIRST_REQUESTS:
+                request_start = time.perf_counter()
+                session.get(ready['url'] + path).raise_for_status()
+                first[path] = (time.perf_counter() - request_start) * 1000
+        return {
+            'ready_ms': ready_ms,
+            'steps_ms': {step: seconds * 1000 for step, seconds in ready['startup']['steps'].items()},
+            'first_request_ms': first,
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cold start of Birdie against a fake Caddy admin API.')
+    parser.add_argument('--routes', default='100,10000', help='Comma separated configuration sizes.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of processes started per case; the median is reported.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the fake Caddy adds to every request.')
+    args = parser.parse_args(argv)
+
+    results = []
+    for routes in [int(size) for size in args.routes.split(',')]:
+        fake = FakeCaddy(copy.deepcopy(generate_config(routes)), args.latency).start()
+        try:
+            for prewarm in (False, True):
+                runs = [cold_start(fake.url, prewarm) for _ in range(args.repeat)]
+                result = {
+                    'routes': routes,
+                    'prewarm': prewarm,
+                    'ready_ms': round(median([run['ready_ms'] for run in runs]), 3),
+                    'steps_ms': {step: round(median([run['steps_ms'][step] for run in runs]), 3)
+                                 for step in runs[0]['steps_ms']},
+                    'first_request_ms': {path: round(median([run['first_request_ms'][path] for run in runs]), 3)
+                                         for path in FIRST_REQUESTS},
+                }
+                results.append(result)
+                first = '  '.join(f'{path} {ms:>8.2f} ms' for path, ms in result['first_request_ms'].items())
+                print(f"{routes:>7} routes  prewarm {'on ' if prewarm else 'off'}  ready {result['ready_ms']:>8.1f} ms  "
+                      f"{first}", file=sys.stderr)
+        finally:
+            fake.stop()
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
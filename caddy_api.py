@@ -4,9 +4,200 @@
     It includes methods for getting, updating, and deleting Caddy configurations, as well as managing
     Caddy's storage and certificates.
     The `CaddyAPI` class is initialized with the Caddy server's API URL and an optional auth token.
+    The admin API may also be reached over a unix socket by passing an address like `unix//run/caddy/admin.sock`.
+    Reads of the configuration are served from a locally cached copy of the full config tree.
+    Changes made through the client drop the copy at once; changes made elsewhere are picked up
+    once the copy is older than `cache_ttl`. Caddy answers `If-None-Match` with the full config
+    rather than `304 Not Modified`, so a revalidation downloads it again and only skips decoding
+    it when its `Etag` is unchanged.
 """
+import copy
 import requests
+import json_codec
 import logging
+import random
+import reprlib
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from caddy_transport import CircuitBreaker, CaddyUnavailableError, SingleFlight, UnixSocketAdapter, parse_admin_address
+from config_tree import get_node, split_path
+from config_diff import apply_operations as apply_to_tree, common_root, diff_config, relative_operations
+from adapt_cache import AdaptCache, cache_key
+from metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
+
+CADDY_REQUEST_DURATION = Histogram(
+    'birdie_caddy_request_duration_seconds', 'Latency of Caddy admin API requests.', ['method', 'endpoint'])
+CADDY_REQUEST_BYTES = Histogram(
+    'birdie_caddy_request_bytes', 'Size of Caddy admin API request bodies.', ['method', 'endpoint'], buckets=SIZE_BUCKETS)
+CADDY_RESPONSE_BYTES = Histogram(
+    'birdie_caddy_response_bytes', 'Size of Caddy admin API response bodies.', ['method', 'endpoint'], buckets=SIZE_BUCKETS)
+CADDY_ERRORS = Counter(
+    'birdie_caddy_request_errors_total', 'Failed Caddy admin API requests.', ['method', 'endpoint', 'reason'])
+CADDY_IN_FLIGHT = Gauge('birdie_caddy_requests_in_flight', 'Caddy admin API requests in flight.')
+
+class _LogRepr(reprlib.Repr):
+    """
+    A bounded repr that also slices bytes before formatting them, as it does strings.
+    """
+
+    def repr_str(self, value, level):
+        # Only the ends are kept, so the middle of a long string need not be escaped at all
+        if len(value) > self.maxstring:
+            value = value[:self.maxstring] + value[-self.maxstring:]
+        return super().repr_str(value, level)
+
+    def repr_bytes(self, value, level):
+        if len(value) > self.maxstring:
+            value = value[:self.maxstring] + value[-self.maxstring:]
+        text = repr(value)
+        if len(text) > self.maxstring:
+            head = max(0, (self.maxstring - 3) // 2)
+            tail = max(0, self.maxstring - 3 - head)
+            text = text[:head] + '...' + text[len(text) - tail:]
+        return text
+
+    repr_bytearray = repr_bytes
+
+
+# Bounded repr so formatting a log line costs the same for a small route and a huge config
+_log_repr = _LogRepr()
+_log_repr.maxlevel = 4
+_log_repr.maxdict = 8
+_log_repr.maxlist = 8
+_log_repr.maxstring = 120
+_log_repr.maxother = 120
+
+
+def endpoint_label(endpoint):
+    """
+    Reduce a Caddy admin API endpoint to a low-cardinality label for metrics.
+
+    Args:
+        endpoint (str): The endpoint, e.g. `/config/apps/http` or `/pki/ca/local/certificates`.
+
+    Returns:
+        str: The endpoint with config paths and IDs collapsed, e.g. `/config` or `/pki/ca/{id}/certificates`.
+    """
+    parts = endpoint.split('?', 1)[0].strip('/').split('/')
+    if parts[0] in ('config', 'id'):
+        return f'/{parts[0]}'
+    if parts[:2] == ['pki', 'ca'] and len(parts) > 2:
+        return '/pki/ca/{id}' + ''.join(f'/{part}' for part in parts[3:])
+    return '/' + '/'.join(parts)
+
+
+class LogPayload:
+    """
+    Defers formatting a request or response payload for logging until a log record is emitted,
+    and bounds it to a number of characters so large configs are never formatted in full.
+
+    Attributes:
+        payload (any): The payload, or a Response whose body is logged.
+        limit (int): The maximum number of characters to format.
+    """
+
+    def __init__(self, payload, limit=1024):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        if isinstance(self.payload, requests.Response):
+            content = self.payload.content or b''
+            text = content[:self.limit].decode('utf-8', 'replace')
+            truncated = len(content) > self.limit
+        else:
+            text = _log_repr.repr(self.payload)
+            truncated = len(text) > self.limit
+            text = text[:self.limit]
+        return f'{text}... <truncated>' if truncated else text
+
+
+class ConfigConflictError(requests.HTTPError):
+    """
+    Raised when Caddy rejects a change because the configuration changed since it was read (HTTP 412).
+    """
+
+
+class RawResponse:
+    """
+    An upstream response body that is passed through without being decoded.
+
+    Attributes:
+        body (bytes or iterator): The body, either fully buffered or as an iterator of byte chunks.
+        content_type (str): The Content-Type of the body.
+        content_length (int): The length of the body, if known.
+        etag (str): The Etag Caddy returned for the body, if any.
+    """
+
+    def __init__(self, body, content_type='application/json', content_length=None, etag=None):
+        self.body = body
+        self.content_type = content_type
+        if content_length is None and isinstance(body, bytes):
+            content_length = len(body)
+        self.content_length = content_length
+        self.etag = etag
+
+    @property
+    def is_streamed(self):
+        """
+        bool: Whether the body is an iterator of chunks rather than buffered bytes.
+        """
+        return not isinstance(self.body, bytes)
+
+
+class ConfigSnapshot:
+    """
+    A cached copy of the full Caddy configuration.
+
+    Attributes:
+        config (dict): The parsed configuration. Must be treated as read-only.
+        raw (bytes): The configuration exactly as returned by Caddy.
+        etag (str): The Etag Caddy returned for the configuration.
+    """
+
+    max_encoded_paths = 256
+
+    def __init__(self, config, raw, etag):
+        self.config = config
+        self.raw = raw
+        self.etag = etag
+        self._encoded = set()
+        self._lock = threading.Lock()
+
+    def release(self):
+        """
+        Forget the remembered encodings of the snapshot once it is replaced.
+        """
+        with self._lock:
+            for key in self._encoded:
+                json_codec.forget((self, key))
+            self._encoded.clear()
+
+    def encode(self, path=None):
+        """
+        Get the JSON encoding of the subtree at the given path, remembered per snapshot and path.
+
+        Args:
+            path (str, optional): The configuration path. Defaults to the whole config.
+
+        Returns:
+            bytes: The JSON encoded subtree.
+        """
+        key = '/'.join(split_path(path))
+        if not key:
+            return self.raw
+        encoded = json_codec.recall((self, key))
+        if encoded is None:
+            encoded = json_codec.remember((self, key), get_node(self.config, key))
+            with self._lock:
+                if len(self._encoded) >= self.max_encoded_paths:
+                    for cached in self._encoded:
+                        json_codec.forget((self, cached))
+                    self._encoded.clear()
+                self._encoded.add(key)
+        return encoded
+
 
 class CaddyAPI:
     """
@@ -15,18 +206,74 @@ class CaddyAPI:
     Attributes:
         api_url (str): The base URL for the Caddy API.
         auth_token (str): Optional authentication token for the API.
+        cache_config (bool): Whether configuration reads are served from the cached config tree.
+        cache_ttl (float): Seconds a cached config is trusted without revalidating it against Caddy.
+            Changes made through the client invalidate it immediately.
+        cache_hits (int): Number of config reads answered from the cache.
+        cache_misses (int): Number of config reads that had to download the full config.
+        raw_chunk_size (int): Size of the chunks yielded when streaming raw responses.
+        timeout (tuple): The connect and read timeouts in seconds.
+        retries (int): How often failed idempotent requests are retried.
+        breaker (CircuitBreaker): Fails calls fast while the admin API is unreachable.
+        singleflight (SingleFlight): Coalesces concurrent identical GET requests.
+        adapt_cache (AdaptCache): Caches `/adapt` results by content, or None if disabled.
+        log_payload_limit (int): The maximum number of characters of a payload written to the debug log.
+        max_chained_operations (int): The largest plan `apply_operations` sends as narrow requests.
+        mutation_etags (bool): Whether Caddy returns the new Etag after a change, None until known.
     """
 
-    def __init__(self, api_url, auth_token=None):
+    raw_chunk_size = 64 * 1024
+    # Caddy's PUT inserts into arrays and DELETE shifts indices, so only reads are safe to repeat
+    idempotent_methods = frozenset({'GET', 'HEAD', 'OPTIONS'})
+    retry_statuses = frozenset({502, 503, 504})
+    max_backoff = 2.0
+    log_payload_limit = 1024
+    max_chained_operations = 8
+
+    def __init__(self, api_url, auth_token=None, cache_config=True, cache_ttl=2, pool_size=10,
+                 connect_timeout=3.05, read_timeout=30, retries=2, backoff=0.1,
+                 breaker_threshold=5, breaker_reset_timeout=10, adapt_cache_size=128,
+                 adapt_cache_bytes=16 * 1024 * 1024):
         """
         Initializes the CaddyAPI with the given API URL and optional auth token.
 
         Args:
-            api_url (str): The base URL for the Caddy API.
+            api_url (str): The base URL for the Caddy API, or `unix/<socket path>` for a unix socket.
             auth_token (str, optional): Optional authentication token for the API.
+            cache_config (bool, optional): Serve config reads from a cached config tree. Defaults to True.
+            cache_ttl (float, optional): Seconds to trust the cached config before revalidating it,
+                which bounds how late changes made outside Birdie are seen. Defaults to 2; 0
+                revalidates on every read, at the cost of downloading the config every time.
+            pool_size (int, optional): The maximum number of pooled connections. Defaults to 10.
+            connect_timeout (float, optional): Seconds to wait for a connection. Defaults to 3.05.
+            read_timeout (float, optional): Seconds to wait for a response. Defaults to 30.
+            retries (int, optional): Retries of failed idempotent requests. Defaults to 2.
+            backoff (float, optional): The base of the jittered exponential backoff between retries. Defaults to 0.1.
+            breaker_threshold (int, optional): Consecutive connection failures that open the circuit breaker. Defaults to 5.
+            breaker_reset_timeout (float, optional): Seconds the circuit breaker stays open. Defaults to 10.
+            adapt_cache_size (int, optional): The number of `/adapt` results cached. Defaults to 128, 0 disables the cache.
+            adapt_cache_bytes (int, optional): The total size of the cached `/adapt` results. Defaults to 16 MiB.
         """
         self.api_url = api_url
+        self.base_url, self.socket_path = parse_admin_address(api_url)
         self.auth_token = auth_token
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout)
+        self.singleflight = SingleFlight()
+        self.adapt_cache = AdaptCache(adapt_cache_size, adapt_cache_bytes) if adapt_cache_size > 0 else None
+        self.cache_config = cache_config
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._config_snapshot = None
+        self._config_fetched_at = 0.0
+        self.mutation_etags = None
+        self._mutation_listeners = []
+        self._before_mutation_listeners = []
         self.headers = {
             'Content-Type': 'application/json',
             'Accept': 'application/json'
@@ -35,13 +282,21 @@ class CaddyAPI:
             self.headers['Authorization'] = f'Bearer {auth_token}'
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        if self.socket_path:
+            self.session.mount(f'{self.base_url}/', UnixSocketAdapter(self.socket_path, pool_maxsize=pool_size))
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        # The level is left to the logging configuration of the application, so debug payloads are
+        # only formatted when debug logging is enabled
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
-        handler = logging.StreamHandler()
-        handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        # Every client shares the logger, so only the first one adds a handler
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
         self.logger.debug(f'Initialized CaddyAPI with URL: {self.api_url}')
         
     def _request(self, method, endpoint, **kwargs):
@@ -56,29 +311,477 @@ class CaddyAPI:
         Raises:
             requests.RequestException: If the request fails.
         """
-        url = f'{self.api_url}{endpoint}'
-        self.logger.debug(f'Making {method} request to {url} with params: {kwargs}')
+        url = f'{self.base_url}{endpoint}'
+        if kwargs.get('json') is not None:
+            # Encode with the fast codec; the session already sends `Content-Type: application/json`
+            kwargs['data'] = json_codec.dumps(kwargs.pop('json'))
+        else:
+            kwargs.pop('json', None)
+        if method == 'GET' and not kwargs.get('stream'):
+            # Concurrent callers asking for the same resource share one upstream request
+            headers = kwargs.get('headers') or {}
+            key = (url, headers.get('If-None-Match'), repr(kwargs.get('params')))
+            return self.singleflight.do(key, lambda: self._send(method, endpoint, url, **kwargs))
+        return self._send(method, endpoint, url, **kwargs)
+
+    def _send(self, method, endpoint, url, **kwargs):
+        """
+        Send a request to the Caddy API, retrying idempotent requests and honouring the circuit breaker.
+        Args:
+            method (str): The HTTP method to use.
+            endpoint (str): The API endpoint, used to label metrics.
+            url (str): The full URL to call.
+            **kwargs: Additional arguments to pass to the requests library.
+        Returns:
+            Response: The response from the API.
+        Raises:
+            requests.RequestException: If the request fails.
+        """
+        self.logger.debug('Making %s request to %s with params: %s', method, url, LogPayload(kwargs, self.log_payload_limit))
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = self.retries + 1 if method in self.idempotent_methods else 1
+        label = endpoint_label(endpoint)
         try:
-            response = self.session.request(method, url, **kwargs)
+            for attempt in range(attempts):
+                if not self.breaker.allow():
+                    CADDY_ERRORS.labels(method, label, 'circuit_open').inc()
+                    raise CaddyUnavailableError(f'Caddy admin API at {self.api_url} is unavailable, not retrying yet.')
+                last_attempt = attempt + 1 == attempts
+                CADDY_IN_FLIGHT.inc()
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    self.breaker.record_failure()
+                    CADDY_ERRORS.labels(method, label, type(e).__name__).inc()
+                    if last_attempt:
+                        raise
+                    self.logger.warning('Retrying %s %s after error: %s', method, url, e)
+                    self._sleep_backoff(attempt)
+                    continue
+                except BaseException:
+                    # A trial call of the breaker must be settled on every way out, or it stays half-open
+                    self.breaker.record_failure()
+                    raise
+                finally:
+                    CADDY_IN_FLIGHT.dec()
+                    CADDY_REQUEST_DURATION.labels(method, label).observe(time.perf_counter() - start)
+                self.breaker.record_success()
+                self._observe_sizes(method, label, response, kwargs.get('stream'))
+                if response.status_code >= 400:
+                    CADDY_ERRORS.labels(method, label, str(response.status_code)).inc()
+                if response.status_code in self.retry_statuses and not last_attempt:
+                    response.close()
+                    self.logger.warning('Retrying %s %s after status %s', method, url, response.status_code)
+                    self._sleep_backoff(attempt)
+                    continue
+                break
             response.raise_for_status()
-            self.logger.debug(f'Response: {response.status_code} - {response.text}')
+            if kwargs.get('stream'):
+                # Reading the body here would defeat streaming
+                self.logger.debug('Response: %s - <streamed>', response.status_code)
+            else:
+                self.logger.debug('Response: %s - %s', response.status_code, LogPayload(response, self.log_payload_limit))
             return response
         except requests.RequestException as e:
             self.logger.error(f'Error making request to {url}: {e}')
             raise
+
+    def _observe_sizes(self, method, label, response, stream):
+        """
+        Record the sizes of the request and response bodies of an exchange with the Caddy API.
+        """
+        body = response.request.body if response.request is not None else None
+        if body:
+            CADDY_REQUEST_BYTES.labels(method, label).observe(len(body))
+        if stream:
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                CADDY_RESPONSE_BYTES.labels(method, label).observe(int(length))
+        else:
+            CADDY_RESPONSE_BYTES.labels(method, label).observe(len(response.content))
+
+    def _sleep_backoff(self, attempt):
+        """
+        Sleep before a retry, using exponential backoff with full jitter.
+        Args:
+            attempt (int): The number of the attempt that failed, starting at 0.
+        """
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
         
-    def get_config(self, path=None):
+    def _json(self, response):
+        """
+        Decode a JSON response body, tolerating the empty bodies Caddy returns for successful changes.
+        Args:
+            response (Response): The response from the API.
+        Returns:
+            any: The decoded body, or None if the body is empty.
+        """
+        if not response.content:
+            return None
+        return json_codec.loads(response.content)
+
+    def _iter_body(self, response):
+        """
+        Yield the body of a streamed response in chunks, closing the response when done.
+        Args:
+            response (Response): A response made with `stream=True`.
+        Yields:
+            bytes: The next chunk of the body.
+        """
+        try:
+            for chunk in response.iter_content(self.raw_chunk_size):
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+
+    def _request_raw(self, method, endpoint, **kwargs):
+        """
+        Make a request to the Caddy API and pass its body through without decoding it.
+        Args:
+            method (str): The HTTP method to use.
+            endpoint (str): The API endpoint to call.
+            **kwargs: Additional arguments to pass to the requests library.
+        Returns:
+            RawResponse: The streamed body of the response.
+        """
+        response = self._request(method, endpoint, stream=True, **kwargs)
+        content_type = response.headers.get('Content-Type', 'application/json')
+        return RawResponse(self._iter_body(response), content_type, etag=response.headers.get('Etag'))
+
+    def _fetch_snapshot(self):
+        """
+        Get a snapshot of the full Caddy configuration. The cached copy is returned while it is
+        younger than `cache_ttl`; after that the config is downloaded again and only decoded if its
+        Etag changed. `If-None-Match` is sent for servers that answer it with 304, but Caddy does not.
+        Returns:
+            ConfigSnapshot: The snapshot of the full Caddy configuration.
+        """
+        cached, generation, fresh = self._cached_snapshot()
+        if fresh:
+            return cached
+        response = self._request('GET', '/config/', headers=self._revalidation_headers(cached))
+        return self._update_snapshot(cached, generation, response)
+
+    def _cached_snapshot(self):
+        """
+        Look up the cached snapshot.
+        Returns:
+            tuple: The cached snapshot or None, the cache generation it was read at, and whether it
+                is younger than `cache_ttl`, so it can be used without asking Caddy.
+        """
+        with self._cache_lock:
+            cached = self._config_snapshot
+            fetched_at = self._config_fetched_at
+            generation = self._cache_generation
+            fresh = cached is not None and bool(self.cache_ttl) and time.monotonic() - fetched_at < self.cache_ttl
+            if fresh:
+                self.cache_hits += 1
+        return cached, generation, fresh
+
+    @staticmethod
+    def _revalidation_headers(cached):
+        return {'If-None-Match': cached.etag} if cached is not None and cached.etag else {}
+
+    def _update_snapshot(self, cached, generation, response):
+        """
+        Cache the configuration Caddy returned, unless its Etag shows the cached copy is unchanged.
+        Args:
+            cached (ConfigSnapshot): The snapshot returned by `_cached_snapshot`, or None.
+            generation (int): The cache generation returned by `_cached_snapshot`.
+            response (Response): The response to `GET /config/`.
+        Returns:
+            ConfigSnapshot: The current snapshot.
+        """
+        new_etag = response.headers.get('Etag')
+        if cached is not None and (response.status_code == 304 or (cached.etag and new_etag == cached.etag)):
+            with self._cache_lock:
+                self.cache_hits += 1
+                if self._cache_generation == generation:
+                    self._config_fetched_at = time.monotonic()
+            return cached
+
+        snapshot = ConfigSnapshot(self._json(response), response.content, new_etag)
+        with self._cache_lock:
+            self.cache_misses += 1
+            # Only keep the result if no mutation invalidated the cache while we were fetching
+            if self._cache_generation == generation:
+                if self._config_snapshot is not None:
+                    self._config_snapshot.release()
+                self._config_snapshot = snapshot
+                self._config_fetched_at = time.monotonic()
+        return snapshot
+
+    def _fetch_config(self):
+        """
+        Get the full Caddy configuration, from the cache while it is younger than `cache_ttl`.
+        Returns:
+            dict: The full Caddy configuration. Callers must treat it as read-only.
+        """
+        return self._fetch_snapshot().config
+
+    def invalidate_config_cache(self):
+        """
+        Drop the cached configuration so the next read downloads it again.
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            if self._config_snapshot is not None:
+                self._config_snapshot.release()
+            self._config_snapshot = None
+
+    def add_mutation_listener(self, listener, before=False):
+        """
+        Register a callback that is called after every configuration change made through this client.
+
+        Args:
+            listener (callable): Called with the list of configuration paths that were changed,
+                where '' stands for the whole configuration.
+            before (bool, optional): Call the listener before the change is sent to Caddy instead,
+                e.g. to record the configuration it replaces. Defaults to False.
+        """
+        (self._before_mutation_listeners if before else self._mutation_listeners).append(listener)
+
+    def _mutating(self, *paths):
+        """
+        Notify the listeners registered with `before` that a configuration change is about to be made.
+        Args:
+            *paths (str): The configuration paths that will be changed.
+        """
+        for listener in self._before_mutation_listeners:
+            try:
+                listener(list(paths))
+            except Exception as e:
+                self.logger.error(f'Error in mutation listener: {e}')
+
+    def _mutated(self, *paths):
+        """
+        Invalidate the config cache and notify the mutation listeners after a configuration change.
+        Args:
+            *paths (str): The configuration paths that were changed.
+        """
+        self.invalidate_config_cache()
+        for listener in self._mutation_listeners:
+            try:
+                listener(list(paths))
+            except Exception as e:
+                self.logger.error(f'Error in mutation listener: {e}')
+
+    def notify_mutation(self, paths, before=False):
+        """
+        Notify the mutation listeners of a configuration change made through another client of the
+        same Caddy instance, e.g. an `AsyncCaddyAPI`, and invalidate the config cache after it.
+
+        Args:
+            paths (list): The configuration paths that are changed, where '' stands for the whole configuration.
+            before (bool, optional): The change is about to be sent to Caddy, rather than made. Defaults to False.
+        """
+        if before:
+            self._mutating(*paths)
+        else:
+            self._mutated(*paths)
+
+    @property
+    def config_etag(self):
+        """
+        str: The Etag of the cached configuration, or None if nothing is cached.
+        """
+        snapshot = self._config_snapshot
+        return snapshot.etag if snapshot else None
+
+    def cached_config(self):
+        """
+        Get the cached configuration without contacting Caddy, however old it is.
+        Returns:
+            tuple: The configuration (read-only) and its Etag, or None and None if nothing is cached.
+        """
+        snapshot = self._config_snapshot
+        return (snapshot.config, snapshot.etag) if snapshot else (None, None)
+
+    def cache_stats(self):
+        """
+        Get the config cache counters.
+        Returns:
+            dict: The hit and miss counts and the Etag of the cached config.
+        """
+        with self._cache_lock:
+            snapshot = self._config_snapshot
+            return {
+                'enabled': self.cache_config,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'cached': snapshot is not None,
+                'etag': snapshot.etag if snapshot else None,
+                'size': len(snapshot.raw) if snapshot else 0,
+            }
+
+    def stats(self):
+        """
+        Get the runtime statistics of this client.
+        Returns:
+            dict: Statistics grouped by subsystem.
+        """
+        return {
+            'config_cache': self.cache_stats(),
+            'circuit_breaker': self.breaker.stats(),
+            'singleflight': self.singleflight.stats(),
+            'adapt_cache': self.adapt_cache.stats() if self.adapt_cache else None,
+        }
+
+    def get_config(self, path=None, raw=False):
         """
         Get the current Caddy configuration or a specific configuration at the given path.
+        When config caching is enabled the path is resolved against the cached config tree.
         Args:
             path (str, optional): The configuration path to retrieve. Defaults to None.
+            raw (bool, optional): Return the encoded JSON instead of the parsed value. Defaults to False.
         Returns:
             dict: The current Caddy configuration or the configuration at the specified path.
+            RawResponse: The encoded configuration, if `raw` is set.
         """
         endpoint = f'/config/{path}' if path else '/config'
+        if self.cache_config:
+            snapshot = self._fetch_snapshot()
+            if raw:
+                # Caddy's Etags name the path they were read from, so only the whole config has one
+                return RawResponse(snapshot.encode(path), etag=None if split_path(path) else snapshot.etag)
+            return get_node(snapshot.config, path)
+        if raw:
+            return self._request_raw('GET', endpoint)
         response = self._request('GET', endpoint)
-        return response.json()
+        return json_codec.loads(response.content)
     
+    def current_config(self):
+        """
+        Get the full configuration together with its Etag.
+        Returns:
+            tuple: The configuration (read-only) and the Etag Caddy returned for it.
+        """
+        if self.cache_config:
+            snapshot = self._fetch_snapshot()
+            return snapshot.config, snapshot.etag
+        response = self._request('GET', '/config/')
+        return self._json(response), response.headers.get('Etag')
+
+    def apply_operations(self, operations, etag=None, base=None):
+        """
+        Apply planned configuration operations as one guarded change.
+
+        Plans of up to `max_chained_operations` are sent as narrow requests, each carrying the Etag
+        of the configuration the previous one produced as `If-Match`, so no other writer can get in
+        between. Larger plans, and plans whose remaining operations cannot be chained because Caddy
+        did not return the new Etag, are collapsed into one write of the deepest path the operations
+        share, so Caddy reloads once. If a request fails after part of the plan may have been
+        applied, that path is restored to its state before the plan.
+
+        Args:
+            operations (list): The operations, as returned by `config_diff.diff_config`.
+            etag (str, optional): The Etag of the configuration the operations were planned against,
+                sent as `If-Match` so the plan is rejected if the configuration changed in the meantime.
+            base (dict, optional): The configuration the operations were planned against, used to
+                collapse and roll back plans of several operations. Defaults to the cached configuration.
+
+        Raises:
+            ConfigConflictError: If the configuration no longer matches the Etag.
+        """
+        if not operations:
+            return
+        paths = [operation['path'] for operation in operations]
+        root = before = None
+        if len(operations) > 1:
+            if base is None:
+                base, base_etag = self.current_config()
+                if etag and base_etag != etag:
+                    raise ConfigConflictError('The Caddy configuration changed since it was read.')
+            root = common_root(operations)
+            before = get_node(base, root)
+        self._mutating(*paths)
+        applied = 0
+        try:
+            if len(operations) == 1 or (len(operations) <= self.max_chained_operations
+                                        and self.mutation_etags is not False):
+                for operation in operations:
+                    response = self._write_operation(operation, etag)
+                    applied += 1
+                    if etag and applied < len(operations):
+                        etag = response.headers.get('Etag')
+                        self.mutation_etags = etag is not None
+                        if etag is None:
+                            break
+            if applied < len(operations):
+                done = relative_operations(operations[:applied], root)
+                if applied:
+                    # Chaining stopped without an Etag: read the new one and check nobody else wrote since
+                    self.invalidate_config_cache()
+                    current, etag = self.current_config()
+                    if get_node(current, root) != apply_to_tree(copy.deepcopy(before), done):
+                        raise ConfigConflictError('The Caddy configuration changed while the plan was applied.')
+                after = apply_to_tree(copy.deepcopy(before), done + relative_operations(operations[applied:], root))
+                self._write_operation({'op': 'PATCH' if root else 'POST', 'path': '/'.join(root), 'value': after}, etag)
+                applied = len(operations)
+        except Exception as e:
+            # Nothing was applied if the first request was answered with an error
+            if before is not None and (applied or not isinstance(e, requests.HTTPError)):
+                self._restore(root, before)
+            raise
+        finally:
+            self._mutated(*paths)
+
+    def _write_operation(self, operation, etag=None):
+        """
+        Send one planned operation, guarded by an Etag.
+
+        Returns:
+            Response: The response from the API.
+
+        Raises:
+            ConfigConflictError: If the configuration no longer matches the Etag.
+        """
+        headers = {'If-Match': etag} if etag else {}
+        try:
+            return self._request(operation['op'], f"/config/{operation['path']}", json=operation.get('value'), headers=headers)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 412:
+                raise ConfigConflictError('The Caddy configuration changed since it was read.', response=e.response)
+            raise
+
+    def _restore(self, root, before):
+        """
+        Write the subtree at a path back to its state before a failed plan, if it changed.
+        """
+        path = '/'.join(root)
+        try:
+            self.invalidate_config_cache()
+            current, _ = self.current_config()
+            if get_node(current, root) != before:
+                self.logger.warning(f'Rolling back a partly applied plan at /{path}')
+                self._write_operation({'op': 'PATCH' if root else 'POST', 'path': path, 'value': before})
+        except requests.RequestException as e:
+            self.logger.error(f'Error rolling back a partly applied plan at /{path}: {e}')
+
+    def apply_config(self, config, dry_run=False):
+        """
+        Change the Caddy configuration to the given one with the smallest set of narrow operations,
+        instead of reloading the whole configuration.
+
+        Args:
+            config (dict): The desired Caddy configuration.
+            dry_run (bool, optional): Only plan the operations without applying them. Defaults to False.
+
+        Returns:
+            list: The planned operations.
+
+        Raises:
+            ConfigConflictError: If the configuration changed while the operations were applied.
+        """
+        current, etag = self.current_config()
+        operations = diff_config(current, config)
+        self.logger.debug(f'Planned {len(operations)} operations to apply config')
+        if not dry_run:
+            self.apply_operations(operations, etag, current)
+        return operations
+
     def add_to_config_array(self, path, items):
         """
         Add one or more items to an array in the Caddy configuration.
@@ -93,7 +796,9 @@ class CaddyAPI:
         if not isinstance(items, list):
             raise ValueError("Items must be a list.")
         endpoint = f'/config/{path}/...'
+        self._mutating(path)
         response = self._request('POST', endpoint, json=items)
+        self._mutated(path)
         return response.status_code
 
     def insert_into_config_array(self, path, index, item):
@@ -109,8 +814,10 @@ class CaddyAPI:
             dict: The updated Caddy configuration.
         """
         endpoint = f'/config/{path}/{index}'
+        self._mutating(path)
         response = self._request('PUT', endpoint, json=item)
-        return response.json()
+        self._mutated(path)
+        return self._json(response)
     
     def replace_config_value(self, path, value):
         """
@@ -124,8 +831,10 @@ class CaddyAPI:
             dict: The updated Caddy configuration.
         """
         endpoint = f'/config/{path}'
+        self._mutating(path)
         response = self._request('PATCH', endpoint, json=value)
-        return response.json()
+        self._mutated(path)
+        return self._json(response)
     
     def delete_config(self, path=None):
         """
@@ -138,51 +847,88 @@ class CaddyAPI:
             dict: The response from the Caddy server.
         """
         endpoint = f'/config/{path}' if path else '/config'
+        self._mutating(path or '')
         response = self._request('DELETE', endpoint)
-        return response.json()
+        self._mutated(path or '')
+        return self._json(response)
     
-    def adapt_config(self, config, content_type='application/json'):
+    def adapt_config(self, config, content_type='application/json', raw=False):
         """
         Adapt a configuration to Caddy JSON without loading or running it.
+        Adapting is deterministic, so results are cached by content: adapting unchanged text again
+        is answered from the adapt cache, and concurrent identical requests share one call to Caddy.
 
         Args:
             config (dict or str): The new Caddy configuration. Can be a dictionary or a string (e.g., Caddyfile).
             content_type (str): The Content-Type header specifying the configuration format. Defaults to 'application/json'.
+            raw (bool, optional): Return the encoded response instead of the parsed value. Defaults to False.
 
         Returns:
-            dict: The adapted Caddy configuration.
+            dict: The adapted Caddy configuration under `result`, with Caddy's `warnings` if there are any.
+            RawResponse: The encoded response, if `raw` is set.
         """
-        headers = self.headers.copy()
-        headers['Content-Type'] = content_type
-        response = self._request('POST', '/adapt', json=config if content_type == 'application/json' else None, data=config if content_type != 'application/json' else None, headers=headers)
-        return response.json()
+        def adapt():
+            headers = self.headers.copy()
+            headers['Content-Type'] = content_type
+            response = self._request('POST', '/adapt', json=config if content_type == 'application/json' else None, data=config if content_type != 'application/json' else None, headers=headers)
+            return response.content
+
+        if self.adapt_cache is None:
+            body = adapt()
+        else:
+            key = cache_key(config, content_type)
+            body = self.adapt_cache.get(key)
+            if body is None:
+                body = self.singleflight.do(('adapt', key), adapt)
+                self.adapt_cache.put(key, body)
+        if raw:
+            return RawResponse(body)
+        # Decode a fresh copy so callers can modify it without touching the cache
+        return json_codec.loads(body)
     
-    def get_pki_ca(self, id):
+    def get_pki_ca(self, id, raw=False):
         """
         Get the current PKI CA configuration.
+        Args:
+            id (str): The ID of the CA.
+            raw (bool, optional): Stream the undecoded response body instead. Defaults to False.
         Returns:
             dict: The current PKI CA configuration.
+            RawResponse: The streamed response body, if `raw` is set.
         """
+        if raw:
+            return self._request_raw('GET', f'/pki/ca/{id}')
         response = self._request('GET', f'/pki/ca/{id}')
-        return response.json()
+        return json_codec.loads(response.content)
     
-    def get_pki_ca_certificates(self, id):
+    def get_pki_ca_certificates(self, id, raw=False):
         """
         Get the current PKI CA certificates.
+        Args:
+            id (str): The ID of the CA.
+            raw (bool, optional): Stream the undecoded response body instead. Defaults to False.
         Returns:
             dict: The current PKI CA certificates.
+            RawResponse: The streamed response body, if `raw` is set.
         """
+        if raw:
+            return self._request_raw('GET', f'/pki/ca/{id}/certificates')
         response = self._request('GET', f'/pki/ca/{id}/certificates')
-        return response.json()
+        return json_codec.loads(response.content)
     
-    def get_proxy_upstreams(self):
+    def get_proxy_upstreams(self, raw=False):
         """
         Get the current proxy upstreams.
+        Args:
+            raw (bool, optional): Stream the undecoded response body instead. Defaults to False.
         Returns:
             dict: The current proxy upstreams.
+            RawResponse: The streamed response body, if `raw` is set.
         """
+        if raw:
+            return self._request_raw('GET', '/reverse_proxy/upstreams')
         response = self._request('GET', '/reverse_proxy/upstreams')
-        return response.json()
+        return json_codec.loads(response.content)
     
     def load_config(self, config, content_type='application/json'):
         """
@@ -197,8 +943,10 @@ class CaddyAPI:
         """
         headers = self.headers.copy()
         headers['Content-Type'] = content_type
+        self._mutating('')
         response = self._request('POST', '/load', json=config if content_type == 'application/json' else None, data=config if content_type != 'application/json' else None, headers=headers)
-        return response.json()
+        self._mutated('')
+        return self._json(response)
 
     def stop_server(self):
         """
@@ -207,8 +955,10 @@ class CaddyAPI:
         Returns:
             dict: The response from the Caddy server.
         """
+        self._mutating('')
         response = self._request('POST', '/stop')
-        return response.json()
+        self._mutated('')
+        return self._json(response)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""
+    Fleet management for many Caddy instances.
+    This module provides a class `CaddyFleet`, a registry of named `CaddyAPI` clients.
+    Calls are fanned out to a selection of nodes concurrently on a bounded worker pool,
+    so an operation across the fleet takes about as long as the slowest node.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from caddy_api import CaddyAPI
+
+
+class CaddyFleet:
+    """
+    A registry of named CaddyAPI clients with parallel fan-out.
+
+    Attributes:
+        nodes (dict): Mapping of node name to its CaddyAPI client.
+        groups (dict): Mapping of group name to the set of node names in it.
+        max_workers (int): The size of the worker pool used for fan-out.
+        timeout (float): The default per-node timeout in seconds.
+    """
+
+    def __init__(self, max_workers=16, timeout=30):
+        """
+        Initializes an empty fleet.
+
+        Args:
+            max_workers (int, optional): The size of the worker pool. Defaults to 16.
+            timeout (float, optional): The default per-node timeout in seconds. Defaults to 30.
+        """
+        self.nodes = {}
+        self.groups = {}
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='caddy-fleet')
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_spec(cls, spec, **kwargs):
+        """
+        Build a fleet from a specification string, e.g. the `CADDY_FLEET` environment variable.
+
+        The specification is either a JSON object mapping node names to a URL or to an object with
+        `url`, optional `auth_token` and optional `groups`, or a comma separated list of `name=url` pairs.
+
+        Args:
+            spec (str): The fleet specification.
+            **kwargs: Additional arguments passed to the CaddyFleet constructor.
+
+        Returns:
+            CaddyFleet: The fleet with all nodes registered.
+        """
+        fleet = cls(**kwargs)
+        if not spec:
+            return fleet
+        spec = spec.strip()
+        if spec.startswith('{'):
+            for name, node in json.loads(spec).items():
+                if isinstance(node, str):
+                    node = {'url': node}
+                fleet.add_node(name, node['url'], node.get('auth_token'), node.get('groups'))
+        else:
+            for entry in spec.split(','):
+                if not entry.strip():
+                    continue
+                name, _, url = entry.partition('=')
+                if not url:
+                    raise ValueError(f'Invalid fleet entry "{entry}", expected name=url.')
+                fleet.add_node(name.strip(), url.strip())
+        return fleet
+
+    def add_node(self, name, api, auth_token=None, groups=None):
+        """
+        Register a node in the fleet.
+
+        Args:
+            name (str): The unique name of the node.
+            api (CaddyAPI or str): The client for the node, or the URL of its admin API.
+            auth_token (str, optional): The auth token, if `api` is a URL.
+            groups (list, optional): The groups the node belongs to.
+        """
+        if not isinstance(api, CaddyAPI):
+            api = CaddyAPI(api, auth_token)
+        self.nodes[name] = api
+        for group in groups or []:
+            self.groups.setdefault(group, set()).add(name)
+        self.logger.debug(f'Registered fleet node {name} at {api.api_url}')
+
+    def remove_node(self, name):
+        """
+        Remove a node from the fleet and from all of its groups.
+
+        Args:
+            name (str): The name of the node.
+        """
+        self.nodes.pop(name, None)
+        for members in self.groups.values():
+            members.discard(name)
+
+    def describe(self):
+        """
+        Describe the registered nodes.
+
+        Returns:
+            dict: Mapping of node name to its admin API URL and groups.
+        """
+        return {
+            name: {
+                'api_url': api.api_url,
+                'groups': sorted(group for group, members in self.groups.items() if name in members),
+            }
+            for name, api in self.nodes.items()
+        }
+
+    def select(self, nodes=None, group=None):
+        """
+        Resolve a selection of nodes.
+
+        Args:
+            nodes (list, optional): Explicit node names. Defaults to all nodes.
+            group (str, optional): Restrict the selection to the members of a group.
+
+        Returns:
+            list: The selected node names.
+
+        Raises:
+            KeyError: If an unknown node or group is requested.
+        """
+        if group is not None and group not in self.groups:
+            raise KeyError(f'Unknown fleet group: {group}')
+        selected = list(nodes) if nodes else list(self.nodes)
+        unknown = [name for name in selected if name not in self.nodes]
+        if unknown:
+            raise KeyError(f'Unknown fleet nodes: {", ".join(unknown)}')
+        if group is not None:
+            selected = [name for name in selected if name in self.groups[group]]
+        return selected
+
+    def call(self, method, *args, nodes=None, group=None, timeout=None, **kwargs):
+        """
+        Call a CaddyAPI method on the selected nodes in parallel.
+
+        Args:
+            method (str or callable): The name of the CaddyAPI method, or a callable taking the client.
+            *args: Positional arguments for the method.
+            nodes (list, optional): Explicit node names. Defaults to all nodes.
+            group (str, optional): Restrict the call to the members of a group.
+            timeout (float, optional): The per-node timeout in seconds. Defaults to the fleet timeout.
+            **kwargs: Keyword arguments for the method.
+
+        Returns:
+            dict: Mapping of node name to a dict with the `status`, the `result` or `error`, and the
+            `elapsed` time in seconds. The status is "ok" or "error" for nodes that answered in time,
+            "timeout" for nodes the call was never sent to, and "pending" for nodes that did not answer
+            in time but may still complete the call, e.g. apply a write.
+        """
+        selected = self.select(nodes, group)
+        timeout = self.timeout if timeout is None else timeout
+
+        def run(name):
+            api = self.nodes[name]
+            start = time.monotonic()
+            try:
+                result = method(api) if callable(method) else getattr(api, method)(*args, **kwargs)
+                return {'status': 'ok', 'result': result, 'elapsed': time.monotonic() - start}
+            except Exception as e:
+                self.logger.error(f'Fleet call on node {name} failed: {e}')
+                return {'status': 'error', 'error': str(e), 'elapsed': time.monotonic() - start}
+
+        futures = {self.executor.submit(run, name): name for name in selected}
+        # Nodes beyond the pool size queue behind the first wave, so allow one timeout per wave
+        waves = -(-len(selected) // self.max_workers) or 1
+        done, pending = wait(futures, timeout=timeout * waves)
+        results = {}
+        for future in done:
+            results[futures[future]] = future.result()
+        for future in pending:
+            # A running call cannot be cancelled, and its outcome is unknown until it returns
+            if future.cancel():
+                results[futures[future]] = {'status': 'timeout', 'error': f'Not sent within {timeout}s'}
+            else:
+                results[futures[future]] = {'status': 'pending',
+                                            'error': f'No response within {timeout}s, the call may still complete'}
+        return {name: results[name] for name in selected}
+
+    def shutdown(self):
+        """
+        Stop the worker pool without waiting for outstanding calls.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,247 @@
+"""
+    Transport helpers for the Caddy admin API client.
+    This module provides a `requests` adapter for Caddy's unix socket admin endpoint
+    (e.g. `unix//run/caddy/admin.sock`), a circuit breaker that makes calls fail fast
+    while the admin API is unreachable, and a single-flight group that coalesces
+    concurrent identical reads into one upstream request.
+"""
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+UNIX_SCHEME = 'unix/'
+# Caddy accepts these Host values on unix socket admin endpoints
+UNIX_BASE_URL = 'http://127.0.0.1'
+
+
+class CaddyUnavailableError(requests.ConnectionError):
+    """
+    Raised without contacting Caddy while the circuit breaker is open.
+    """
+
+
+def parse_admin_address(api_url):
+    """
+    Split a Caddy admin address into the base URL requests are made to and the unix socket path, if any.
+
+    Args:
+        api_url (str): The admin address, either an HTTP(S) URL or `unix/<path>`.
+
+    Returns:
+        tuple: The base URL and the socket path, which is None for TCP addresses.
+    """
+    if api_url.startswith(UNIX_SCHEME):
+        return UNIX_BASE_URL, api_url[len(UNIX_SCHEME):]
+    return api_url.rstrip('/'), None
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    An HTTP connection over a unix domain socket.
+    """
+
+    def __init__(self, socket_path, *args, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    """
+    A connection pool whose connections all go to one unix domain socket.
+    """
+
+    def __init__(self, socket_path, **kwargs):
+        self.socket_path = socket_path
+        super().__init__('127.0.0.1', **kwargs)
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return UnixHTTPConnection(
+            self.socket_path,
+            host=self.host,
+            port=self.port,
+            timeout=self.timeout.connect_timeout,
+            **self.conn_kw,
+        )
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """
+    A `requests` adapter that sends every request to a unix domain socket.
+    """
+
+    def __init__(self, socket_path, pool_maxsize=10, **kwargs):
+        self.socket_path = socket_path
+        self._pool = UnixHTTPConnectionPool(socket_path, maxsize=pool_maxsize)
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize, **kwargs)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool
+
+    def get_connection(self, url, proxies=None):
+        return self._pool
+
+    def close(self):
+        self._pool.close()
+        super().close()
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an unreachable service until it has had time to recover.
+
+    After `threshold` consecutive failures the breaker opens and calls fail immediately.
+    Once `reset_timeout` seconds have passed a single trial call is let through; its
+    success closes the breaker again, its failure keeps it open for another period.
+
+    Attributes:
+        threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a trial call.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=10):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        str: "closed", "open" or "half-open".
+        """
+        if self.opened_at is None:
+            return 'closed'
+        if self._trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """
+        Check whether a call may be made now.
+
+        Returns:
+            bool: False while the breaker is open or a trial call is in flight.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        """
+        Record a call that reached the service.
+        """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """
+        Record a call that could not reach the service.
+        """
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def stats(self):
+        """
+        Get the state of the breaker.
+
+        Returns:
+            dict: The state and the number of consecutive failures.
+        """
+        return {'state': self.state, 'failures': self.failures}
+
+
+class _Call:
+    """
+    An in-flight call shared by the callers of a SingleFlight key.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls so only one of them does the work.
+
+    Callers that ask for a key while a call for it is in flight wait for that call and
+    receive its result, or its exception, instead of starting their own.
+
+    Attributes:
+        leaders (int): The number of calls that did the work.
+        coalesced (int): The number of calls that shared the result of another call.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Run a function once for all concurrent callers with the same key.
+
+        Args:
+            key (hashable): Identifies identical calls.
+            function (callable): The call to make, without arguments.
+
+        Returns:
+            any: The result of the function, shared by all concurrent callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        """
+        Get the coalescing counters.
+
+        Returns:
+            dict: The number of leading and coalesced calls and of calls in flight.
+        """
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
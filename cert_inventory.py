@@ -0,0 +1,335 @@
+"""
+    Inventory of the certificates of Caddy's PKI app.
+    `CertificateInventory` discovers the certificate authorities configured in `apps/pki`, fetches
+    them from `/pki/ca/<id>` in parallel, parses their PEM certificates once and keeps them in an
+    index sorted by expiry, so "what expires within N days" is a binary search. The inventory is
+    refreshed in a background thread, so dashboards never wait for Caddy.
+"""
+import base64
+import bisect
+import calendar
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The CA Caddy uses for `tls internal`, which exists without being configured in `apps/pki`
+DEFAULT_CA = 'local'
+PEM_CERTIFICATE = re.compile(rb'-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----', re.DOTALL)
+# The DER encoding of the commonName attribute type, 2.5.4.3
+COMMON_NAME_OID = b'\x55\x04\x03'
+
+
+class CertificateParseError(ValueError):
+    """
+    Raised when a certificate is not valid DER.
+    """
+
+
+def pem_certificates(pem):
+    """
+    Extract the certificates of a PEM chain.
+
+    Args:
+        pem (str or bytes): One or more PEM encoded certificates.
+
+    Returns:
+        list: The DER encoding of every certificate, in order.
+    """
+    if isinstance(pem, str):
+        pem = pem.encode('ascii')
+    return [base64.b64decode(b''.join(body.split())) for body in PEM_CERTIFICATE.findall(pem or b'')]
+
+
+def _read(der, offset):
+    """
+    Read one DER element.
+
+    Returns:
+        tuple: The tag, the offset of the content and the offset after the element.
+    """
+    try:
+        tag = der[offset]
+        length = der[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7f
+            length = int.from_bytes(der[offset:offset + size], 'big')
+            offset += size
+    except IndexError:
+        raise CertificateParseError('truncated DER element')
+    if offset + length > len(der):
+        raise CertificateParseError('truncated DER element')
+    return tag, offset, offset + length
+
+
+def _children(der, start, end):
+    while start < end:
+        tag, content, start = _read(der, start)
+        yield tag, content, start
+
+
+def _parse_time(tag, value):
+    text = value.decode('ascii').rstrip('Z')
+    if tag == 0x17:
+        # UTCTime has a two digit year, 50-99 meaning 1950-1999
+        year = int(text[:2])
+        text = str(1900 + year if year >= 50 else 2000 + year) + text[2:]
+    elif tag != 0x18:
+        raise CertificateParseError(f'unexpected time tag: {tag:#x}')
+    return calendar.timegm(time.strptime(text[:14], '%Y%m%d%H%M%S'))
+
+
+def _common_name(der, start, end):
+    for _, set_start, set_end in _children(der, start, end):
+        for _, attribute_start, attribute_end in _children(der, set_start, set_end):
+            values = list(_children(der, attribute_start, attribute_end))
+            if len(values) == 2 and der[values[0][1]:values[0][2]] == COMMON_NAME_OID:
+                return der[values[1][1]:values[1][2]].decode('utf-8', 'replace')
+    return None
+
+
+def parse_certificate(der):
+    """
+    Read the fields of a certificate needed for the inventory, without a crypto library.
+
+    Args:
+        der (bytes): The DER encoded X.509 certificate.
+
+    Returns:
+        dict: The `subject` and `issuer` common names, the `serial` in hex, `not_before` and
+            `not_after` as UNIX times and the SHA-256 `fingerprint`.
+
+    Raises:
+        CertificateParseError: If the certificate is not valid DER.
+    """
+    _, start, end = _read(der, 0)
+    _, start, end = _read(der, start)
+    fields = [(tag, content, field_end) for tag, content, field_end in _children(der, start, end)]
+    # The version is an optional, explicitly tagged first field
+    if fields and fields[0][0] == 0xa0:
+        fields = fields[1:]
+    if len(fields) < 5:
+        raise CertificateParseError('incomplete TBSCertificate')
+    serial, _, issuer, validity, subject = fields[:5]
+    not_before, not_after = [_parse_time(tag, der[content:field_end])
+                             for tag, content, field_end in _children(der, validity[1], validity[2])]
+    return {
+        'subject': _common_name(der, subject[1], subject[2]),
+        'issuer': _common_name(der, issuer[1], issuer[2]),
+        'serial': der[serial[1]:serial[2]].hex(),
+        'not_before': not_before,
+        'not_after': not_after,
+        'fingerprint': hashlib.sha256(der).hexdigest(),
+    }
+
+
+class CertificateInventory:
+    """
+    The certificates of all CAs of one Caddy instance, indexed by expiry and refreshed in the background.
+
+    Attributes:
+        caddy_api (CaddyAPI): The client of the Caddy instance.
+        interval (float): Seconds between refreshes.
+        refreshed_at (float): The UNIX time of the last refresh, or None before the first one.
+        errors (dict): Mapping of CA ID to the error of its last fetch, for CAs that failed.
+    """
+
+    def __init__(self, caddy_api, interval=3600, max_workers=8):
+        """
+        Initializes an empty, stopped inventory.
+
+        Args:
+            caddy_api (CaddyAPI): The client of the Caddy instance.
+            interval (float, optional): Seconds between refreshes. Defaults to 3600.
+            max_workers (int, optional): The number of CAs fetched concurrently. Defaults to 8.
+        """
+        self.caddy_api = caddy_api
+        self.interval = interval
+        self.max_workers = max_workers
+        self.refreshed_at = None
+        self.errors = {}
+        self.logger = logging.getLogger(__name__)
+        self._parsed = {}
+        self._entries = []
+        self._expiries = []
+        self._authorities = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start refreshing in a daemon thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='cert-inventory', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop refreshing.
+        """
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Do not repeat a refresh made on demand just before the thread started
+            age = time.time() - self.refreshed_at if self.refreshed_at is not None else self.interval
+            if age < self.interval:
+                self._stop.wait(self.interval - age)
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f'Error refreshing the certificate inventory: {e}')
+                self._stop.wait(self.interval)
+
+    def discover(self):
+        """
+        Get the IDs of the certificate authorities configured in `apps/pki`.
+
+        Returns:
+            list: The configured CA IDs.
+        """
+        config, _ = self.caddy_api.current_config()
+        pki = ((config or {}).get('apps') or {}).get('pki') or {}
+        return list(pki.get('certificate_authorities') or {})
+
+    def _parse(self, pem):
+        certificates = []
+        for der in pem_certificates(pem):
+            digest = hashlib.sha256(der).digest()
+            # Certificates rarely change between refreshes, so each is parsed only once
+            parsed = self._parsed.get(digest)
+            if parsed is None:
+                parsed = self._parsed[digest] = parse_certificate(der)
+            certificates.append(parsed)
+        return certificates
+
+    def _fetch(self, ca_id):
+        authority = self.caddy_api.get_pki_ca(ca_id)
+        entries = []
+        for role in ('root', 'intermediate'):
+            for certificate in self._parse(authority.get(f'{role}_certificate')):
+                entries.append(dict(certificate, ca=ca_id, ca_name=authority.get('name'), role=role))
+        return authority, entries
+
+    def refresh(self):
+        """
+        Fetch all certificate authorities in parallel and rebuild the expiry index.
+
+        Returns:
+            int: The number of certificates in the inventory.
+        """
+        with self._refresh_lock:
+            ca_ids = self.discover()
+            implicit = DEFAULT_CA not in ca_ids
+            if implicit:
+                ca_ids.insert(0, DEFAULT_CA)
+            entries, authorities, errors = [], {}, {}
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ca_ids)),
+                                    thread_name_prefix='cert-inventory') as executor:
+                futures = {ca_id: executor.submit(self._fetch, ca_id) for ca_id in ca_ids}
+                for ca_id, future in futures.items():
+                    try:
+                        authority, certificates = future.result()
+                    except Exception as e:
+                        errors[ca_id] = str(e)
+                        continue
+                    authorities[ca_id] = {key: authority.get(key) for key in
+                                          ('id', 'name', 'root_common_name', 'intermediate_common_name')}
+                    entries.extend(certificates)
+            # Caddy only provisions the default CA when something uses it
+            if implicit:
+                errors.pop(DEFAULT_CA, None)
+            entries.sort(key=lambda entry: entry['not_after'])
+            with self._lock:
+                self._entries = entries
+                self._expiries = [entry['not_after'] for entry in entries]
+                self._authorities = authorities
+                self.errors = errors
+                self.refreshed_at = time.time()
+                # Forget parsed certificates that are no longer served
+                fingerprints = {entry['fingerprint'] for entry in entries}
+                self._parsed = {digest: parsed for digest, parsed in self._parsed.items()
+                                if parsed['fingerprint'] in fingerprints}
+        self.logger.debug('Refreshed certificate inventory: %d certificates of %d CAs', len(entries), len(authorities))
+        return len(entries)
+
+    def ensure_fresh(self):
+        """
+        Refresh now if the inventory was never refreshed, and start the background refresh.
+        """
+        if self.refreshed_at is None:
+            self.refresh()
+        self.start()
+
+    @staticmethod
+    def _with_remaining(entries, now):
+        return [dict(entry, expires_in=entry['not_after'] - now) for entry in entries]
+
+    def certificates(self, ca_id=None):
+        """
+        Get the certificates in the inventory, soonest expiring first.
+
+        Args:
+            ca_id (str, optional): Only the certificates of this CA.
+
+        Returns:
+            list: The certificates, with the seconds until they expire in `expires_in`.
+        """
+        with self._lock:
+            entries = self._entries
+        if ca_id is not None:
+            entries = [entry for entry in entries if entry['ca'] == ca_id]
+        return self._with_remaining(entries, time.time())
+
+    def expiring(self, within, now=None):
+        """
+        Get the certificates that expire within a time span, including those already expired.
+
+        Args:
+            within (float): The time span in seconds.
+            now (float, optional): The UNIX time to count from. Defaults to now.
+
+        Returns:
+            list: The certificates, soonest expiring first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entries, expiries = self._entries, self._expiries
+        return self._with_remaining(entries[:bisect.bisect_right(expiries, now + within)], now)
+
+    def authorities(self):
+        """
+        Get the certificate authorities found by the last refresh.
+
+        Returns:
+            dict: Mapping of CA ID to its ID, name and common names.
+        """
+        with self._lock:
+            return dict(self._authorities)
+
+    def stats(self):
+        """
+        Get the size and state of the inventory.
+
+        Returns:
+            dict: The number of CAs and certificates, the soonest expiry, the refresh time and errors.
+        """
+        with self._lock:
+            return {
+                'authorities': len(self._authorities),
+                'certificates': len(self._entries),
+                'next_expiry': self._expiries[0] if self._expiries else None,
+                'refreshed_at': self.refreshed_at,
+                'interval': self.interval,
+                'errors': dict(self.errors),
+            }
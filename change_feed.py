@@ -0,0 +1,286 @@
+"""
+    Live feed of Caddy configuration changes.
+    `ChangeFeed` watches the configuration of one Caddy instance through the client's config cache.
+    Caddy has no cheap "not modified" answer, so a poll that reaches Caddy downloads the whole
+    configuration and only an unchanged Etag spares decoding and diffing it. The feed therefore
+    backs off while the configuration is quiet and wakes up immediately after a change made
+    through Birdie. Every change becomes a
+    numbered generation holding the structural diff from the previous one, so subscribers receive
+    only the operations that changed, over Server-Sent Events or long-polling, and resume from the
+    last generation they saw.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from config_diff import diff_config
+from sse import AsyncSubscriber, EventBroker, format_event
+
+
+class ChangeFeed:
+    """
+    Numbered generations of the configuration of one Caddy instance and the diffs between them.
+
+    Attributes:
+        caddy_api (CaddyAPI): The client of the watched Caddy instance.
+        min_interval (float): Seconds between polls after a change.
+        max_interval (float): The longest time between polls while nothing changes.
+        interval (float): The current time between polls.
+        epoch (str): Identifies this feed, so generations of another process or a restarted one
+            are not mistaken for its own.
+        generation (int): The number of the latest generation, 0 for the configuration first seen.
+        broker (EventBroker): Publishes every change to SSE subscribers.
+    """
+
+    def __init__(self, caddy_api, min_interval=1, max_interval=15, history=256):
+        """
+        Initializes a stopped feed.
+
+        Args:
+            caddy_api (CaddyAPI): The client of the Caddy instance to watch.
+            min_interval (float, optional): Seconds between polls after a change. Defaults to 1.
+            max_interval (float, optional): The longest time between polls. Defaults to 15.
+            history (int, optional): The number of changes kept for resuming clients. Defaults to 256.
+        """
+        self.caddy_api = caddy_api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.epoch = uuid.uuid4().hex[:8]
+        self.generation = 0
+        self.polls = 0
+        self.broker = EventBroker()
+        self.logger = logging.getLogger(__name__)
+        self._changes = deque(maxlen=history)
+        self._config = None
+        self._etag = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        caddy_api.add_mutation_listener(self._on_mutation)
+
+    def _on_mutation(self, paths):
+        self.poke()
+
+    def poke(self):
+        """
+        Poll now instead of waiting for the current interval, e.g. after a change made through Birdie.
+        """
+        self._wake.set()
+
+    def start(self):
+        """
+        Start watching in a daemon thread, if it is not running yet. The first poll is made before
+        returning, so clients always have a generation to resume from.
+        """
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if not self._started:
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.logger.error(f'Error polling the Caddy config: {e}')
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching.
+        """
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._wake.wait(self.interval):
+                self._wake.clear()
+                self.interval = self.min_interval
+            if self._stop.is_set():
+                break
+            try:
+                changed = self.poll()
+            except Exception as e:
+                self.logger.error(f'Error polling the Caddy config: {e}')
+                changed = False
+            # Poll quickly while the configuration is changing, back off while it is quiet
+            self.interval = self.min_interval if changed else min(self.interval * 2, self.max_interval)
+
+    def poll(self):
+        """
+        Read the configuration through the client's cache and record a generation if its Etag changed.
+
+        Returns:
+            bool: Whether the configuration changed.
+        """
+        config, etag = self.caddy_api.current_config()
+        self.polls += 1
+        with self._lock:
+            if not self._started:
+                self._config, self._etag, self._started = config, etag, True
+                return False
+            if config is self._config or (etag is not None and etag == self._etag):
+                return False
+            previous, previous_etag = self._config, self._etag
+        operations = diff_config(previous, config)
+        with self._changed:
+            self._config, self._etag = config, etag
+            if not operations:
+                return False
+            self.generation += 1
+            change = {
+                'generation': self.generation,
+                'timestamp': time.time(),
+                'etag': etag,
+                'previous_etag': previous_etag,
+                'operations': operations,
+            }
+            self._changes.append(change)
+            # Publishing under the lock keeps the events in order with the backlog of new subscribers
+            self.broker.publish(change, event='change', id=self.event_id(self.generation))
+            self._changed.notify_all()
+        self.logger.debug('Config changed, generation %d with %d operations', self.generation, len(operations))
+        return True
+
+    def event_id(self, generation):
+        """
+        Get the SSE event ID of a generation, which clients send back as `Last-Event-ID`.
+        """
+        return f'{self.epoch}:{generation}'
+
+    def _parse_since(self, since):
+        """
+        Get the generation a client resumes from, or None if it is not one of this feed.
+        """
+        if since is None or since == '':
+            return self.generation
+        epoch, _, generation = str(since).rpartition(':')
+        if epoch and epoch != self.epoch:
+            return None
+        try:
+            generation = int(generation)
+        except ValueError:
+            return None
+        return generation if 0 <= generation <= self.generation else None
+
+    def _changes_after(self, generation):
+        """
+        Get the changes after a generation, or None if some of them are no longer kept.
+        """
+        if generation == self.generation:
+            return []
+        oldest = self._changes[0]['generation'] if self._changes else self.generation + 1
+        if generation + 1 < oldest:
+            return None
+        return [change for change in self._changes if change['generation'] > generation]
+
+    def _reset(self):
+        return {'epoch': self.epoch, 'generation': self.generation, 'etag': self._etag}
+
+    def changes(self, since=None, timeout=0):
+        """
+        Get the changes after a generation, waiting up to `timeout` seconds for one (long-polling).
+
+        Args:
+            since (str or int, optional): The last generation the client saw, as a number or an
+                event ID. Defaults to the latest generation.
+            timeout (float, optional): Seconds to wait for a change if there is none yet. Defaults to 0.
+
+        Returns:
+            dict: The `epoch`, latest `generation` and `etag`, and either the `changes` or `reset`
+                set to True if the client must reload the whole configuration, because the
+                generation is unknown or its changes are no longer kept.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            generation = self._parse_since(since)
+            while generation is not None:
+                changes = self._changes_after(generation)
+                if changes is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if changes or remaining <= 0:
+                    return dict(self._reset(), changes=changes)
+                self._changed.wait(remaining)
+            return dict(self._reset(), reset=True)
+
+    async def changes_async(self, since=None, timeout=0):
+        """
+        Get the changes after a generation like `changes`, but wait for one on the running event
+        loop instead of in a thread, so a long-poll costs no thread while it waits.
+
+        Args:
+            since (str or int, optional): The last generation the client saw. Defaults to the latest.
+            timeout (float, optional): Seconds to wait for a change if there is none yet. Defaults to 0.
+
+        Returns:
+            dict: The changes, as returned by `changes`.
+        """
+        result = self.changes(since)
+        if since is None or timeout <= 0 or result.get('changes') or result.get('reset'):
+            return result
+        deadline = time.monotonic() + timeout
+        # Subscribing before looking at the changes again means none can slip in between
+        subscriber = self.broker.subscribe(AsyncSubscriber(1))
+        try:
+            while True:
+                result = self.changes(since)
+                remaining = deadline - time.monotonic()
+                if result.get('changes') or result.get('reset') or remaining <= 0:
+                    return result
+                try:
+                    await subscriber.get(remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.broker.unsubscribe(subscriber)
+
+    def subscribe(self, since=None, subscriber=None):
+        """
+        Subscribe to the changes as Server-Sent Events, starting after a generation.
+
+        Args:
+            since (str or int, optional): The last generation the client saw. Defaults to the latest.
+            subscriber (AsyncSubscriber, optional): The queue to subscribe, for clients served on an
+                event loop. Defaults to a new thread-safe queue.
+
+        Returns:
+            tuple: The subscriber queue and the encoded events to send first: the missed changes,
+                or a `reset` event if they cannot be replayed.
+        """
+        with self._lock:
+            subscriber = self.broker.subscribe(subscriber)
+            generation = self._parse_since(since)
+            changes = self._changes_after(generation) if generation is not None else None
+            if changes is None:
+                initial = [format_event(self._reset(), event='reset', id=self.event_id(self.generation))]
+            else:
+                initial = [format_event(change, event='change', id=self.event_id(change['generation']))
+                           for change in changes]
+            if not initial:
+                initial = [format_event(self._reset(), event='ready', id=self.event_id(self.generation))]
+        return subscriber, initial
+
+    def stats(self):
+        """
+        Get the state of the feed.
+
+        Returns:
+            dict: The epoch, generation, kept changes, subscribers, polls and the current interval.
+        """
+        return {
+            'epoch': self.epoch,
+            'generation': self.generation,
+            'kept_changes': len(self._changes),
+            'subscribers': self.broker.subscriber_count,
+            'polls': self.polls,
+            'interval': self.interval,
+            'running': bool(self._thread and self._thread.is_alive()),
+        }
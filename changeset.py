@@ -0,0 +1,204 @@
+"""
+    Transactional batches of Caddy configuration changes.
+    A `ChangeSet` queues many mutations and commits them as a single guarded request:
+    the queued operations are applied to a local copy of the narrowest subtree they touch,
+    which is then written back with one `PATCH` carrying the snapshot's Etag as `If-Match`.
+    Caddy therefore reprovisions once per change set instead of once per mutation.
+"""
+import copy
+import logging
+import threading
+import time
+import uuid
+import requests
+from caddy_api import ConfigConflictError
+from config_diff import apply_operations, common_root, relative_operations
+from config_tree import get_node, split_path
+
+
+class ChangeSetError(ValueError):
+    """
+    Raised when an invalid operation is queued or a change set cannot be committed.
+    """
+
+
+class ChangeSet:
+    """
+    A batch of configuration mutations committed atomically.
+
+    Attributes:
+        id (str): The unique ID of the change set.
+        created_at (float): The time the change set was opened.
+        operations (list): The queued operations, in the format of `config_diff.diff_config`.
+        committed (bool): Whether the change set has been committed.
+    """
+
+    def __init__(self, caddy_api, id=None):
+        """
+        Opens an empty change set.
+
+        Args:
+            caddy_api (CaddyAPI): The client the change set is committed through.
+            id (str, optional): The ID of the change set. Defaults to a random ID.
+        """
+        self.caddy_api = caddy_api
+        self.id = id or uuid.uuid4().hex
+        self.created_at = time.time()
+        self.operations = []
+        self.committed = False
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _queue(self, operation):
+        if not isinstance(operation['path'], str) or not split_path(operation['path']):
+            raise ChangeSetError('A non-empty "path" is required.')
+        operation['path'] = '/'.join(split_path(operation['path']))
+        with self._lock:
+            if self.committed:
+                raise ChangeSetError(f'Change set {self.id} is already committed.')
+            self.operations.append(operation)
+
+    def replace(self, path, value):
+        """
+        Queue replacing the value at a path, like `CaddyAPI.replace_config_value`.
+        """
+        self._queue({'op': 'PATCH', 'path': path, 'value': value})
+
+    def set(self, path, value):
+        """
+        Queue setting the value at a path, creating it if needed.
+        """
+        self._queue({'op': 'POST', 'path': path, 'value': value})
+
+    def add(self, path, items):
+        """
+        Queue appending items to an array, like `CaddyAPI.add_to_config_array`.
+        """
+        if not isinstance(items, list):
+            raise ChangeSetError('Items must be a list.')
+        self._queue({'op': 'POST', 'path': f'{path.rstrip("/")}/...', 'value': items})
+
+    def insert(self, path, index, item):
+        """
+        Queue inserting an item into an array, like `CaddyAPI.insert_into_config_array`.
+        """
+        if not isinstance(index, int):
+            raise ChangeSetError('Index must be an integer.')
+        self._queue({'op': 'PUT', 'path': f'{path.rstrip("/")}/{index}', 'value': item})
+
+    def delete(self, path):
+        """
+        Queue deleting the value at a path, like `CaddyAPI.delete_config`.
+        """
+        self._queue({'op': 'DELETE', 'path': path})
+
+    def queue(self, data):
+        """
+        Queue an operation described by a request body.
+
+        Args:
+            data (dict): The operation, with `action` one of "replace", "set", "add", "insert" or "delete",
+                the `path` and the `value`, `items` or `index` and `item` it needs.
+
+        Raises:
+            ChangeSetError: If the operation is malformed.
+        """
+        action = data.get('action')
+        try:
+            if action == 'replace':
+                self.replace(data['path'], data['value'])
+            elif action == 'set':
+                self.set(data['path'], data['value'])
+            elif action == 'add':
+                self.add(data['path'], data['items'])
+            elif action == 'insert':
+                self.insert(data['path'], data['index'], data['item'])
+            elif action == 'delete':
+                self.delete(data['path'])
+            else:
+                raise ChangeSetError(f'Unknown action: {action}')
+        except KeyError as e:
+            raise ChangeSetError(f'"{e.args[0]}" is required for action "{action}".')
+
+    def describe(self):
+        """
+        Describe the change set.
+
+        Returns:
+            dict: The ID, creation time, commit state and queued operations.
+        """
+        with self._lock:
+            return {
+                'id': self.id,
+                'created_at': self.created_at,
+                'committed': self.committed,
+                'operations': list(self.operations),
+            }
+
+    def _write(self, root, value, etag=None):
+        operation = {'op': 'PATCH' if root else 'POST', 'path': '/'.join(root), 'value': value}
+        self.caddy_api.apply_operations([operation], etag)
+
+    def commit(self):
+        """
+        Apply all queued operations with a single request guarded by the snapshot's Etag.
+        If the request fails after Caddy may have changed, the previous subtree is restored.
+
+        Returns:
+            dict: The number of operations committed, the path that was written and whether
+            a rollback was performed.
+
+        Raises:
+            ConfigConflictError: If the configuration changed since the change set read it, or
+                changed again before a failed commit could be rolled back.
+            ChangeSetError: If the operations do not apply to the current configuration.
+        """
+        with self._lock:
+            if self.committed:
+                raise ChangeSetError(f'Change set {self.id} is already committed.')
+            operations = list(self.operations)
+            self.committed = True
+        if not operations:
+            return {'committed': 0, 'path': None, 'rolled_back': False}
+
+        root = common_root(operations)
+        try:
+            current, etag = self.caddy_api.current_config()
+            before = get_node(current, root)
+            after = apply_operations(copy.deepcopy(before), relative_operations(operations, root))
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            with self._lock:
+                self.committed = False
+            raise ChangeSetError(f'Operations do not apply to the current configuration: {e!r}')
+        except requests.RequestException:
+            with self._lock:
+                self.committed = False
+            raise
+
+        self.logger.debug(f'Committing {len(operations)} operations at /{"/".join(root)}')
+        try:
+            self._write(root, after, etag)
+        except ConfigConflictError:
+            with self._lock:
+                self.committed = False
+            raise
+        except requests.RequestException:
+            # The request may still have reached Caddy, so find out what state it is in
+            current, current_etag = self.caddy_api.current_config()
+            if current_etag != etag:
+                if get_node(current, root) == after:
+                    return {'committed': len(operations), 'path': '/'.join(root), 'rolled_back': False}
+                self.logger.warning(f'Rolling back change set {self.id} at /{"/".join(root)}')
+                try:
+                    # Only undo the write if nobody else changed the config since it was read
+                    self._write(root, before, current_etag)
+                except ConfigConflictError:
+                    with self._lock:
+                        self.committed = False
+                    raise ConfigConflictError(f'Change set {self.id} was not rolled back: the configuration at '
+                                              f'/{"/".join(root)} changed again while it was committed.')
+                return {'committed': 0, 'path': '/'.join(root), 'rolled_back': True}
+            with self._lock:
+                self.committed = False
+            raise
+        return {'committed': len(operations), 'path': '/'.join(root), 'rolled_back': False}
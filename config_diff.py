@@ -0,0 +1,229 @@
+"""
+    Minimal-diff planning between two Caddy JSON configurations.
+    `diff_config` computes the smallest set of admin API operations (PATCH/PUT/POST/DELETE
+    against `/config/<path>`) that turns the current configuration into the desired one,
+    touching the narrowest paths possible instead of reloading the whole config.
+    Entries of `routes` arrays are matched by their `@id`, or by their matchers when they
+    have none, so inserting or removing a route does not rewrite its neighbours.
+"""
+import json
+
+IDENTIFIED_ARRAYS = frozenset({'routes'})
+
+
+def join_path(path, key):
+    """
+    Append a segment to a configuration path.
+
+    Args:
+        path (str): The parent path, '' for the root.
+        key (str or int): The key or array index.
+
+    Returns:
+        str: The child path.
+    """
+    return f'{path}/{key}' if path else str(key)
+
+
+def route_identity(item):
+    """
+    Get the stable identity of an entry of a `routes` array.
+
+    Args:
+        item (any): The array entry.
+
+    Returns:
+        str: The `@id` of the entry or the encoding of its matchers, None if it has neither.
+    """
+    if not isinstance(item, dict):
+        return None
+    if '@id' in item:
+        return f'@id:{item["@id"]}'
+    if 'match' in item:
+        return 'match:' + json.dumps(item['match'], sort_keys=True, separators=(',', ':'))
+    return None
+
+
+def _identities(items):
+    """
+    Get the identities of all entries of an array, if every entry has a unique one.
+    """
+    keys = [route_identity(item) for item in items]
+    if None in keys or len(set(keys)) != len(keys):
+        return None
+    return keys
+
+
+def _diff(current, desired, path, operations):
+    if current == desired:
+        return
+    if isinstance(current, dict) and isinstance(desired, dict):
+        for key in current:
+            if key not in desired:
+                operations.append({'op': 'DELETE', 'path': join_path(path, key)})
+        for key, value in desired.items():
+            if key not in current:
+                operations.append({'op': 'PUT', 'path': join_path(path, key), 'value': value})
+            else:
+                _diff(current[key], value, join_path(path, key), operations)
+    elif isinstance(current, list) and isinstance(desired, list):
+        _diff_list(current, desired, path, operations)
+    elif not path:
+        # POST to the root replaces the whole config
+        operations.append({'op': 'POST', 'path': '', 'value': desired})
+    else:
+        operations.append({'op': 'PATCH', 'path': path, 'value': desired})
+
+
+def _diff_list(current, desired, path, operations):
+    name = path.rsplit('/', 1)[-1]
+    current_keys = _identities(current) if name in IDENTIFIED_ARRAYS else None
+    desired_keys = _identities(desired) if current_keys is not None else None
+    if desired_keys is None:
+        if len(current) == len(desired):
+            for index, (old, new) in enumerate(zip(current, desired)):
+                _diff(old, new, join_path(path, index), operations)
+        else:
+            operations.append({'op': 'PATCH', 'path': path, 'value': desired})
+        return
+
+    desired_set = set(desired_keys)
+    current_set = set(current_keys)
+    if [key for key in current_keys if key in desired_set] != [key for key in desired_keys if key in current_set]:
+        # Entries were reordered, which cannot be expressed as inserts and deletes
+        operations.append({'op': 'PATCH', 'path': path, 'value': desired})
+        return
+
+    # Delete from the end so the remaining indices stay valid
+    for index in reversed(range(len(current))):
+        if current_keys[index] not in desired_set:
+            operations.append({'op': 'DELETE', 'path': join_path(path, index)})
+
+    # The array now holds the kept entries in desired order, so inserting in ascending
+    # order keeps every prefix equal to the desired prefix
+    length = len(current) - sum(1 for key in current_keys if key not in desired_set)
+    appended = []
+    for index, key in enumerate(desired_keys):
+        if key in current_set:
+            continue
+        if index >= length:
+            appended.append(desired[index])
+        else:
+            operations.append({'op': 'PUT', 'path': join_path(path, index), 'value': desired[index]})
+            length += 1
+    if appended:
+        operations.append({'op': 'POST', 'path': join_path(path, '...'), 'value': appended})
+
+    current_by_key = dict(zip(current_keys, current))
+    for index, key in enumerate(desired_keys):
+        if key in current_set:
+            _diff(current_by_key[key], desired[index], join_path(path, index), operations)
+
+
+def diff_config(current, desired, path=''):
+    """
+    Plan the admin API operations that turn the current configuration into the desired one.
+
+    Args:
+        current (any): The current configuration, or the subtree at `path`.
+        desired (any): The desired configuration, or the subtree at `path`.
+        path (str, optional): The configuration path both values live at. Defaults to the root.
+
+    Returns:
+        list: The operations in the order they must be applied. Each is a dict with the HTTP `op`,
+        the configuration `path` and, except for DELETE, the `value` to send.
+    """
+    operations = []
+    if current is None and not path:
+        if desired is not None:
+            operations.append({'op': 'POST', 'path': '', 'value': desired})
+        return operations
+    _diff(current, desired, path.strip('/'), operations)
+    return operations
+
+
+def common_root(operations):
+    """
+    Get the deepest path that contains every node changed by the operations, so they can be
+    written as one value at that path.
+
+    Args:
+        operations (list): The operations, as returned by `diff_config`.
+
+    Returns:
+        list: The segments of the path, empty for the root.
+    """
+    root = None
+    for operation in operations:
+        parts = [part for part in operation['path'].split('/') if part]
+        # An operation changes the container its last segment lives in; appends change the array itself
+        parent = parts[:-1]
+        if root is None:
+            root = parent
+        else:
+            common = 0
+            while common < min(len(root), len(parent)) and root[common] == parent[common]:
+                common += 1
+            root = root[:common]
+    return root or []
+
+
+def relative_operations(operations, root):
+    """
+    Rewrite operations to apply to the subtree at a path that contains them, see `common_root`.
+
+    Args:
+        operations (list): The operations, as returned by `diff_config`.
+        root (list): The segments of the path of the subtree.
+
+    Returns:
+        list: The operations, with paths relative to the subtree.
+    """
+    return [
+        {**operation, 'path': '/'.join([part for part in operation['path'].split('/') if part][len(root):])}
+        for operation in operations
+    ]
+
+
+def apply_operations(tree, operations):
+    """
+    Apply planned operations to a local config tree, the way Caddy would apply them.
+
+    Args:
+        tree (any): The configuration to change. It is modified in place where possible.
+        operations (list): The operations, as returned by `diff_config`.
+
+    Returns:
+        any: The changed configuration, which is a new object if the root was replaced.
+    """
+    for operation in operations:
+        parts = [part for part in operation['path'].split('/') if part]
+        method = operation['op']
+        if not parts:
+            tree = None if method == 'DELETE' else operation['value']
+            continue
+        append = parts[-1] == '...'
+        if append:
+            parts = parts[:-1]
+            if not parts:
+                tree.extend(operation['value'])
+                continue
+        parent = tree
+        for part in parts[:-1]:
+            parent = parent[int(part)] if isinstance(parent, list) else parent[part]
+        key = int(parts[-1]) if isinstance(parent, list) else parts[-1]
+        if method == 'DELETE':
+            del parent[key]
+        elif append:
+            parent[key].extend(operation['value'])
+        elif method == 'PUT' and isinstance(parent, list):
+            parent.insert(key, operation['value'])
+        elif method == 'POST' and isinstance(parent, dict) and isinstance(parent.get(key), list):
+            parent[key].append(operation['value'])
+        elif method == 'PUT' and key in parent:
+            raise ValueError(f'key already exists: {operation["path"]}')
+        elif method == 'PATCH' and isinstance(parent, dict) and key not in parent:
+            raise KeyError(f'key does not exist: {operation["path"]}')
+        else:
+            parent[key] = operation['value']
+    return tree
@@ -0,0 +1,496 @@
+"""
+    On-disk history of Caddy configurations.
+    `ConfigHistory` records a revision of the configuration around every change made through a
+    `CaddyAPI` client. Revisions are stored as a Merkle tree in SQLite: every object and array is
+    a zlib-compressed, content-addressed object that refers to its children by hash, so a subtree
+    that did not change between revisions (e.g. 10k untouched routes) is stored once, and storage
+    grows with what changed rather than with the size of the configuration. Long arrays are split
+    into chunks, so changing one route stores one chunk of references rather than all of them.
+"""
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from config_diff import IDENTIFIED_ARRAYS, diff_config, join_path, route_identity
+from config_tree import ConfigPathError, split_path
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS revisions (
+    rev INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    root TEXT NOT NULL,
+    etag TEXT,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS revisions_created_at ON revisions (created_at);
+'''
+
+# SQLite limits the number of bound parameters of a statement
+QUERY_CHUNK = 500
+# The average number of entries per chunk of a long array, and the most a chunk holds
+ARRAY_CHUNK = 64
+MAX_ARRAY_CHUNK = 4 * ARRAY_CHUNK
+
+
+class RevisionNotFoundError(KeyError):
+    """
+    Raised when a revision does not exist in the history.
+    """
+
+
+def _store_body(body, objects):
+    data = json.dumps(body, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    refs = [child for _, child in body['c']] if body['t'] == 'o' else body['c']
+    objects[digest] = (data, [ref[1] for ref in refs if ref[0] == 'h'], body)
+    return ['h', digest]
+
+
+def _is_boundary(ref):
+    """
+    Whether a chunk ends after an entry. Boundaries depend only on the entry itself, so inserting
+    or removing an entry changes the chunk it is in, not the chunks after it.
+    """
+    digest = ref[1] if ref[0] == 'h' else hashlib.sha256(json.dumps(ref).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % ARRAY_CHUNK == 0
+
+
+def _chunk(refs):
+    chunks, chunk = [], []
+    for ref in refs:
+        chunk.append(ref)
+        if len(chunk) >= MAX_ARRAY_CHUNK or (len(chunk) > 1 and _is_boundary(ref)):
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def encode_tree(node, objects):
+    """
+    Encode a config tree as content-addressed objects.
+
+    Objects and arrays become `{"t": "o"|"a", "c": children}`, where each child is either
+    `["h", <hash>]` for a nested object or array, or `["v", <scalar>]`. Arrays of more than
+    `ARRAY_CHUNK` entries are split into `"a"` chunks of about that size, held by a chunked array
+    `{"t": "c", "c": [<chunk refs>]}`, which is chunked again while it is longer than that.
+
+    Args:
+        node (any): The config tree.
+        objects (dict): Receives the encoded objects as hash: (encoded body, child hashes, body).
+
+    Returns:
+        list: The reference to the node, `["h", <hash>]` or `["v", <scalar>]`.
+    """
+    if isinstance(node, dict):
+        return _store_body({'t': 'o', 'c': [[key, encode_tree(value, objects)] for key, value in node.items()]}, objects)
+    if not isinstance(node, list):
+        return ['v', node]
+    refs = [encode_tree(value, objects) for value in node]
+    if len(refs) <= ARRAY_CHUNK:
+        return _store_body({'t': 'a', 'c': refs}, objects)
+    refs = [_store_body({'t': 'a', 'c': chunk}, objects) for chunk in _chunk(refs)]
+    while len(refs) > ARRAY_CHUNK:
+        refs = [_store_body({'t': 'c', 'c': chunk}, objects) for chunk in _chunk(refs)]
+    return _store_body({'t': 'c', 'c': refs}, objects)
+
+
+class ConfigHistory:
+    """
+    A deduplicated, compressed history of Caddy configurations in SQLite.
+
+    Attributes:
+        caddy_api (CaddyAPI): The client whose configuration is recorded.
+        path (str): The SQLite database file.
+        last_etag (str): The Etag of the most recently recorded configuration.
+    """
+
+    def __init__(self, caddy_api, path, record_changes=True):
+        """
+        Opens or creates the history database.
+
+        Args:
+            caddy_api (CaddyAPI): The client whose configuration is recorded.
+            path (str): The SQLite database file.
+            record_changes (bool, optional): Record a revision around every change made through
+                the client, and the configuration found at startup. Defaults to True.
+        """
+        self.caddy_api = caddy_api
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        row = self._db.execute('SELECT etag FROM revisions ORDER BY rev DESC LIMIT 1').fetchone()
+        self.last_etag = row[0] if row else None
+        self._fetch_queued = False
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='config-history', daemon=True)
+        self._writer.start()
+        if record_changes:
+            caddy_api.add_mutation_listener(self._before_mutation, before=True)
+            caddy_api.add_mutation_listener(self._after_mutation)
+            self._queue_fetch('startup')
+
+    def _before_mutation(self, paths):
+        """
+        Queue the cached configuration as it is before a change, unless it is already recorded.
+        Caddy is never asked for it, so the change is not delayed: the state after every change is
+        recorded by `_after_mutation`, and the cache only adds changes made outside Birdie since.
+        Hashing and storing happen on the writer thread, the cached tree is never modified.
+        """
+        config, etag = self.caddy_api.cached_config()
+        if config is None:
+            return
+        with self._pending_lock:
+            if etag is not None and etag == self.last_etag:
+                return
+            self.last_etag = etag
+        reason = 'before ' + ', '.join(path or '/' for path in paths)
+        self._queue.put((config, etag, reason[:500], time.time()))
+
+    def _after_mutation(self, paths):
+        """
+        Queue reading and recording the configuration a change produced, on the writer thread.
+        """
+        self._queue_fetch('after ' + ', '.join(path or '/' for path in paths))
+
+    def _queue_fetch(self, reason):
+        with self._pending_lock:
+            # One queued read covers every change made before the writer gets to it
+            if self._fetch_queued:
+                return
+            self._fetch_queued = True
+        self._queue.put((None, None, reason[:500], None))
+
+    def _write_loop(self):
+        while True:
+            config, etag, reason, created_at = self._queue.get()
+            try:
+                if created_at is None:
+                    with self._pending_lock:
+                        self._fetch_queued = False
+                    config, etag = self.caddy_api.current_config()
+                    with self._pending_lock:
+                        if etag is not None and etag == self.last_etag:
+                            continue
+                        self.last_etag = etag
+                self.store(config, etag, reason, created_at)
+            except Exception as e:
+                self.logger.error(f'Error recording config revision: {e}')
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Wait until every queued revision is written.
+        """
+        self._queue.join()
+
+    def _existing(self, hashes):
+        existing = set()
+        for start in range(0, len(hashes), QUERY_CHUNK):
+            chunk = hashes[start:start + QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(row[0] for row in self._db.execute(
+                f'SELECT hash FROM objects WHERE hash IN ({placeholders})', chunk))
+        return existing
+
+    def store(self, config, etag=None, reason=None, created_at=None):
+        """
+        Store a configuration as a new revision. Only objects that are not stored yet are written.
+
+        Args:
+            config (any): The configuration.
+            etag (str, optional): The Etag Caddy returned for it.
+            reason (str, optional): Why the revision was recorded.
+            created_at (float, optional): The UNIX time of the revision. Defaults to now.
+
+        Returns:
+            int: The revision number.
+        """
+        objects = {}
+        root = json.dumps(encode_tree(config, objects), separators=(',', ':'))
+        written = 0
+        with self._lock, self._db:
+            # Stored objects imply stored descendants, so only descend into new ones
+            level = [json.loads(root)[1]] if objects else []
+            while level:
+                existing = self._existing(level)
+                new = [digest for digest in dict.fromkeys(level) if digest not in existing]
+                self._db.executemany('INSERT OR IGNORE INTO objects (hash, data) VALUES (?, ?)',
+                                     [(digest, zlib.compress(objects[digest][0], 6)) for digest in new])
+                written += len(new)
+                level = [child for digest in new for child in objects[digest][1]]
+            cursor = self._db.execute(
+                'INSERT INTO revisions (created_at, root, etag, reason) VALUES (?, ?, ?, ?)',
+                (created_at or time.time(), root, etag, reason))
+        self.logger.debug('Recorded config revision %d with %d new of %d objects', cursor.lastrowid, written, len(objects))
+        return cursor.lastrowid
+
+    def record(self, reason='manual'):
+        """
+        Record the current configuration now, unless it is already the latest revision.
+
+        Args:
+            reason (str, optional): Why the revision was recorded. Defaults to "manual".
+
+        Returns:
+            dict: The latest revision.
+        """
+        self.flush()
+        config, etag = self.caddy_api.current_config()
+        with self._pending_lock:
+            changed = etag is None or etag != self.last_etag
+            self.last_etag = etag
+        if changed:
+            self.store(config, etag, reason)
+        return self.revisions(limit=1)[0]
+
+    def _row(self, row):
+        return {'rev': row[0], 'created_at': row[1], 'etag': row[2], 'reason': row[3]}
+
+    def revisions(self, since=None, until=None, limit=100):
+        """
+        List revisions, newest first, optionally within a time range.
+
+        Args:
+            since (float, optional): The earliest UNIX time to include.
+            until (float, optional): The latest UNIX time to include.
+            limit (int, optional): The maximum number of revisions. Defaults to 100.
+
+        Returns:
+            list: The revisions with their number, time, Etag and reason.
+        """
+        query = 'SELECT rev, created_at, etag, reason FROM revisions WHERE created_at >= ? AND created_at <= ? ORDER BY rev DESC LIMIT ?'
+        with self._lock:
+            rows = self._db.execute(query, (since if since is not None else float('-inf'),
+                                            until if until is not None else float('inf'), limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def revision_at(self, timestamp):
+        """
+        Find the revision that was current at a point in time.
+
+        Args:
+            timestamp (float): The UNIX time.
+
+        Returns:
+            dict: The latest revision recorded at or before the time.
+
+        Raises:
+            RevisionNotFoundError: If no revision was recorded by then.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT rev, created_at, etag, reason FROM revisions WHERE created_at <= ? '
+                                   'ORDER BY created_at DESC, rev DESC LIMIT 1', (timestamp,)).fetchone()
+        if row is None:
+            raise RevisionNotFoundError(f'No revision at or before {timestamp}')
+        return self._row(row)
+
+    def _root(self, rev):
+        with self._lock:
+            row = self._db.execute('SELECT root FROM revisions WHERE rev = ?', (rev,)).fetchone()
+        if row is None:
+            raise RevisionNotFoundError(f'Unknown revision: {rev}')
+        return json.loads(row[0])
+
+    def _load_objects(self, hashes, loaded):
+        missing = [digest for digest in dict.fromkeys(hashes) if digest not in loaded]
+        with self._lock:
+            for start in range(0, len(missing), QUERY_CHUNK):
+                chunk = missing[start:start + QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                for digest, data in self._db.execute(f'SELECT hash, data FROM objects WHERE hash IN ({placeholders})', chunk):
+                    loaded[digest] = json.loads(zlib.decompress(data))
+
+    def _materialize(self, ref, memo, loaded=None):
+        """
+        Rebuild the tree of a reference. Objects are fetched level by level, and identical
+        subtrees are built once per `memo`, so two trees built with the same memo share them.
+        """
+        loaded = loaded if loaded is not None else {}
+        level = [ref[1]] if ref[0] == 'h' else []
+        seen = set()
+        while level:
+            level = [digest for digest in dict.fromkeys(level) if digest not in memo and digest not in seen]
+            seen.update(level)
+            self._load_objects(level, loaded)
+            children = []
+            for digest in level:
+                body = loaded[digest]
+                refs = [child for _, child in body['c']] if body['t'] == 'o' else body['c']
+                children.extend(child[1] for child in refs if child[0] == 'h')
+            level = children
+
+        def build(reference):
+            if reference[0] == 'v':
+                return reference[1]
+            digest = reference[1]
+            if digest not in memo:
+                body = loaded[digest]
+                if body['t'] == 'o':
+                    memo[digest] = {key: build(child) for key, child in body['c']}
+                elif body['t'] == 'a':
+                    memo[digest] = [build(child) for child in body['c']]
+                else:
+                    memo[digest] = [value for chunk in body['c'] for value in build(chunk)]
+            return memo[digest]
+
+        return build(ref)
+
+    def _resolve(self, ref, path):
+        """
+        Follow a configuration path through stored objects, loading only the objects on the path.
+        """
+        for part in split_path(path):
+            if ref[0] != 'h':
+                raise ConfigPathError(f'invalid traversal path at: {part}')
+            loaded = {}
+            self._load_objects([ref[1]], loaded)
+            body = loaded[ref[1]]
+            if body['t'] == 'o':
+                children = dict((key, child) for key, child in body['c'])
+                if part not in children:
+                    return ['v', None]
+                ref = children[part]
+            else:
+                try:
+                    ref = self._entries(body, loaded)[int(part)]
+                except (ValueError, IndexError):
+                    raise ConfigPathError(f'invalid array index at: {part}')
+        return ref
+
+    def _entries(self, body, loaded):
+        """
+        Get the references of the entries of an array, loading the chunks of a chunked array.
+        """
+        if body['t'] == 'a':
+            return body['c']
+        self._load_objects([chunk[1] for chunk in body['c']], loaded)
+        return [ref for chunk in body['c'] for ref in self._entries(loaded[chunk[1]], loaded)]
+
+    def get(self, rev, path=None, memo=None):
+        """
+        Get the configuration of a revision.
+
+        Args:
+            rev (int): The revision number.
+            path (str, optional): A configuration path within the revision.
+            memo (dict, optional): Shares identical subtrees between trees built with the same memo.
+
+        Returns:
+            any: The configuration, or its value at the path.
+        """
+        return self._materialize(self._resolve(self._root(rev), path), memo if memo is not None else {})
+
+    def _diff_refs(self, current, desired, path, operations, loaded, memo):
+        """
+        Diff two references like `config_diff.diff_config`, descending only into subtrees whose
+        hashes differ, so only the objects on changed paths are loaded.
+        """
+        if current == desired:
+            return
+        if current[0] == 'h' and desired[0] == 'h':
+            self._load_objects([current[1], desired[1]], loaded)
+            old, new = loaded[current[1]], loaded[desired[1]]
+            if old['t'] == new['t'] == 'o':
+                old_children, new_children = dict(old['c']), dict(new['c'])
+                for key in old_children:
+                    if key not in new_children:
+                        operations.append({'op': 'DELETE', 'path': join_path(path, key)})
+                for key, child in new_children.items():
+                    if key not in old_children:
+                        operations.append({'op': 'PUT', 'path': join_path(path, key),
+                                           'value': self._materialize(child, memo, loaded)})
+                    else:
+                        self._diff_refs(old_children[key], child, join_path(path, key), operations, loaded, memo)
+                return
+            old_entries = self._entries(old, loaded) if old['t'] != 'o' else None
+            new_entries = self._entries(new, loaded) if new['t'] != 'o' else None
+            if old_entries is not None and new_entries is not None and len(old_entries) == len(new_entries):
+                changed = [index for index, (a, b) in enumerate(zip(old_entries, new_entries)) if a != b]
+                # With the same identities in the same order, diff_config compares entries pairwise
+                identified = path.rsplit('/', 1)[-1] in IDENTIFIED_ARRAYS
+                if not identified or all(
+                        route_identity(self._materialize(old_entries[index], memo, loaded))
+                        == route_identity(self._materialize(new_entries[index], memo, loaded)) for index in changed):
+                    for index in changed:
+                        self._diff_refs(old_entries[index], new_entries[index], join_path(path, index), operations, loaded, memo)
+                    return
+        operations.extend(diff_config(self._materialize(current, memo, loaded),
+                                      self._materialize(desired, memo, loaded), path))
+
+    def _diff_current(self, rev, reverse=False):
+        config, etag = self.caddy_api.current_config()
+        objects = {}
+        current = encode_tree(config, objects)
+        loaded = {digest: body for digest, (_, _, body) in objects.items()}
+        stored = self._root(rev)
+        operations = []
+        if reverse:
+            self._diff_refs(current, stored, '', operations, loaded, {})
+        else:
+            self._diff_refs(stored, current, '', operations, loaded, {})
+        return operations, etag
+
+    def diff(self, from_rev, to_rev=None):
+        """
+        Get the operations that turn one revision into another. Subtrees with the same hash in
+        both are skipped without being loaded, so the cost follows the size of the change.
+
+        Args:
+            from_rev (int): The revision to start from.
+            to_rev (int, optional): The target revision. Defaults to the current configuration.
+
+        Returns:
+            list: The operations, as planned by `config_diff.diff_config`.
+        """
+        if to_rev is None:
+            return self._diff_current(from_rev)[0]
+        operations = []
+        self._diff_refs(self._root(from_rev), self._root(to_rev), '', operations, {}, {})
+        return operations
+
+    def rollback(self, rev, dry_run=False):
+        """
+        Change the Caddy configuration back to a revision with the smallest set of operations.
+
+        Args:
+            rev (int): The revision to roll back to.
+            dry_run (bool, optional): Only plan the operations. Defaults to False.
+
+        Returns:
+            list: The planned operations.
+
+        Raises:
+            ConfigConflictError: If the configuration changed while the operations were applied.
+        """
+        operations, etag = self._diff_current(rev, reverse=True)
+        self.logger.debug(f'Planned {len(operations)} operations to roll back to revision {rev}')
+        if not dry_run:
+            self.caddy_api.apply_operations(operations, etag)
+        return operations
+
+    def stats(self):
+        """
+        Get the size of the history.
+
+        Returns:
+            dict: The number of revisions and objects and the compressed bytes stored.
+        """
+        with self._lock:
+            revisions = self._db.execute('SELECT COUNT(*) FROM revisions').fetchone()[0]
+            objects, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM objects').fetchone()
+        return {'revisions': revisions, 'objects': objects, 'bytes': size, 'queued': self._queue.qsize()}
@@ -0,0 +1,212 @@
+"""
+    Helpers for working with an in-memory copy of a Caddy JSON configuration.
+    Caddy addresses configuration values with slash separated paths
+    (e.g. `apps/http/servers/srv0/routes/0`), where numeric segments index into arrays.
+    The functions in this module resolve those paths against a parsed config tree
+    so that reads can be answered locally instead of by the Caddy admin API, and
+    page, project and filter large nodes so only the requested part is encoded.
+"""
+import fnmatch
+import re
+
+
+class ConfigPathError(KeyError):
+    """
+    Raised when a configuration path cannot be traversed in a config tree.
+    """
+
+
+def split_path(path):
+    """
+    Split a Caddy configuration path into its segments.
+
+    Args:
+        path (str or None): The configuration path, with or without leading/trailing slashes.
+
+    Returns:
+        list: The non-empty path segments.
+    """
+    if not path:
+        return []
+    return [part for part in path.strip('/').split('/') if part]
+
+
+def get_node(tree, path):
+    """
+    Resolve a configuration path against a config tree.
+
+    Mirrors Caddy's traversal rules: objects are indexed by key and arrays by integer index.
+    A missing key on the last segment resolves to None, like Caddy does for unset values.
+
+    Args:
+        tree (any): The parsed configuration.
+        path (str or list): The configuration path or its pre-split segments.
+
+    Returns:
+        any: The value at the given path. Callers must treat it as read-only.
+
+    Raises:
+        ConfigPathError: If the path traverses through a missing or scalar value.
+    """
+    parts = split_path(path) if isinstance(path, str) or path is None else path
+    node = tree
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if isinstance(node, dict):
+            if part not in node:
+                if last:
+                    return None
+                raise ConfigPathError(f'invalid traversal path at: {"/".join(parts[:i + 1])}')
+            node = node[part]
+        elif isinstance(node, list):
+            try:
+                index = int(part)
+            except ValueError:
+                raise ConfigPathError(f'invalid array index at: {"/".join(parts[:i + 1])}')
+            if index < 0 or index >= len(node):
+                raise ConfigPathError(f'array index out of bounds at: {"/".join(parts[:i + 1])}')
+            node = node[index]
+        else:
+            raise ConfigPathError(f'invalid traversal path at: {"/".join(parts[:i + 1])}')
+    return node
+
+
+TRUNCATED = '$truncated'
+COUNT = '$count'
+
+
+def truncate(node, depth):
+    """
+    Limit the depth of a config tree, replacing deeper objects and arrays with their child count.
+
+    Args:
+        node (any): The value to truncate.
+        depth (int): The number of levels to keep. At 0 an object or array is replaced by
+            `{"$truncated": "object" or "array", "$count": <number of children>}`.
+
+    Returns:
+        any: The truncated value, sharing unmodified scalars with `node`.
+    """
+    if isinstance(node, dict):
+        if depth <= 0:
+            return {TRUNCATED: 'object', COUNT: len(node)}
+        return {key: truncate(value, depth - 1) for key, value in node.items()}
+    if isinstance(node, list):
+        if depth <= 0:
+            return {TRUNCATED: 'array', COUNT: len(node)}
+        return [truncate(value, depth - 1) for value in node]
+    return node
+
+
+def project(node, fields):
+    """
+    Keep only some keys of an object, e.g. `@id` and `match` of a route.
+
+    Args:
+        node (any): The value to project. Values other than objects are returned as they are.
+        fields (list): The keys to keep.
+
+    Returns:
+        any: The projected value.
+    """
+    if not isinstance(node, dict):
+        return node
+    return {field: node[field] for field in fields if field in node}
+
+
+def compile_filters(filters):
+    """
+    Compile matcher field filters into one regular expression per field.
+
+    Args:
+        filters (dict): Mapping of matcher field, e.g. `host` or `path`, to shell-style patterns,
+            e.g. `*.example.com`.
+
+    Returns:
+        dict: Mapping of matcher field to the `match` method of the compiled expression.
+    """
+    return {
+        field: re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns) or '(?!)').match
+        for field, patterns in filters.items()
+    }
+
+
+def matches_filters(route, filters):
+    """
+    Check whether a route has a matcher set that satisfies matcher field filters.
+
+    A matcher set satisfies the filters if, for every field, one of its values matches one of
+    the patterns. Different fields must be satisfied by the same matcher set.
+
+    Args:
+        route (any): The route.
+        filters (dict): Filters compiled with `compile_filters`.
+
+    Returns:
+        bool: Whether the route matches.
+    """
+    if not isinstance(route, dict):
+        return False
+    for matcher in route.get('match') or []:
+        if not isinstance(matcher, dict):
+            continue
+        for field, match in filters.items():
+            values = matcher.get(field)
+            if values is None:
+                break
+            if not isinstance(values, list):
+                values = [values]
+            if not any(isinstance(value, str) and match(value) for value in values):
+                break
+        else:
+            return True
+    return False
+
+
+def query_node(node, offset=0, limit=None, fields=None, depth=None, filters=None):
+    """
+    Read a page of a config node without copying or encoding the parts that are not returned.
+
+    Arrays are filtered with `matches_filters` and paged with `offset` and `limit`; the other
+    options apply to each returned item. Objects and scalars are returned as a single `value`.
+
+    Args:
+        node (any): The config node, e.g. `apps/http/servers/srv0/routes`.
+        offset (int, optional): The number of matching array items to skip. Defaults to 0.
+        limit (int, optional): The maximum number of array items to return. Defaults to all.
+        fields (list, optional): The keys to keep of each object, see `project`.
+        depth (int, optional): The number of levels to keep below each item, see `truncate`.
+        filters (dict, optional): Mapping of matcher field to shell-style patterns for arrays of routes,
+            see `matches_filters`.
+
+    Returns:
+        dict: For arrays the `total` number of items, the number `matched` by the filters,
+            the `offset` and `limit`, and the `items` with their array `indexes`.
+            For objects the `total` number of keys and the `value`; for scalars the `value`.
+    """
+    def shape(value):
+        if fields:
+            value = project(value, fields)
+        if depth is not None:
+            value = truncate(value, depth)
+        return value
+
+    if isinstance(node, list):
+        if filters:
+            compiled = compile_filters(filters)
+            indexes = [index for index, item in enumerate(node) if matches_filters(item, compiled)]
+        else:
+            indexes = range(len(node))
+        end = len(indexes) if limit is None else offset + limit
+        page = indexes[offset:end]
+        return {
+            'total': len(node),
+            'matched': len(indexes),
+            'offset': offset,
+            'limit': limit,
+            'indexes': list(page),
+            'items': [shape(node[index]) for index in page],
+        }
+    if isinstance(node, dict):
+        return {'total': len(node), 'value': shape(node)}
+    return {'value': node}
@@ -0,0 +1,220 @@
+"""
+    JSON encoding and decoding for Birdie.
+    Every JSON body Birdie sends or receives, to and from Caddy as well as its own clients, goes
+    through this module. It uses `orjson` when it is installed, which is several times faster on
+    large configurations, and the standard library otherwise; set `BIRDIE_JSON_BACKEND=stdlib` to
+    force the fallback. Encodings of values that never change, such as a subtree of a cached
+    configuration, can be remembered under a key so sending them again costs no encoding at all.
+"""
+import dataclasses
+import datetime
+import decimal
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None and os.getenv('BIRDIE_JSON_BACKEND', 'orjson') != 'stdlib' else 'stdlib'
+
+
+def _default(value):
+    """
+    Encode the values the JSON types do not cover, as Flask's default provider does.
+    """
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+if BACKEND == 'orjson':
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def _encode(value):
+        try:
+            return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # orjson rejects what the standard library accepts, e.g. integers beyond 64 bits
+            return _stdlib_dumps(value)
+
+    _decode = orjson.loads
+else:
+    _encode = _stdlib_dumps
+    _decode = json.loads
+
+
+class _Memo:
+    """
+    Remembered encodings, keyed by what they encode and bounded by entries and bytes.
+    The least recently used encodings are evicted first.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def remove(self, key):
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._bytes -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits}
+
+
+_memo = _Memo()
+
+
+def dumps(value, sort_keys=False, indent=None, **kwargs):
+    """
+    Encode a value as JSON, compact unless it is indented.
+
+    Args:
+        value (any): The value.
+        sort_keys (bool, optional): Sort the keys of objects. Defaults to False.
+        indent (int, optional): Indent nested values by this many spaces. Defaults to compact output.
+        **kwargs: Other `json.dumps` options. Passing any encodes with the standard library.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    if not kwargs and not sort_keys and indent is None:
+        return _encode(value)
+    if BACKEND == 'orjson' and not kwargs and indent in (None, 2):
+        option = _ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0) | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(value, default=_default, option=option)
+        except TypeError:
+            pass
+    kwargs.setdefault('default', _default)
+    kwargs.setdefault('ensure_ascii', False)
+    if indent is None:
+        kwargs.setdefault('separators', (',', ':'))
+    return json.dumps(value, sort_keys=sort_keys, indent=indent, **kwargs).encode('utf-8')
+
+
+def loads(data):
+    """
+    Decode JSON.
+
+    Args:
+        data (bytes or str): The JSON.
+
+    Returns:
+        any: The decoded value.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    return _decode(data)
+
+
+def remember(key, value, data=None):
+    """
+    Remember the encoding of a value that never changes under a key, so `recall` returns it
+    without encoding. The key must name the value rather than the object holding it, e.g. a config
+    snapshot and a path in it: the snapshot is replaced, never modified, and forgets its keys when
+    it is. Keying by object identity instead would return stale bytes once the object is modified.
+
+    Args:
+        key (hashable): What the value is.
+        value (any): The value.
+        data (bytes, optional): Its JSON encoding, if it is already known. Defaults to encoding it now.
+
+    Returns:
+        bytes: The encoding.
+    """
+    if data is None:
+        data = _encode(value)
+    if key is not None:
+        _memo.put(key, data)
+    return data
+
+
+def recall(key):
+    """
+    Get a remembered encoding.
+
+    Args:
+        key (hashable): The key it was remembered under.
+
+    Returns:
+        bytes: The encoding, or None if it is not remembered.
+    """
+    return _memo.get(key) if key is not None else None
+
+
+def forget(key):
+    """
+    Forget a remembered encoding. Forgetting a key that is not remembered, or None, does nothing.
+
+    Args:
+        key (hashable): The key it was remembered under.
+    """
+    if key is not None:
+        _memo.remove(key)
+
+
+def forget_all():
+    """
+    Forget every remembered encoding.
+    """
+    _memo.clear()
+
+
+def stats():
+    """
+    Get the backend and the counters of the remembered encodings.
+
+    Returns:
+        dict: The `backend` name and the `remembered` entries, bytes and hits.
+    """
+    return {'backend': BACKEND, 'remembered': _memo.stats()}
@@ -0,0 +1,246 @@
+"""
+    Minimal Prometheus-style metrics for Birdie.
+    This module provides counters, gauges and histograms with labels, and a registry that renders
+    them in the Prometheus text exposition format for the `/metrics` endpoint. Recording a value
+    is a dictionary lookup and an addition under a lock, so instrumenting hot paths stays cheap.
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Base class of the metric types, holding one child per combination of label values.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Get the child metric for the given label values, in the order of `labelnames`.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def expose(self):
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns:
+            str: The HELP and TYPE lines followed by one line per sample.
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, values, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, e.g. of requests or errors.
+    """
+
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        """
+        Increment the unlabelled counter.
+        """
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield '', values, None, child.value
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, e.g. the number of requests in flight.
+    """
+
+    type = 'gauge'
+
+    def dec(self, amount=1):
+        """
+        Decrement the unlabelled gauge.
+        """
+        self.labels().dec(amount)
+
+    def set(self, value):
+        """
+        Set the unlabelled gauge.
+        """
+        self.labels().set(value)
+
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, e.g. latencies or payload sizes, in cumulative buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        """
+        Observe a value on the unlabelled histogram.
+        """
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', values, f'le="{_format_value(float(bound))}"', cumulative
+            yield '_sum', values, None, total
+            yield '_count', values, None, cumulative
+
+
+class Registry:
+    """
+    A collection of metrics and of collectors that report values computed on demand.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+
+    def add_collector(self, collector, key=None):
+        """
+        Add a callable that is asked for samples whenever the metrics are exposed.
+
+        Args:
+            collector (callable): Returns an iterable of (name, type, help, labels dict, value) tuples.
+            key (hashable, optional): Replaces the collector previously added with the same key,
+                so re-created components do not report the same series twice.
+        """
+        with self._lock:
+            self._collectors[key if key is not None else collector] = collector
+
+    def remove_collector(self, collector):
+        """
+        Remove a collector added with `add_collector`.
+        """
+        with self._lock:
+            for key, registered in list(self._collectors.items()):
+                if registered == collector:
+                    del self._collectors[key]
+
+    def expose(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        blocks = [metric.expose() for metric in list(self._metrics.values())]
+        # Samples of the same name must be grouped, even when several collectors report it
+        collected = {}
+        for collector in list(self._collectors.values()):
+            for name, type, help, labels, value in collector():
+                if name not in collected:
+                    collected[name] = [f'# HELP {name} {help}', f'# TYPE {name} {type}']
+                collected[name].append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        blocks.extend('\n'.join(lines) for lines in collected.values())
+        return '\n'.join(blocks) + '\n'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,190 @@
+"""
+    Server-side compilation of site records into Caddy routes.
+    The builders here produce the same JSON as `returnProxyHandle` and `returnStaticRouteHandle` in
+    `static/js/routes.js`, from records with the same fields as the drag and drop workspace:
+    `siteURL`, and `proxyURL` for reverse proxies or `folderPath` and `browseable` for static sites.
+    Records are read incrementally from NDJSON or CSV streams, so imports of thousands of sites
+    never hold the whole upload in memory.
+"""
+import csv
+import re
+import json_codec
+
+ROUTE_TYPES = {
+    'reverse_proxy': 'reverse_proxy',
+    'reverseproxy': 'reverse_proxy',
+    'proxy': 'reverse_proxy',
+    'static': 'static',
+    'staticroute': 'static',
+    'file_server': 'static',
+}
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+HOST = re.compile(r'^(\*\.)?[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)*(:\d{1,5})?$', re.IGNORECASE)
+DIAL = re.compile(r'^[^\s/]+:\d{1,5}$|^unix/\S+$')
+
+
+class RouteCompileError(ValueError):
+    """
+    Raised when a site record cannot be compiled into a route.
+    """
+
+
+def proxy_route(site_url, proxy_url):
+    """
+    Build a reverse proxy route, as `returnProxyHandle` does.
+
+    Args:
+        site_url (str): The host the route matches.
+        proxy_url (str): The dial address of the upstream, e.g. `10.0.0.5:8080`.
+
+    Returns:
+        dict: The route.
+    """
+    return {
+        'handle': [{
+            'handler': 'subroute',
+            'routes': [{'handle': [{'handler': 'reverse_proxy', 'upstreams': [{'dial': proxy_url}]}]}],
+        }],
+        'match': [{'host': [site_url]}],
+        'terminal': True,
+    }
+
+
+def static_route(site_url, folder_path=None, browseable=False):
+    """
+    Build a static file server route, as `returnStaticRouteHandle` does.
+
+    Args:
+        site_url (str): The host the route matches.
+        folder_path (str, optional): The root folder of the site. Defaults to Caddy's working directory.
+        browseable (bool, optional): Whether directory listings are enabled. Defaults to False.
+
+    Returns:
+        dict: The route.
+    """
+    file_server = {'handler': 'file_server', 'hide': ['./Caddyfile']}
+    if browseable:
+        file_server['browse'] = {}
+    handle = [{'handler': 'vars', 'root': folder_path}, file_server] if folder_path else [file_server]
+    return {
+        'handle': [{'handler': 'subroute', 'routes': [{'handle': handle}]}],
+        'match': [{'host': [site_url]}],
+        'terminal': True,
+    }
+
+
+def _text(record, key):
+    value = record.get(key)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise RouteCompileError(f'"{key}" must be a string.')
+    return value.strip()
+
+
+def _boolean(record, key):
+    value = record.get(key, False)
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RouteCompileError(f'"{key}" must be a boolean, got "{value}".')
+
+
+def compile_route(record):
+    """
+    Validate a site record and compile it into a route.
+
+    Args:
+        record (dict): The site: `type` ("reverse_proxy" or "static", defaults to "reverse_proxy"
+            when `proxyURL` is set), `siteURL`, and `proxyURL` or `folderPath` and `browseable`.
+
+    Returns:
+        dict: The route.
+
+    Raises:
+        RouteCompileError: If the record is invalid.
+    """
+    if not isinstance(record, dict):
+        raise RouteCompileError('A record must be an object.')
+    site_url = _text(record, 'siteURL').lower()
+    if not site_url:
+        raise RouteCompileError('"siteURL" is required.')
+    if not HOST.match(site_url):
+        raise RouteCompileError(f'"siteURL" is not a valid host: {site_url}')
+    route_type = _text(record, 'type').lower() or ('reverse_proxy' if record.get('proxyURL') else 'static')
+    if route_type not in ROUTE_TYPES:
+        raise RouteCompileError(f'Unknown route type: {route_type}')
+    if ROUTE_TYPES[route_type] == 'reverse_proxy':
+        proxy_url = _text(record, 'proxyURL')
+        if not proxy_url:
+            raise RouteCompileError('"proxyURL" is required for a reverse proxy.')
+        if not DIAL.match(proxy_url):
+            raise RouteCompileError(f'"proxyURL" must be a host:port dial address: {proxy_url}')
+        return proxy_route(site_url, proxy_url)
+    return static_route(site_url, _text(record, 'folderPath') or None, _boolean(record, 'browseable'))
+
+
+def iter_lines(stream, chunk_size=65536):
+    """
+    Split a binary stream into lines, reading it in chunks.
+
+    Args:
+        stream (file-like): The stream, e.g. `request.stream`.
+        chunk_size (int, optional): The number of bytes read at a time. Defaults to 64 KiB.
+
+    Yields:
+        bytes: The next line, including its line ending.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+
+def read_records(stream, format='ndjson'):
+    """
+    Read site records from an NDJSON or CSV stream without reading the whole stream.
+
+    CSV files need a header row naming the record fields, e.g. `type,siteURL,proxyURL`.
+
+    Args:
+        stream (file-like): The binary stream.
+        format (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+
+    Yields:
+        tuple: The line number of the record and either the record or the RouteCompileError
+            that describes why it could not be read.
+    """
+    if format == 'ndjson':
+        for number, line in enumerate(iter_lines(stream), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json_codec.loads(line)
+            except ValueError as e:
+                yield number, RouteCompileError(f'Invalid JSON: {e}')
+    elif format == 'csv':
+        reader = csv.DictReader(line.decode('utf-8-sig' if number == 0 else 'utf-8')
+                                for number, line in enumerate(iter_lines(stream)))
+        try:
+            for record in reader:
+                if None in record:
+                    yield reader.line_num, RouteCompileError('The row has more fields than the header.')
+                elif any(value for value in record.values()):
+                    yield reader.line_num, record
+        except (csv.Error, UnicodeDecodeError) as e:
+            yield reader.line_num, RouteCompileError(f'Invalid CSV: {e}')
+    else:
+        raise ValueError(f'Unsupported import format: {format}')
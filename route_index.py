@@ -0,0 +1,311 @@
+"""
+    In-memory index of the HTTP routes in a Caddy configuration.
+    `RouteIndex` maps hosts (exact and wildcard), path matchers, upstream dials and `@id`s
+    to the exact configuration path and server of the routes that use them, so lookups
+    do not need to pull and scan `apps/http/servers` for every question.
+    The index is updated per server when configuration changes are made through the
+    `CaddyAPI` client, and rebuilt when the configuration changes behind Birdie's back.
+    Lookups hold the lock of the index, as its maps are updated in place.
+"""
+import bisect
+import logging
+import threading
+import time
+from config_tree import split_path
+
+SERVERS_PATH = 'apps/http/servers'
+KINDS = ('host', 'wildcard', 'path', 'dial', 'id')
+
+
+class RouteIndex:
+    """
+    An index of hosts, path matchers, upstream dials and `@id`s to the routes that use them.
+
+    Attributes:
+        caddy_api (CaddyAPI): The client the configuration is read through.
+        max_age (float): Seconds after which a lookup revalidates the index against Caddy's config Etag.
+        etag (str): The Etag of the configuration the index was last validated against.
+    """
+
+    def __init__(self, caddy_api, max_age=30):
+        """
+        Initializes an empty index and subscribes it to configuration changes made through the client.
+
+        Args:
+            caddy_api (CaddyAPI): The client the configuration is read through.
+            max_age (float, optional): Seconds between revalidations of the index. Defaults to 30.
+        """
+        self.caddy_api = caddy_api
+        self.max_age = max_age
+        self.etag = None
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._built = False
+        self._checked_at = 0.0
+        self._dirty = set()
+        self._full_rebuild = False
+        self._maps = {kind: {} for kind in KINDS}
+        self._sorted_keys = {}
+        self._catch_all = {}
+        self._server_entries = {}
+        caddy_api.add_mutation_listener(self._on_mutation)
+
+    def _on_mutation(self, paths):
+        """
+        Mark the servers touched by a configuration change for re-indexing.
+        """
+        prefix = split_path(SERVERS_PATH)
+        with self._lock:
+            for path in paths:
+                parts = split_path(path)
+                if len(parts) > len(prefix) and parts[:len(prefix)] == prefix:
+                    self._dirty.add(parts[len(prefix)])
+                elif parts[:len(prefix)] == prefix[:len(parts)]:
+                    # The change is at or above the servers object
+                    self._full_rebuild = True
+
+    def _index_server(self, server, config):
+        """
+        Index the routes of one server, replacing any entries it had before.
+        """
+        self._remove_server(server)
+        entries = []
+        routes = (config or {}).get('routes') or []
+        self._index_routes(server, routes, f'{SERVERS_PATH}/{server}/routes', True, entries)
+        for kind, key, entry in entries:
+            if kind == 'catch_all':
+                self._catch_all.setdefault(server, []).append(entry)
+            else:
+                self._maps[kind].setdefault(key, []).append(entry)
+        self._server_entries[server] = entries
+        self._sorted_keys.clear()
+
+    def _remove_server(self, server):
+        for kind, key, entry in self._server_entries.pop(server, []):
+            if kind == 'catch_all':
+                continue
+            matches = self._maps[kind].get(key)
+            if matches is None:
+                continue
+            matches[:] = [match for match in matches if match is not entry]
+            if not matches:
+                del self._maps[kind][key]
+        self._catch_all.pop(server, None)
+        self._sorted_keys.clear()
+
+    def _index_routes(self, server, routes, path, top_level, entries):
+        for position, route in enumerate(routes):
+            if not isinstance(route, dict):
+                continue
+            route_path = f'{path}/{position}'
+            entry = {'server': server, 'path': route_path}
+            if '@id' in route:
+                entries.append(('id', str(route['@id']), entry))
+            has_host = False
+            for matcher in route.get('match') or []:
+                for host in matcher.get('host') or []:
+                    has_host = True
+                    host = host.lower()
+                    if host.startswith('*.'):
+                        entries.append(('wildcard', host[2:], entry))
+                    else:
+                        entries.append(('host', host, entry))
+                for matcher_path in matcher.get('path') or []:
+                    entries.append(('path', matcher_path, entry))
+            if top_level and not has_host:
+                entries.append(('catch_all', server, entry))
+            for handler_position, handler in enumerate(route.get('handle') or []):
+                handler_path = f'{route_path}/handle/{handler_position}'
+                if '@id' in handler:
+                    entries.append(('id', str(handler['@id']), {'server': server, 'path': handler_path}))
+                for upstream in handler.get('upstreams') or []:
+                    if 'dial' in upstream:
+                        entries.append(('dial', upstream['dial'], {'server': server, 'path': route_path, 'handler': handler_path}))
+                if handler.get('routes'):
+                    self._index_routes(server, handler['routes'], f'{handler_path}/routes', False, entries)
+
+    def rebuild(self, config=None, etag=None):
+        """
+        Rebuild the whole index.
+
+        Args:
+            config (dict, optional): The full configuration. Defaults to reading it through the client.
+            etag (str, optional): The Etag of `config`.
+        """
+        with self._lock:
+            # Only the changes made before the config was read are covered by this rebuild
+            dirty, full_rebuild = set(self._dirty), self._full_rebuild
+        if config is None:
+            config, etag = self.caddy_api.current_config()
+        servers = (((config or {}).get('apps') or {}).get('http') or {}).get('servers') or {}
+        start = time.perf_counter()
+        with self._lock:
+            for server in list(self._server_entries):
+                self._remove_server(server)
+            for server, server_config in servers.items():
+                self._index_server(server, server_config)
+            self.etag = etag
+            self._built = True
+            self._dirty -= dirty
+            if full_rebuild:
+                self._full_rebuild = False
+            self._checked_at = time.monotonic()
+        self.logger.debug(f'Indexed {len(servers)} servers in {time.perf_counter() - start:.3f}s')
+
+    def refresh(self, force=False):
+        """
+        Bring the index up to date: re-index servers changed through the client, and rebuild
+        the index if the configuration changed elsewhere since it was last validated.
+
+        Args:
+            force (bool, optional): Revalidate against Caddy even if `max_age` has not passed.
+        """
+        with self._lock:
+            if not self._built or self._full_rebuild:
+                self.rebuild()
+                return
+            if self._dirty:
+                for server in list(self._dirty):
+                    self._index_server(server, self.caddy_api.get_config(f'{SERVERS_PATH}/{server}'))
+                    # A server stays dirty until it was read successfully
+                    self._dirty.discard(server)
+                # The Etag is kept: changes made elsewhere since the last full rebuild are only
+                # noticed by comparing it with Caddy's at the next revalidation
+                return
+            if not force and time.monotonic() - self._checked_at < self.max_age:
+                return
+            config, etag = self.caddy_api.current_config()
+            if etag is None or etag != self.etag:
+                self.rebuild(config, etag)
+            else:
+                self._checked_at = time.monotonic()
+
+    def _sort_entries(self, entries):
+        return sorted(entries, key=lambda entry: (entry['server'], [int(p) if p.isdigit() else 0 for p in entry['path'].split('/')]))
+
+    def lookup_host(self, host):
+        """
+        Find the routes that match a hostname, exact matches first, then wildcard matches.
+
+        Args:
+            host (str): The hostname, optionally with a port.
+
+        Returns:
+            dict: The matching `routes` and the host-less `catch_all` routes per server.
+        """
+        host = host.lower().rsplit(':', 1)[0] if host.count(':') == 1 else host.lower()
+        with self._lock:
+            self.refresh()
+            matches = list(self._maps['host'].get(host, []))
+            if '.' in host:
+                matches += self._maps['wildcard'].get(host.split('.', 1)[1], [])
+            catch_all = {server: list(entries) for server, entries in self._catch_all.items()}
+        return {
+            'host': host,
+            'routes': self._sort_entries(matches),
+            'servers': sorted({entry['server'] for entry in matches}),
+            'catch_all': catch_all,
+        }
+
+    def has_host(self, host):
+        """
+        Check whether a route matches a hostname exactly, ignoring wildcard routes.
+
+        Args:
+            host (str): The hostname.
+
+        Returns:
+            bool: Whether a route has the hostname in a host matcher.
+        """
+        with self._lock:
+            self.refresh()
+            return bool(self._maps['host'].get(host.lower()))
+
+    def lookup_path(self, path):
+        """
+        Find the routes whose path matchers match a request path, e.g. `/api/*` matches `/api/users`.
+
+        Args:
+            path (str): The request path.
+
+        Returns:
+            list: The matching routes.
+        """
+        with self._lock:
+            self.refresh()
+            patterns = self._maps['path']
+            matches = list(patterns.get(path, []))
+            for end in range(len(path) + 1):
+                matches += patterns.get(path[:end] + '*', [])
+        return self._sort_entries(matches)
+
+    def lookup_dial(self, dial):
+        """
+        Find the routes that proxy to an upstream dial address.
+
+        Args:
+            dial (str): The upstream dial address, e.g. `10.0.0.1:8080`.
+
+        Returns:
+            list: The routes and the handlers that use the upstream.
+        """
+        with self._lock:
+            self.refresh()
+            matches = list(self._maps['dial'].get(dial, []))
+        return self._sort_entries(matches)
+
+    def lookup_id(self, id):
+        """
+        Find the object with the given `@id`.
+
+        Args:
+            id (str): The `@id`.
+
+        Returns:
+            list: The objects with the `@id`.
+        """
+        with self._lock:
+            self.refresh()
+            return list(self._maps['id'].get(id, []))
+
+    def search(self, kind, prefix, limit=100):
+        """
+        Find the indexed keys of a kind that start with a prefix.
+
+        Args:
+            kind (str): One of "host", "wildcard", "path", "dial" or "id".
+            prefix (str): The prefix to search for.
+            limit (int, optional): The maximum number of keys to return. Defaults to 100.
+
+        Returns:
+            dict: Mapping of each matching key to the routes that use it.
+
+        Raises:
+            KeyError: If the kind is unknown.
+        """
+        if kind not in self._maps:
+            raise KeyError(f'Unknown index kind: {kind}')
+        with self._lock:
+            self.refresh()
+            keys = self._sorted_keys.get(kind)
+            if keys is None:
+                keys = self._sorted_keys[kind] = sorted(self._maps[kind])
+            results = {}
+            for key in keys[bisect.bisect_left(keys, prefix):]:
+                if not key.startswith(prefix) or len(results) >= limit:
+                    break
+                results[key] = list(self._maps[kind].get(key, []))
+        return results
+
+    def stats(self):
+        """
+        Get the size of the index.
+
+        Returns:
+            dict: The number of keys of each kind and of indexed servers.
+        """
+        with self._lock:
+            stats = {kind: len(keys) for kind, keys in self._maps.items()}
+            stats['servers'] = len(self._server_entries)
+            stats['etag'] = self.etag
+        return stats
@@ -1,79 +1,535 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory, url_for, Blueprint
-import flask_compress
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, url_for, Blueprint, g
+from flask.json.provider import JSONProvider
+import json_codec
 import logging
 import os
-from caddy_api import CaddyAPI
+import threading
+import time
+from assets import AssetPipeline
+from caddy_api import CaddyAPI, ConfigConflictError, LogPayload
+from changeset import ChangeSet, ChangeSetError
+from route_index import RouteIndex
+from site_import import ImportJob
+from upstream_sampler import UpstreamSampler
+from sse import EventSubscription, format_event
+from caddy_fleet import CaddyFleet
+from cert_inventory import CertificateInventory
+from change_feed import ChangeFeed
+from config_history import ConfigHistory, RevisionNotFoundError
+from config_tree import ConfigPathError, query_node
+from metrics import Counter, Gauge, Histogram, REGISTRY, SIZE_BUCKETS
+
+HTTP_REQUEST_DURATION = Histogram(
+    'birdie_http_request_duration_seconds', 'Latency of requests served by Birdie.', ['method', 'route'])
+HTTP_REQUESTS = Counter('birdie_http_requests_total', 'Requests served by Birdie.', ['method', 'route', 'status'])
+HTTP_RESPONSE_BYTES = Histogram(
+    'birdie_http_response_bytes', 'Size of the responses served by Birdie.', ['method', 'route'], buckets=SIZE_BUCKETS)
+HTTP_ERRORS = Counter('birdie_http_request_errors_total', 'Requests that raised an unhandled exception.', ['method', 'route'])
+HTTP_IN_FLIGHT = Gauge('birdie_http_requests_in_flight', 'Requests being served by Birdie.')
+STARTUP_DURATION = Gauge('birdie_startup_duration_seconds', 'Seconds each startup step of the server took.', ['step'])
+
+
+class CodecJSONProvider(JSONProvider):
+    """
+    Flask JSON provider that encodes `jsonify` replies and decodes `request.json` with `json_codec`.
+    """
+
+    mimetype = 'application/json'
+    # Flask's default, so replies keep the key order clients already see
+    sort_keys = True
+    compact = None
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json_codec.dumps(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        indent = 2 if self.compact is False or (self.compact is None and self._app.debug) else None
+        # Send the encoded bytes as they are instead of decoding them to str and encoding them again
+        return self._app.response_class(
+            json_codec.dumps(self._prepare_response_obj(args, kwargs), sort_keys=self.sort_keys, indent=indent),
+            mimetype=self.mimetype)
+
+
+def passthrough_response(raw, status=200):
+    """
+    Build a response that sends a raw Caddy API body through unchanged.
+
+    Args:
+        raw (RawResponse): The raw body returned by the CaddyAPI client.
+        status (int, optional): The HTTP status code. Defaults to 200.
+
+    Returns:
+        Response: The Flask response, streamed in chunks if the body is an iterator, with Caddy's Etag.
+    """
+    response = Response(raw.body, status=status, content_type=raw.content_type)
+    if raw.content_length is not None:
+        response.content_length = raw.content_length
+    if raw.etag:
+        response.headers['Etag'] = raw.etag
+    return response
+
+
+def event_stream_response(subscription):
+    """
+    Build a Server-Sent Events response that streams a subscription until the client disconnects.
+
+    Args:
+        subscription (EventSubscription): The subscription to stream.
+
+    Returns:
+        Response: The streamed Flask response.
+    """
+    return Response(
+        subscription.stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 
 class BirdieServer:
     """
     Flask server to provide access to the CaddyAPI.
     """
 
-    def __init__(self, api_url, auth_token=None, port=5002, host='0.0.0.0', url_prefix=''):
+    def __init__(self, api_url, auth_token=None, port=5002, host='0.0.0.0', url_prefix='', fleet=None, sampler_interval=5,
+                 caddy_options=None, history_path=None, cert_refresh_interval=3600, compress=True, prewarm=True,
+                 startup_budget=1.0):
         """
         Initializes the Flask server and the CaddyAPI client.
 
         Args:
             api_url (str): The base URL for the Caddy API.
             auth_token (str, optional): Optional authentication token for the API.
+            fleet (CaddyFleet, optional): Additional Caddy instances to manage through the /fleet endpoints.
+                The instance at `api_url` is always part of the fleet as the "default" node.
+            sampler_interval (float, optional): Seconds between samples of the proxy upstreams. Defaults to 5.
+            caddy_options (dict, optional): Additional keyword arguments for the CaddyAPI client,
+                such as `pool_size`, `connect_timeout`, `read_timeout` and `retries`.
+            history_path (str, optional): The SQLite file to record config revisions in around every change.
+                Defaults to None, which disables the config history.
+            cert_refresh_interval (float, optional): Seconds between refreshes of the certificate inventory. Defaults to 3600.
+            compress (bool, optional): Compress responses with flask_compress. Defaults to True.
+            prewarm (bool, optional): Compress the static assets and load the Caddy config and route
+                index before returning, see `prewarm`. Defaults to True.
+            startup_budget (float, optional): Seconds the startup, including the prewarming, may take
+                before a warning is logged. Defaults to 1.
         """
+        started = time.perf_counter()
         __name__ = "BirdieServer"
         self.app = Flask(__name__)
+        self.app.json = CodecJSONProvider(self.app)
         self.port = port
         self.host = host
         self.url_prefix = url_prefix
 
         
-        self.caddy_api = CaddyAPI(api_url, auth_token)
+        self.caddy_api = CaddyAPI(api_url, auth_token, **(caddy_options or {}))
+        self.fleet = fleet if fleet is not None else CaddyFleet()
+        if 'default' not in self.fleet.nodes:
+            self.fleet.add_node('default', self.caddy_api)
+        self.route_index = RouteIndex(self.caddy_api)
+        self.sampler_interval = sampler_interval
+        self.history = ConfigHistory(self.caddy_api, history_path) if history_path else None
+        self.cert_inventory = CertificateInventory(self.caddy_api, cert_refresh_interval)
+        self.change_feed = ChangeFeed(self.caddy_api)
+        self.samplers = {}
+        self._samplers_lock = threading.Lock()
+        self.changesets = {}
+        self.changeset_max_age = 3600
+        self._changesets_lock = threading.Lock()
+        self.imports = {}
+        self.import_max_age = 86400
+        self._imports_lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
-        handler = logging.StreamHandler()
-        handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        # Every server shares the logger, so only the first one adds a handler
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setLevel(logging.DEBUG)
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
         self.logger.debug('Initialized BirdieServer, Caddy Admin API URL: %s', api_url)
         
-        # Enable compression for all responses
-        flask_compress.Compress(self.app)
-
-        # # Define routes
-        # self.app.add_url_rule(url_for('/config'), 'get_config', self.get_config, methods=['GET'])
-        # self.app.add_url_rule('/config', 'update_config', self.update_config, methods=['POST'])
-        # self.app.add_url_rule('/config', 'delete_config', self.delete_config, methods=['DELETE'])
-        # self.app.add_url_rule('/stop', 'stop_server', self.stop_server, methods=['POST'])
-        # self.app.add_url_rule('/config/array', 'add_to_config_array', self.add_to_config_array, methods=['POST'])
-        # self.app.add_url_rule('/config/array/insert', 'insert_into_config_array', self.insert_into_config_array, methods=['POST'])
-        # self.app.add_url_rule('/adapt', 'adapt_config', self.adapt_config, methods=['POST'])
-        # self.app.add_url_rule('/pki/ca', 'get_pki_ca', self.get_pki_ca, methods=['GET'])
-        # self.app.add_url_rule('/pki/ca/certificates', 'get_pki_ca_certificates', self.get_pki_ca_certificates, methods=['GET'])
-        # self.app.add_url_rule('/reverse_proxy/upstreams', 'get_proxy_upstreams', self.get_proxy_upstreams, methods=['GET'])
-        # self.app.add_url_rule('/load', 'load_config', self.load_config, methods=['POST'])
-        # self.app.add_url_rule('/test', 'test', self.test, methods=['GET'])
-        # self.app.add_url_rule('/add_site', 'add_site', self.add_site, methods=['GET'])
-        # self.app.add_url_rule('/dragdrop', 'drag_drop', self.drag_drop, methods=['GET'])
+        if compress:
+            # Enable compression for all responses; imported here as it is only needed when enabled
+            import flask_compress
+            flask_compress.Compress(self.app)
 
-        
-    
-    def run(self, production=False):
+        # Static files are fingerprinted here and compressed once by `prewarm`, or on first use without it;
+        # flask_compress skips responses that are already encoded
+        self.assets = AssetPipeline(os.path.join(os.path.dirname(__file__), 'static'), url_prefix)
+        self.assets.build()
+        self.app.jinja_env.globals['asset_url'] = self.assets.url
+
+        self.app.before_request(self._start_request_metrics)
+        self.app.after_request(self._record_request_metrics)
+        self.app.teardown_request(self._finish_request_metrics)
+        REGISTRY.add_collector(self._collect_client_metrics, key='birdie_server')
+        self.app.register_blueprint(self._create_blueprint())
+
+        self.startup = {'budget': startup_budget, 'steps': {'construct': time.perf_counter() - started}}
+        STARTUP_DURATION.labels('construct').set(self.startup['steps']['construct'])
+        if prewarm:
+            self.prewarm()
+        self._finish_startup()
+
+    def prewarm(self):
+        """
+        Load the state the first requests need, so they are served from warm caches: precompress
+        the static assets, open a pooled connection to Caddy and cache its configuration, and build
+        the route index. Failures are logged rather than raised, so a worker still starts while
+        Caddy is unreachable and warms up on its first requests instead; the route index is then
+        skipped rather than waiting for Caddy a second time.
+
+        Returns:
+            dict: The seconds each step took.
+        """
+        steps = {}
+        for name, step in (
+            ('assets', self.assets.compress),
+            ('config', self.caddy_api.current_config),
+            ('route_index', self.route_index.refresh),
+        ):
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.logger.warning(f'Error prewarming the {name}: {e}')
+                if name == 'config':
+                    break
+            finally:
+                steps[name] = time.perf_counter() - started
+                STARTUP_DURATION.labels(name).set(steps[name])
+        self.startup['steps'].update(steps)
+        return steps
+
+    def _finish_startup(self):
+        """
+        Compare the measured startup time with the budget and log it.
+        """
+        total = sum(self.startup['steps'].values())
+        budget = self.startup['budget']
+        self.startup['total'] = total
+        self.startup['within_budget'] = budget is None or total <= budget
+        STARTUP_DURATION.labels('total').set(total)
+        steps = ', '.join(f'{name} {seconds * 1000:.1f} ms' for name, seconds in self.startup['steps'].items())
+        if self.startup['within_budget']:
+            self.logger.info('Started in %.1f ms (%s)', total * 1000, steps)
+        else:
+            self.logger.warning('Started in %.1f ms, over the budget of %.1f ms (%s)', total * 1000, budget * 1000, steps)
+
+    def _start_request_metrics(self):
+        """
+        Start timing the current request.
+        """
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    def _record_request_metrics(self, response):
+        """
+        Record the latency, status and size of the current request.
+        """
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        g.metrics_recorded = True
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        HTTP_IN_FLIGHT.dec()
+        HTTP_REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+        # Streamed responses have no length until they are sent
+        if response.content_length is not None:
+            HTTP_RESPONSE_BYTES.labels(request.method, route).observe(response.content_length)
+        return response
+
+    def _finish_request_metrics(self, error=None):
+        """
+        Record requests that raised before a response was produced.
+        """
+        if g.pop('metrics_started', None) is None or g.pop('metrics_recorded', False):
+            return
+        HTTP_IN_FLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        HTTP_ERRORS.labels(request.method, route).inc()
+
+    def _collect_client_metrics(self):
+        """
+        Report the CaddyAPI client counters as metrics.
+
+        Returns:
+            list: (name, type, help, labels, value) tuples for the metrics registry.
+        """
+        stats = self.caddy_api.stats()
+        cache = stats['config_cache']
+        singleflight = stats['singleflight']
+        return [
+            ('birdie_config_cache_hits_total', 'counter', 'Config reads served from the cache.', {}, cache['hits']),
+            ('birdie_config_cache_misses_total', 'counter', 'Config reads that fetched the config from Caddy.', {}, cache['misses']),
+            ('birdie_adapt_cache_hits_total', 'counter', 'Adapt requests answered from the adapt cache.', {},
+             stats['adapt_cache']['hits'] if stats['adapt_cache'] else 0),
+            ('birdie_adapt_cache_misses_total', 'counter', 'Adapt requests sent to Caddy.', {},
+             stats['adapt_cache']['misses'] if stats['adapt_cache'] else 0),
+            ('birdie_singleflight_coalesced_total', 'counter', 'GET requests that shared an identical in-flight request.', {}, singleflight['coalesced']),
+            ('birdie_circuit_breaker_open', 'gauge', 'Whether the circuit breaker to the Caddy admin API is open.', {},
+             int(stats['circuit_breaker']['state'] != 'closed')),
+        ] + [
+            ('birdie_pki_certificate_expiry_timestamp_seconds', 'gauge', 'The UNIX time a CA certificate expires at.',
+             {'ca': certificate['ca'], 'role': certificate['role'], 'subject': certificate['subject'] or ''},
+             certificate['not_after'])
+            for certificate in self.cert_inventory.certificates()
+        ]
+
+    def _config_query(self, args):
+        """
+        Read the paging, projection, depth and filter options of a config read from the request arguments.
+
+        Args:
+            args (MultiDict): The request arguments: `offset`, `limit`, `fields` (comma separated keys),
+                `depth` and `match.<field>` filters, e.g. `match.host=*.example.com`, which may be repeated.
+
+        Returns:
+            dict: The keyword arguments for `config_tree.query_node`, empty if none of the options is set.
+
+        Raises:
+            ValueError: If an option is malformed.
+        """
+        query = {}
+        for name in ('offset', 'limit', 'depth'):
+            if name in args:
+                try:
+                    value = int(args[name])
+                except ValueError:
+                    raise ValueError(f'"{name}" must be an integer.')
+                if value < 0:
+                    raise ValueError(f'"{name}" must not be negative.')
+                query[name] = value
+        if args.get('fields'):
+            query['fields'] = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        filters = {}
+        for name in args:
+            if name.startswith('match.') and len(name) > len('match.'):
+                patterns = [pattern for value in args.getlist(name) for pattern in value.split(',') if pattern]
+                filters[name[len('match.'):]] = patterns
+        if filters:
+            query['filters'] = filters
+        return query
+
+    def _fleet_selection(self, source):
+        """
+        Read the fleet node selection and timeout from the request arguments or JSON body.
+
+        Args:
+            source (dict): The query arguments or the JSON body of the request.
+
+        Returns:
+            dict: Keyword arguments for CaddyFleet.call.
+        """
+        nodes = source.get('nodes')
+        if isinstance(nodes, str):
+            nodes = [name for name in nodes.split(',') if name]
+        timeout = source.get('timeout')
+        return {
+            'nodes': nodes or None,
+            'group': source.get('group'),
+            'timeout': float(timeout) if timeout is not None else None,
+        }
+
+    def _fleet_response(self, results):
+        """
+        Build the reply for a fleet call with the per-node results.
+
+        Args:
+            results (dict): The results returned by CaddyFleet.call.
+
+        Returns:
+            tuple: The JSON response and the HTTP status code, 200 if all nodes succeeded,
+            207 if some failed and 502 if all failed.
+        """
+        failed = sum(1 for result in results.values() if result['status'] != 'ok')
+        if not failed:
+            status = 200
+        elif failed < len(results):
+            status = 207
+        else:
+            status = 502
+        return jsonify({'results': results, 'failed': failed}), status
+
+    def open_changeset(self):
+        """
+        Open a new change set, discarding change sets that were left open for too long.
+
+        Returns:
+            ChangeSet: The new change set.
+        """
+        changeset = ChangeSet(self.caddy_api)
+        with self._changesets_lock:
+            expired = [id for id, cs in self.changesets.items() if time.time() - cs.created_at > self.changeset_max_age]
+            for id in expired:
+                del self.changesets[id]
+            self.changesets[changeset.id] = changeset
+        return changeset
+
+    def create_import(self, **options):
+        """
+        Create a site import job, forgetting jobs that finished long ago.
+
+        Args:
+            **options: The options of the job, see `ImportJob`.
+
+        Returns:
+            ImportJob: The pending job.
+        """
+        job = ImportJob(self.caddy_api, host_exists=self.route_index.has_host, **options)
+        with self._imports_lock:
+            expired = [id for id, existing in self.imports.items()
+                       if existing.finished_at and time.time() - existing.finished_at > self.import_max_age]
+            for id in expired:
+                del self.imports[id]
+            self.imports[job.id] = job
+        return job
+
+    def get_sampler(self, node='default'):
+        """
+        Get the upstream sampler of a fleet node, starting it on first use.
+        There is a single sampler per Caddy instance however many clients read from it.
+
+        Args:
+            node (str, optional): The fleet node. Defaults to "default".
+
+        Returns:
+            UpstreamSampler: The running sampler.
+
+        Raises:
+            KeyError: If the node is not part of the fleet.
+        """
+        with self._samplers_lock:
+            sampler = self.samplers.get(node)
+            if sampler is None:
+                sampler = self.samplers[node] = UpstreamSampler(self.fleet.nodes[node], self.sampler_interval)
+        sampler.start()
+        return sampler
+
+    @staticmethod
+    def long_poll_args(args):
+        """
+        Read the arguments of a config change long-poll, for the endpoints of both serving modes.
+
+        Args:
+            args (MultiDict): The query arguments.
+
+        Returns:
+            tuple: The generation `since` and the seconds to wait, `timeout` (default 25, at most
+                60), which is 0 without `since` so the latest generation is returned at once.
         """
-        Runs the Flask server.
+        since = args.get('since')
+        timeout = min(max(args.get('timeout', 25, type=float), 0), 60)
+        return since, timeout if since is not None else 0
+
+    def subscribe_config_changes(self, since=None, subscriber=None):
+        """
+        Start the change feed and subscribe to its changes, for the event streams of both serving modes.
+
+        Args:
+            since (str, optional): The last generation or event ID the client saw. Defaults to the latest.
+            subscriber (AsyncSubscriber, optional): The queue to subscribe, for streams read on an
+                event loop. Defaults to a new thread-safe queue.
+
+        Returns:
+            EventSubscription: The subscription, starting with the changes the client missed.
+        """
+        self.change_feed.start()
+        subscriber, initial = self.change_feed.subscribe(since, subscriber)
+        return EventSubscription(self.change_feed.broker, subscriber, initial)
+
+    def subscribe_upstream_samples(self, node='default', subscriber=None):
+        """
+        Subscribe to the samples of the proxy upstreams of a fleet node.
 
         Args:
-            host (str): The host to bind the server to. Defaults to '0.0.0.0'.
-            port (int): The port to bind the server to. Defaults to 5002.
+            node (str, optional): The fleet node. Defaults to "default".
+            subscriber (AsyncSubscriber, optional): The queue to subscribe. Defaults to a new thread-safe queue.
+
+        Returns:
+            EventSubscription: The subscription, starting with the latest sample.
+
+        Raises:
+            KeyError: If the node is not part of the fleet.
+        """
+        sampler = self.get_sampler(node)
+        subscriber = sampler.broker.subscribe(subscriber)
+        initial = [format_event(sampler.latest, event='sample')] if sampler.latest else []
+        return EventSubscription(sampler.broker, subscriber, initial)
+
+    def subscribe_import(self, job_id, subscriber=None):
+        """
+        Subscribe to the progress of a bulk site import, up to its `completed` or `failed` event.
+
+        Args:
+            job_id (str): The ID of the import.
+            subscriber (AsyncSubscriber, optional): The queue to subscribe. Defaults to a new thread-safe queue.
+
+        Returns:
+            EventSubscription: The subscription, starting with the current state, or None if the import is unknown.
+        """
+        job = self.imports.get(job_id)
+        if not job:
+            return None
+        subscriber = job.broker.subscribe(subscriber)
+        state = job.status if job.status in ('completed', 'failed') else 'progress'
+        initial = [format_event(job.describe(), event=state, id=job.records)]
+        return EventSubscription(job.broker, subscriber, initial, until=('completed', 'failed'))
+
+    def stats(self):
+        """
+        Get the runtime statistics of the CaddyAPI client and of the server's subsystems.
+
+        Returns:
+            dict: Statistics grouped by subsystem.
+        """
+        stats = self.caddy_api.stats()
+        stats['route_index'] = self.route_index.stats()
+        stats['assets'] = self.assets.stats()
+        stats['history'] = self.history.stats() if self.history else None
+        stats['cert_inventory'] = self.cert_inventory.stats()
+        stats['change_feed'] = self.change_feed.stats()
+        stats['json'] = json_codec.stats()
+        stats['startup'] = self.startup
+        return stats
+
+    def _create_blueprint(self):
+        """
+        Define the Birdie endpoints.
+
+        Returns:
+            Blueprint: The blueprint with every route, under the URL prefix of the server.
         """
-        self.logger.info(f'Server starting on http://{self.host}:{self.port}')
         blueprint = Blueprint('birdie', __name__, url_prefix=self.url_prefix)
         @blueprint.route('/config', methods=['GET'])
         def get_config():
             """
             Endpoint to get the current Caddy configuration or a specific configuration path.
+            Arrays can be paged with `offset` and `limit` and filtered with `match.<field>`, e.g.
+            `match.host=*.example.com`; `fields` and `depth` trim each returned item. With any of
+            these options the response carries the totals and the page instead of the raw node.
             """
             path = request.args.get('path')
             try:
-                config = self.caddy_api.get_config(path)
-                return jsonify(config), 200
+                query = self._config_query(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            try:
+                if query:
+                    # Only the requested page is encoded, the node itself comes from the cached tree
+                    return jsonify(query_node(self.caddy_api.get_config(path), **query)), 200
+                config = self.caddy_api.get_config(path, raw=True)
+                return passthrough_response(config)
+            except ConfigPathError as e:
+                return jsonify({'error': str(e.args[0])}), 400
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
@@ -115,6 +571,27 @@ class BirdieServer:
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
+        @blueprint.route('/config/changes', methods=['GET'])
+        def get_config_changes():
+            """
+            Endpoint to long-poll for config changes after generation `since`, waiting up to `timeout` seconds
+            (default 25, at most 60). Without `since` it returns the latest generation to resume from.
+            """
+            since, timeout = self.long_poll_args(request.args)
+            try:
+                self.change_feed.start()
+                return jsonify(self.change_feed.changes(since, timeout)), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/config/changes/stream', methods=['GET'])
+        def stream_config_changes():
+            """
+            Endpoint to stream config changes as Server-Sent Events, resuming after `Last-Event-ID` or `since`.
+            """
+            since = request.headers.get('Last-Event-ID') or request.args.get('since')
+            return event_stream_response(self.subscribe_config_changes(since))
+
         @blueprint.route('/config/array', methods=['POST'])
         def add_to_config_array():
             """
@@ -125,7 +602,7 @@ class BirdieServer:
                 return jsonify({'error': 'Invalid request. "path" and "items" are required.'}), 400
             path = data['path']
             items = data['items']
-            self.logger.debug(f"Items to be added to config array at path: {path} with items: {items}")
+            self.logger.debug('Items to be added to config array at path: %s with items: %s', path, LogPayload(items))
             try:
                 self.logger.debug("Trying to add items to config array")
                 updated_config = self.caddy_api.add_to_config_array(data['path'], data['items'])
@@ -158,9 +635,9 @@ class BirdieServer:
             content_type = request.headers.get('Content-Type', 'application/json')
             self.logger.debug(f"Content-Type: {content_type}")
         
-            # Log the raw request body
+            # Only the size is logged, the body is adapted on every keystroke of a preview
             raw_data = request.data.decode('utf-8')
-            self.logger.debug(f"Raw request body: {raw_data}")
+            self.logger.debug('Request body: %d bytes', len(raw_data))
         
             # Check if the request body is empty
             if not raw_data:
@@ -182,8 +659,8 @@ class BirdieServer:
         
             try:
                 # Adapt the configuration using the Caddy API
-                adapted_config = self.caddy_api.adapt_config(config, content_type)
-                return jsonify(adapted_config), 200
+                adapted_config = self.caddy_api.adapt_config(config, content_type, raw=True)
+                return passthrough_response(adapted_config)
             except Exception as e:
                 self.logger.error(f"Error adapting configuration: {e}")
                 return jsonify({'error': str(e)}), 500
@@ -198,8 +675,8 @@ class BirdieServer:
                 return jsonify({'error': '"id" query parameter is required.'}), 400
 
             try:
-                ca_config = self.caddy_api.get_pki_ca(ca_id)
-                return jsonify(ca_config), 200
+                ca_config = self.caddy_api.get_pki_ca(ca_id, raw=True)
+                return passthrough_response(ca_config)
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
@@ -213,8 +690,50 @@ class BirdieServer:
                 return jsonify({'error': '"id" query parameter is required.'}), 400
 
             try:
-                certificates = self.caddy_api.get_pki_ca_certificates(ca_id)
-                return jsonify(certificates), 200
+                certificates = self.caddy_api.get_pki_ca_certificates(ca_id, raw=True)
+                return passthrough_response(certificates)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/pki/inventory', methods=['GET'])
+        def get_pki_inventory():
+            """
+            Endpoint to get the certificates of all PKI CAs, soonest expiring first, optionally of one CA.
+            """
+            try:
+                self.cert_inventory.ensure_fresh()
+                return jsonify({
+                    'refreshed_at': self.cert_inventory.refreshed_at,
+                    'authorities': self.cert_inventory.authorities(),
+                    'errors': self.cert_inventory.errors,
+                    'certificates': self.cert_inventory.certificates(request.args.get('ca')),
+                }), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/pki/inventory/expiring', methods=['GET'])
+        def get_pki_inventory_expiring():
+            """
+            Endpoint to get the PKI certificates that expire within `days` days (default 30), including expired ones.
+            """
+            days = request.args.get('days', 30, type=float)
+            try:
+                self.cert_inventory.ensure_fresh()
+                certificates = self.cert_inventory.expiring(days * 86400)
+                return jsonify({'days': days, 'refreshed_at': self.cert_inventory.refreshed_at,
+                                'certificates': certificates}), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/pki/inventory/refresh', methods=['POST'])
+        def refresh_pki_inventory():
+            """
+            Endpoint to refresh the certificate inventory now instead of waiting for the background refresh.
+            """
+            try:
+                self.cert_inventory.refresh()
+                self.cert_inventory.start()
+                return jsonify(self.cert_inventory.stats()), 200
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
@@ -224,11 +743,351 @@ class BirdieServer:
             Endpoint to get the current proxy upstreams.
             """
             try:
-                upstreams = self.caddy_api.get_proxy_upstreams()
-                return jsonify(upstreams), 200
+                upstreams = self.caddy_api.get_proxy_upstreams(raw=True)
+                return passthrough_response(upstreams)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/config/apply', methods=['POST'])
+        def apply_config():
+            """
+            Endpoint to change the Caddy configuration to the given one with minimal narrow operations.
+            """
+            data = request.json
+            if not data or 'config' not in data:
+                return jsonify({'error': 'Invalid request. "config" is required.'}), 400
+
+            dry_run = bool(data.get('dry_run', False))
+            try:
+                operations = self.caddy_api.apply_config(data['config'], dry_run=dry_run)
+                return jsonify({'operations': operations, 'applied': not dry_run}), 200
+            except ConfigConflictError as e:
+                return jsonify({'error': str(e)}), 409
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/config/plan', methods=['POST'])
+        def plan_config():
+            """
+            Endpoint to get the operations that would change the Caddy configuration to the given one.
+            """
+            data = request.json
+            if not data or 'config' not in data:
+                return jsonify({'error': 'Invalid request. "config" is required.'}), 400
+
+            try:
+                operations = self.caddy_api.apply_config(data['config'], dry_run=True)
+                return jsonify({'operations': operations}), 200
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
+        @blueprint.route('/changesets', methods=['POST'])
+        def open_changeset():
+            """
+            Endpoint to open a change set that batches many mutations into one commit.
+            """
+            changeset = self.open_changeset()
+            return jsonify({'id': changeset.id}), 201
+
+        @blueprint.route('/changesets/<changeset_id>', methods=['GET'])
+        def get_changeset(changeset_id):
+            """
+            Endpoint to get the operations queued in a change set.
+            """
+            changeset = self.changesets.get(changeset_id)
+            if not changeset:
+                return jsonify({'error': f'Unknown change set: {changeset_id}'}), 404
+            return jsonify(changeset.describe()), 200
+
+        @blueprint.route('/changesets/<changeset_id>', methods=['DELETE'])
+        def discard_changeset(changeset_id):
+            """
+            Endpoint to discard a change set without committing it.
+            """
+            with self._changesets_lock:
+                changeset = self.changesets.pop(changeset_id, None)
+            if not changeset:
+                return jsonify({'error': f'Unknown change set: {changeset_id}'}), 404
+            return jsonify({'id': changeset_id, 'discarded': len(changeset.operations)}), 200
+
+        @blueprint.route('/changesets/<changeset_id>/operations', methods=['POST'])
+        def queue_changeset_operations(changeset_id):
+            """
+            Endpoint to queue one operation, or a list of them under "operations", in a change set.
+            """
+            changeset = self.changesets.get(changeset_id)
+            if not changeset:
+                return jsonify({'error': f'Unknown change set: {changeset_id}'}), 404
+            data = request.json
+            if not data:
+                return jsonify({'error': 'Invalid request. An operation is required.'}), 400
+
+            operations = data['operations'] if 'operations' in data else [data]
+            try:
+                for operation in operations:
+                    changeset.queue(operation)
+            except ChangeSetError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'id': changeset_id, 'queued': len(changeset.operations)}), 200
+
+        @blueprint.route('/changesets/<changeset_id>/commit', methods=['POST'])
+        def commit_changeset(changeset_id):
+            """
+            Endpoint to commit all operations of a change set with a single guarded request.
+            """
+            changeset = self.changesets.get(changeset_id)
+            if not changeset:
+                return jsonify({'error': f'Unknown change set: {changeset_id}'}), 404
+            try:
+                result = changeset.commit()
+            except ConfigConflictError as e:
+                return jsonify({'error': str(e)}), 409
+            except ChangeSetError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+            with self._changesets_lock:
+                self.changesets.pop(changeset_id, None)
+            return jsonify(result), 200
+
+        @blueprint.route('/import', methods=['POST'])
+        def create_import():
+            """
+            Endpoint to create a bulk site import. The JSON body holds the options: `server` (default "srv0"),
+            `format` ("ndjson" or "csv"), `batch_size`, `skip_existing` and `dry_run`.
+            """
+            data = request.get_json(silent=True) or {}
+            options = {key: data[key] for key in ('server', 'format', 'batch_size', 'skip_existing', 'dry_run') if key in data}
+            try:
+                job = self.create_import(**options)
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify(job.describe()), 201
+
+        @blueprint.route('/import/<job_id>', methods=['GET'])
+        def get_import(job_id):
+            """
+            Endpoint to get the progress of a bulk site import.
+            """
+            job = self.imports.get(job_id)
+            if not job:
+                return jsonify({'error': f'Unknown import: {job_id}'}), 404
+            return jsonify(job.describe()), 200
+
+        @blueprint.route('/import/<job_id>/upload', methods=['POST', 'PUT'])
+        def upload_import(job_id):
+            """
+            Endpoint to upload the sites of an import as NDJSON or CSV. The body is streamed,
+            compiled and applied in batches as it arrives; the response is the final job state.
+            """
+            job = self.imports.get(job_id)
+            if not job:
+                return jsonify({'error': f'Unknown import: {job_id}'}), 404
+            try:
+                result = job.run(request.stream)
+            except RuntimeError as e:
+                return jsonify({'error': str(e)}), 409
+            return jsonify(result), 200 if result['status'] == 'completed' else 502
+
+        @blueprint.route('/import/<job_id>/events', methods=['GET'])
+        def stream_import(job_id):
+            """
+            Endpoint to follow the progress of a bulk site import as Server-Sent Events.
+            The stream ends with a `completed` or `failed` event.
+            """
+            subscription = self.subscribe_import(job_id)
+            if not subscription:
+                return jsonify({'error': f'Unknown import: {job_id}'}), 404
+            return event_stream_response(subscription)
+
+        @blueprint.route('/routes/lookup', methods=['GET'])
+        def lookup_routes():
+            """
+            Endpoint to find the routes and servers that handle a host and/or a request path.
+            """
+            host = request.args.get('host')
+            path = request.args.get('path')
+            if not host and not path:
+                return jsonify({'error': '"host" or "path" query parameter is required.'}), 400
+
+            try:
+                result = self.route_index.lookup_host(host) if host else {}
+                if path:
+                    result['path'] = path
+                    result['path_routes'] = self.route_index.lookup_path(path)
+                return jsonify(result), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/routes/upstream', methods=['GET'])
+        def lookup_upstream_routes():
+            """
+            Endpoint to find the routes that proxy to an upstream dial address.
+            """
+            dial = request.args.get('dial')
+            if not dial:
+                return jsonify({'error': '"dial" query parameter is required.'}), 400
+
+            try:
+                return jsonify({'dial': dial, 'routes': self.route_index.lookup_dial(dial)}), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/routes/id/<object_id>', methods=['GET'])
+        def lookup_route_id(object_id):
+            """
+            Endpoint to find the configuration path of the object with an @id.
+            """
+            try:
+                matches = self.route_index.lookup_id(object_id)
+                if not matches:
+                    return jsonify({'error': f'Unknown @id: {object_id}'}), 404
+                return jsonify({'id': object_id, 'routes': matches}), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/routes/search', methods=['GET'])
+        def search_routes():
+            """
+            Endpoint to search indexed hosts, paths, dials or @ids by prefix.
+            """
+            kind = request.args.get('kind', 'host')
+            prefix = request.args.get('prefix', '')
+            try:
+                limit = int(request.args.get('limit', 100))
+                return jsonify({'kind': kind, 'prefix': prefix, 'results': self.route_index.search(kind, prefix, limit)}), 200
+            except (KeyError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/stats', methods=['GET'])
+        def get_stats():
+            """
+            Endpoint to get the CaddyAPI client statistics, such as config cache hits and misses.
+            """
+            return jsonify(self.stats()), 200
+
+        @blueprint.route('/metrics', methods=['GET'])
+        def get_metrics():
+            """
+            Endpoint to get Birdie's request and CaddyAPI client metrics in the Prometheus text format.
+            """
+            return Response(REGISTRY.expose(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+        def history_disabled():
+            return jsonify({'error': 'Config history is disabled. Set BIRDIE_HISTORY_PATH to enable it.'}), 404
+
+        @blueprint.route('/history', methods=['GET'])
+        def list_revisions():
+            """
+            Endpoint to list recorded config revisions, newest first, or find the one current at a time with `at`.
+            """
+            if not self.history:
+                return history_disabled()
+            try:
+                at = request.args.get('at', type=float)
+                if at is not None:
+                    return jsonify(self.history.revision_at(at)), 200
+                revisions = self.history.revisions(request.args.get('since', type=float), request.args.get('until', type=float),
+                                                   request.args.get('limit', 100, type=int))
+                return jsonify({'revisions': revisions}), 200
+            except RevisionNotFoundError as e:
+                return jsonify({'error': str(e.args[0])}), 404
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/history', methods=['POST'])
+        def record_revision():
+            """
+            Endpoint to record the current config as a revision, unless it already is the latest one.
+            """
+            if not self.history:
+                return history_disabled()
+            try:
+                return jsonify(self.history.record()), 200
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/history/<int:rev>', methods=['GET'])
+        def get_revision(rev):
+            """
+            Endpoint to get the config of a revision, or the value at `path` within it.
+            """
+            if not self.history:
+                return history_disabled()
+            try:
+                return jsonify(self.history.get(rev, request.args.get('path'))), 200
+            except RevisionNotFoundError as e:
+                return jsonify({'error': str(e.args[0])}), 404
+            except ConfigPathError as e:
+                return jsonify({'error': str(e.args[0])}), 400
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/history/diff', methods=['GET'])
+        def diff_revisions():
+            """
+            Endpoint to get the operations that turn revision `from` into revision `to`, or into the current config.
+            """
+            if not self.history:
+                return history_disabled()
+            from_rev = request.args.get('from', type=int)
+            if from_rev is None:
+                return jsonify({'error': '"from" query parameter is required.'}), 400
+            try:
+                operations = self.history.diff(from_rev, request.args.get('to', type=int))
+                return jsonify({'operations': operations}), 200
+            except RevisionNotFoundError as e:
+                return jsonify({'error': str(e.args[0])}), 404
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/history/<int:rev>/rollback', methods=['POST'])
+        def rollback_revision(rev):
+            """
+            Endpoint to change the Caddy config back to a revision with the smallest set of operations.
+            """
+            if not self.history:
+                return history_disabled()
+            dry_run = bool((request.get_json(silent=True) or {}).get('dry_run', False))
+            try:
+                operations = self.history.rollback(rev, dry_run=dry_run)
+                return jsonify({'rev': rev, 'operations': operations, 'applied': not dry_run}), 200
+            except RevisionNotFoundError as e:
+                return jsonify({'error': str(e.args[0])}), 404
+            except ConfigConflictError as e:
+                return jsonify({'error': str(e)}), 409
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/reverse_proxy/upstreams/history', methods=['GET'])
+        def get_proxy_upstreams_history():
+            """
+            Endpoint to get the sampled request and failure counters of the proxy upstreams.
+            """
+            try:
+                sampler = self.get_sampler(request.args.get('node', 'default'))
+                since = request.args.get('since', type=float)
+                until = request.args.get('until', type=float)
+                history = sampler.history(request.args.get('address'), since, until)
+                return jsonify({'interval': sampler.interval, 'latest': sampler.latest, 'upstreams': history}), 200
+            except KeyError as e:
+                return jsonify({'error': f'Unknown fleet node: {e}'}), 404
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+        @blueprint.route('/reverse_proxy/upstreams/stream', methods=['GET'])
+        def stream_proxy_upstreams():
+            """
+            Endpoint to stream the samples of the proxy upstreams as Server-Sent Events.
+            """
+            try:
+                subscription = self.subscribe_upstream_samples(request.args.get('node', 'default'))
+            except KeyError as e:
+                return jsonify({'error': f'Unknown fleet node: {e}'}), 404
+            return event_stream_response(subscription)
+
         @blueprint.route('/load', methods=['POST'])
         def load_config():
             """
@@ -245,49 +1104,243 @@ class BirdieServer:
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
 
+        @blueprint.route('/fleet/nodes', methods=['GET'])
+        def get_fleet_nodes():
+            """
+            Endpoint to list the Caddy instances in the fleet.
+            """
+            return jsonify(self.fleet.describe()), 200
+
+        @blueprint.route('/fleet/config', methods=['GET'])
+        def get_fleet_config():
+            """
+            Endpoint to get the configuration at a path from every selected fleet node.
+            """
+            path = request.args.get('path')
+            try:
+                results = self.fleet.call('get_config', path, **self._fleet_selection(request.args))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/config', methods=['POST'])
+        def update_fleet_config():
+            """
+            Endpoint to replace a configuration value on every selected fleet node.
+            """
+            data = request.json
+            if not data or 'path' not in data or 'value' not in data:
+                return jsonify({'error': 'Invalid request. "path" and "value" are required.'}), 400
+            try:
+                results = self.fleet.call('replace_config_value', data['path'], data['value'], **self._fleet_selection(data))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/config/array', methods=['POST'])
+        def add_to_fleet_config_array():
+            """
+            Endpoint to add items to a configuration array on every selected fleet node.
+            """
+            data = request.json
+            if not data or 'path' not in data or 'items' not in data:
+                return jsonify({'error': 'Invalid request. "path" and "items" are required.'}), 400
+            try:
+                results = self.fleet.call('add_to_config_array', data['path'], data['items'], **self._fleet_selection(data))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/load', methods=['POST'])
+        def load_fleet_config():
+            """
+            Endpoint to load a new configuration on every selected fleet node.
+            """
+            data = request.json
+            if not data or 'config' not in data:
+                return jsonify({'error': 'Invalid request. "config" is required.'}), 400
+            try:
+                results = self.fleet.call('load_config', data['config'], **self._fleet_selection(data))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/reverse_proxy/upstreams', methods=['GET'])
+        def get_fleet_proxy_upstreams():
+            """
+            Endpoint to get the proxy upstreams of every selected fleet node.
+            """
+            try:
+                results = self.fleet.call('get_proxy_upstreams', **self._fleet_selection(request.args))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/pki/ca', methods=['GET'])
+        def get_fleet_pki_ca():
+            """
+            Endpoint to get a PKI CA configuration from every selected fleet node.
+            """
+            ca_id = request.args.get('id')
+            if not ca_id:
+                return jsonify({'error': '"id" query parameter is required.'}), 400
+            try:
+                results = self.fleet.call('get_pki_ca', ca_id, **self._fleet_selection(request.args))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
+        @blueprint.route('/fleet/pki/ca/certificates', methods=['GET'])
+        def get_fleet_pki_ca_certificates():
+            """
+            Endpoint to get the PEM certificate chain of a PKI CA from every selected fleet node.
+            """
+            ca_id = request.args.get('id')
+            if not ca_id:
+                return jsonify({'error': '"id" query parameter is required.'}), 400
+
+            def read_chain(api):
+                # Caddy serves the chain as PEM text, not JSON
+                return b''.join(api.get_pki_ca_certificates(ca_id, raw=True).body).decode('utf-8')
+
+            try:
+                results = self.fleet.call(read_chain, **self._fleet_selection(request.args))
+                return self._fleet_response(results)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 400
+
         @blueprint.route('/test')
         def test():
             """
             Load the test.html file.
             """
-            return render_template('test.html')
+            return self.assets.page(request, 'test.html')
         
         @blueprint.route('/add_site')
         def add_site():
             """
             Serve the add_site.html file.
             """
-            templates_path = os.path.join(os.path.dirname(__file__), 'static', 'templates')
-            with open(os.path.join(templates_path, 'route_templates.html'), 'r') as f:
-                templates = f.read()
-            print(templates)
-            return render_template('add_site.html', templates=templates)
+            templates = self.assets.get('templates/route_templates.html')
+            return self.assets.page(request, 'add_site.html', templates=templates.text)
         
         @blueprint.route('/dragdrop')
         def drag_drop():
             """
             Serve the dragdrop.html file.
             """
-            return render_template('dragdrop.html')
-        self.app.register_blueprint(blueprint)
+            return self.assets.page(request, 'dragdrop.html')
+
+        @blueprint.route('/assets/<path:filename>', methods=['GET'])
+        def get_asset(filename):
+            """
+            Serve a fingerprinted static asset from memory with immutable caching.
+            """
+            response = self.assets.serve(filename, request)
+            if response is None:
+                return jsonify({'error': f'Unknown asset: {filename}'}), 404
+            return response
+        return blueprint
+
+    def run(self, production=False):
+        """
+        Runs the Flask development server. The routes are registered when the server is created,
+        so in production a WSGI server serves `app` without calling this.
+
+        Args:
+            production (bool, optional): Only turn off the development reloading of assets, without
+                starting the development server. Defaults to False.
+        """
+        # The development server picks up edited assets and templates without a restart
+        self.assets.auto_reload = not production
         if not production:
+            self.logger.info(f'Server starting on http://{self.host}:{self.port}')
             self.app.run(host=self.host, port=self.port, debug=True)
-        else:
-            pass
-            # We stop here so a WSGI server can take over
-        
+
+
+def options_from_env():
+    """
+    Read the BirdieServer options from the environment, and from a `.env` file if python-dotenv is installed.
+
+    Returns:
+        dict: The keyword arguments for BirdieServer.
+    """
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+    return {
+        'api_url': os.getenv('CADDY_ADMIN_API_URL', 'http://localhost:2019'),
+        'auth_token': os.getenv('CADDY_AUTH_TOKEN'),
+        'fleet': CaddyFleet.from_spec(
+            os.getenv('CADDY_FLEET'),
+            max_workers=int(os.getenv('CADDY_FLEET_WORKERS', '16')),
+            timeout=float(os.getenv('CADDY_FLEET_TIMEOUT', '30')),
+        ),
+        'sampler_interval': float(os.getenv('BIRDIE_SAMPLER_INTERVAL', '5')),
+        'history_path': os.getenv('BIRDIE_HISTORY_PATH'),
+        'cert_refresh_interval': float(os.getenv('BIRDIE_CERT_REFRESH_INTERVAL', '3600')),
+        'caddy_options': {
+            'pool_size': int(os.getenv('CADDY_POOL_SIZE', '10')),
+            'connect_timeout': float(os.getenv('CADDY_CONNECT_TIMEOUT', '3.05')),
+            'read_timeout': float(os.getenv('CADDY_READ_TIMEOUT', '30')),
+            'retries': int(os.getenv('CADDY_RETRIES', '2')),
+            'cache_ttl': float(os.getenv('CADDY_CACHE_TTL', '2')),
+            'adapt_cache_size': int(os.getenv('BIRDIE_ADAPT_CACHE_SIZE', '128')),
+            'adapt_cache_bytes': int(os.getenv('BIRDIE_ADAPT_CACHE_BYTES', str(16 * 1024 * 1024))),
+        },
+        'prewarm': os.getenv('BIRDIE_PREWARM', '1').lower() in ('1', 'true', 'yes', 'on'),
+        'startup_budget': float(os.getenv('BIRDIE_STARTUP_BUDGET', '1')),
+    }
+
+
+def create_server(**options):
+    """
+    Create a BirdieServer configured from the environment.
+
+    Args:
+        **options: BirdieServer options that take precedence over the environment.
+
+    Returns:
+        BirdieServer: The server, with every route registered.
+    """
+    return BirdieServer(**dict(options_from_env(), **options))
+
+
+def create_app(**options):
+    """
+    App factory for WSGI servers, e.g. `gunicorn 'server:create_app()'`.
+
+    Args:
+        **options: BirdieServer options that take precedence over the environment, e.g. `prewarm=False`.
+
+    Returns:
+        Flask: The app of a new BirdieServer.
+    """
+    return create_server(**options).app
+
+
+_default_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """
+    Create the default server from the environment the first time `birdie` or `server` is used,
+    e.g. by `gunicorn server:server`, instead of on every import of this module.
+    """
+    if name not in ('birdie', 'server'):
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _default_lock:
+        if 'birdie' not in globals():
+            birdie = create_server()
+            globals().update(birdie=birdie, server=birdie.app)
+    return globals()[name]
+
+
 if __name__ == "__main__":
     # Example usage
     api_url = "http://localhost:2019"
     server = BirdieServer(api_url)
     server.run()
-else:
-    # export app for gunicorn
-    from dotenv import load_dotenv
-    load_dotenv()
-    caddy_admin_url = os.getenv('CADDY_ADMIN_API_URL', 'http://localhost:2019')
-    caddy_auth_token = os.getenv('CADDY_AUTH_TOKEN')
-    if caddy_auth_token:
-        server = BirdieServer(caddy_admin_url, caddy_auth_token).app
-    else:
-        server = BirdieServer(caddy_admin_url).app
\ No newline at end of file
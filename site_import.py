@@ -0,0 +1,177 @@
+"""
+    Bulk import of sites from streamed uploads.
+    An `ImportJob` reads site records from an NDJSON or CSV upload as it arrives, compiles them
+    with `route_compiler` and appends the routes to a server in large batches, one Caddy request
+    per batch. Progress is published to an `EventBroker`, so clients can follow an import over
+    Server-Sent Events while the upload is still running.
+"""
+import logging
+import threading
+import time
+import uuid
+from route_compiler import RouteCompileError, compile_route, read_records
+from sse import EventBroker
+
+# Keep the error list of a job bounded, however broken the upload is
+MAX_ERRORS = 1000
+
+
+class ImportJob:
+    """
+    One bulk import of sites into a Caddy server.
+
+    Attributes:
+        id (str): The unique ID of the job.
+        server (str): The HTTP server the routes are added to.
+        format (str): The format of the upload, "ndjson" or "csv".
+        batch_size (int): The number of routes added per Caddy request.
+        skip_existing (bool): Skip sites whose host already has a route.
+        dry_run (bool): Only validate and compile the records.
+        status (str): "pending", "running", "completed" or "failed".
+        broker (EventBroker): Publishes the progress of the job.
+    """
+
+    def __init__(self, caddy_api, server='srv0', format='ndjson', batch_size=500, skip_existing=True, dry_run=False,
+                 host_exists=None):
+        """
+        Creates a pending job.
+
+        Args:
+            caddy_api (CaddyAPI): The client the routes are added through.
+            server (str, optional): The HTTP server the routes are added to. Defaults to "srv0".
+            format (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+            batch_size (int, optional): The number of routes added per Caddy request. Defaults to 500.
+            skip_existing (bool, optional): Skip sites whose host already has a route. Defaults to True.
+            dry_run (bool, optional): Only validate and compile the records. Defaults to False.
+            host_exists (callable, optional): Returns whether a host already has a route, e.g.
+                `RouteIndex.has_host`. Required for `skip_existing`.
+        """
+        if format not in ('ndjson', 'csv'):
+            raise ValueError(f'Unsupported import format: {format}')
+        if batch_size < 1:
+            raise ValueError('"batch_size" must be at least 1.')
+        self.caddy_api = caddy_api
+        self.id = uuid.uuid4().hex
+        self.server = server
+        self.format = format
+        self.batch_size = batch_size
+        self.skip_existing = skip_existing
+        self.dry_run = dry_run
+        self.host_exists = host_exists
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = 'pending'
+        self.records = 0
+        self.added = 0
+        self.skipped = 0
+        self.batches = 0
+        self.errors = []
+        self.error_count = 0
+        self.broker = EventBroker()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        """
+        str: The configuration path of the routes array the sites are added to.
+        """
+        return f'apps/http/servers/{self.server}/routes'
+
+    def describe(self):
+        """
+        Describe the progress of the job.
+
+        Returns:
+            dict: The options, status and counters of the job and the first errors.
+        """
+        return {
+            'id': self.id,
+            'server': self.server,
+            'format': self.format,
+            'batch_size': self.batch_size,
+            'dry_run': self.dry_run,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'records': self.records,
+            'added': self.added,
+            'skipped': self.skipped,
+            'batches': self.batches,
+            'error_count': self.error_count,
+            'errors': self.errors[:MAX_ERRORS],
+        }
+
+    def _progress(self, event):
+        self.broker.publish(self.describe() if event != 'progress' else {
+            key: value for key, value in self.describe().items() if key != 'errors'
+        }, event=event, id=self.records)
+
+    def _error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def _flush(self, batch):
+        if batch and not self.dry_run:
+            self.caddy_api.add_to_config_array(self.path, batch)
+        self.added += len(batch)
+        self.batches += 1 if batch else 0
+        self._progress('progress')
+
+    def run(self, stream):
+        """
+        Import the sites of an upload, reading, compiling and applying it batch by batch.
+        Invalid records are reported and skipped; a failing Caddy request stops the job, and the
+        batches added before it are kept.
+
+        Args:
+            stream (file-like): The binary upload stream.
+
+        Returns:
+            dict: The final description of the job.
+
+        Raises:
+            RuntimeError: If the job already ran.
+        """
+        with self._lock:
+            if self.status != 'pending':
+                raise RuntimeError(f'Import {self.id} is already {self.status}.')
+            self.status = 'running'
+        self._progress('started')
+        hosts = set()
+        batch = []
+        try:
+            for line, record in read_records(stream, self.format):
+                self.records += 1
+                if isinstance(record, RouteCompileError):
+                    self._error(line, str(record))
+                    continue
+                try:
+                    route = compile_route(record)
+                except RouteCompileError as e:
+                    self._error(line, str(e))
+                    continue
+                host = route['match'][0]['host'][0]
+                if host in hosts:
+                    self._error(line, f'Duplicate site in upload: {host}')
+                    continue
+                hosts.add(host)
+                if self.skip_existing and self.host_exists is not None and self.host_exists(host):
+                    self.skipped += 1
+                    continue
+                batch.append(route)
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            self._flush(batch)
+            self.status = 'completed'
+        except Exception as e:
+            self.logger.error(f'Error importing sites in job {self.id}: {e}')
+            self._error(None, str(e))
+            self.status = 'failed'
+        self.finished_at = time.time()
+        self.logger.debug('Import %s %s: %d records, %d added, %d skipped, %d errors', self.id, self.status,
+                          self.records, self.added, self.skipped, self.error_count)
+        self._progress(self.status)
+        return self.describe()
@@ -0,0 +1,273 @@
+"""
+    Server-Sent Events helpers.
+    `EventBroker` fans events out from one producer (e.g. a background sampler) to any number
+    of subscribers. Each event is encoded once and queued per subscriber, so slow clients
+    never block the producer or each other. Subscribers are either thread-safe queues read by
+    WSGI workers or `AsyncSubscriber` queues read by coroutines of an asyncio event loop, and an
+    `EventSubscription` serves either as the body of a stream.
+"""
+import asyncio
+import json_codec
+import queue
+import threading
+
+HEARTBEAT = b': keepalive\n\n'
+
+
+def format_event(data, event=None, id=None):
+    """
+    Encode an event in the Server-Sent Events wire format.
+
+    Args:
+        data (any): The JSON serializable payload of the event.
+        event (str, optional): The event type.
+        id (any, optional): The event ID clients resume from with `Last-Event-ID`.
+
+    Returns:
+        bytes: The encoded event.
+    """
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}\n'.encode('utf-8'))
+    if event:
+        lines.append(f'event: {event}\n'.encode('utf-8'))
+    lines.append(b'data: ' + json_codec.dumps(data) + b'\n\n')
+    return b''.join(lines)
+
+
+def _ends_stream(message, markers):
+    """
+    Check whether an encoded event has one of the event type lines that end a stream.
+    """
+    return any(message.startswith(marker) or b'\n' + marker in message for marker in markers)
+
+
+class AsyncSubscriber:
+    """
+    A subscriber queue read by a coroutine. Producer threads publish to it through the event loop,
+    so a waiting subscriber costs no thread, however many of them there are.
+
+    Attributes:
+        maxsize (int): The number of events buffered before the oldest are dropped.
+    """
+
+    def __init__(self, maxsize=256, loop=None):
+        """
+        Initializes an empty queue.
+
+        Args:
+            maxsize (int, optional): The number of events buffered. Defaults to 256.
+            loop (asyncio.AbstractEventLoop, optional): The loop the subscriber is read on. Defaults to the running loop.
+        """
+        self.maxsize = maxsize
+        self.loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+
+    def put_nowait(self, message):
+        """
+        Queue an encoded event from any thread, dropping the oldest one if the queue is full.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The event loop is closed, so nobody reads this subscriber any more
+            pass
+
+    def _put(self, message):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """
+        Wait for the next encoded event.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to waiting forever.
+
+        Returns:
+            bytes: The encoded event.
+
+        Raises:
+            asyncio.TimeoutError: If no event arrived in time.
+        """
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class EventBroker:
+    """
+    Publishes encoded events to a set of subscriber queues.
+
+    Attributes:
+        max_queue (int): The number of events buffered per subscriber before the oldest are dropped.
+    """
+
+    def __init__(self, max_queue=256):
+        """
+        Initializes a broker without subscribers.
+
+        Args:
+            max_queue (int, optional): The number of events buffered per subscriber. Defaults to 256.
+        """
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        """
+        int: The number of current subscribers.
+        """
+        return len(self._subscribers)
+
+    def subscribe(self, subscriber=None):
+        """
+        Add a subscriber.
+
+        Args:
+            subscriber (AsyncSubscriber, optional): The queue to add, for subscribers read on an
+                event loop. Defaults to a new thread-safe queue.
+
+        Returns:
+            queue.Queue or AsyncSubscriber: The queue the subscriber receives encoded events on.
+        """
+        if subscriber is None:
+            subscriber = queue.Queue(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Remove a subscriber.
+
+        Args:
+            subscriber (queue.Queue or AsyncSubscriber): The queue returned by `subscribe`.
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, data, event=None, id=None):
+        """
+        Encode an event once and queue it for every subscriber.
+
+        Args:
+            data (any): The JSON serializable payload of the event.
+            event (str, optional): The event type.
+            id (any, optional): The event ID.
+        """
+        message = format_event(data, event, id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Drop the oldest event rather than block the producer on a slow client
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    pass
+
+    def stream(self, subscriber, initial=(), heartbeat=15, until=()):
+        """
+        Yield the encoded events of a subscriber until the client disconnects.
+
+        Args:
+            subscriber (queue.Queue): The queue returned by `subscribe`.
+            initial (iterable, optional): Encoded events to send before the queued ones.
+            heartbeat (float, optional): Seconds of silence after which a keepalive comment is sent.
+            until (iterable, optional): Event types that end the stream after they are sent.
+
+        Yields:
+            bytes: The next encoded event or keepalive comment.
+        """
+        markers = [f'event: {event}\n'.encode('utf-8') for event in until]
+        try:
+            for message in initial:
+                yield message
+                if _ends_stream(message, markers):
+                    return
+            while True:
+                try:
+                    message = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield HEARTBEAT
+                    continue
+                yield message
+                if _ends_stream(message, markers):
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def stream_async(self, subscriber, initial=(), heartbeat=15, until=()):
+        """
+        Yield the encoded events of an `AsyncSubscriber` until the client disconnects, as `stream` does.
+
+        Args:
+            subscriber (AsyncSubscriber): The queue returned by `subscribe`.
+            initial (iterable, optional): Encoded events to send before the queued ones.
+            heartbeat (float, optional): Seconds of silence after which a keepalive comment is sent.
+            until (iterable, optional): Event types that end the stream after they are sent.
+
+        Yields:
+            bytes: The next encoded event or keepalive comment.
+        """
+        markers = [f'event: {event}\n'.encode('utf-8') for event in until]
+        try:
+            for message in initial:
+                yield message
+                if _ends_stream(message, markers):
+                    return
+            while True:
+                try:
+                    message = await subscriber.get(heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                yield message
+                if _ends_stream(message, markers):
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class EventSubscription:
+    """
+    A subscriber of a broker together with the events to send it first, so the WSGI and the ASGI
+    endpoints of a stream share how it is set up and only differ in how it is read.
+
+    Attributes:
+        broker (EventBroker): The broker subscribed to.
+        subscriber (queue.Queue or AsyncSubscriber): The queue returned by `EventBroker.subscribe`.
+        initial (list): Encoded events to send before the queued ones.
+        until (tuple): Event types that end the stream after they are sent.
+    """
+
+    def __init__(self, broker, subscriber, initial=(), until=()):
+        self.broker = broker
+        self.subscriber = subscriber
+        self.initial = list(initial)
+        self.until = tuple(until)
+
+    def stream(self, heartbeat=15):
+        """
+        Yield the encoded events of a thread-safe subscriber, see `EventBroker.stream`.
+        """
+        return self.broker.stream(self.subscriber, self.initial, heartbeat, self.until)
+
+    def stream_async(self, heartbeat=15):
+        """
+        Yield the encoded events of an `AsyncSubscriber`, see `EventBroker.stream_async`.
+        """
+        return self.broker.stream_async(self.subscriber, self.initial, heartbeat, self.until)
+
+    def close(self):
+        """
+        Unsubscribe without streaming, e.g. when the client is gone before the stream starts.
+        """
+        self.broker.unsubscribe(self.subscriber)
@@ -65,6 +65,30 @@ const api_mapping = [
         method: 'POST',
         description: 'Load a new configuration',
     },
+    {
+        id: 'openChangeSet',
+        url: '/changesets',
+        method: 'POST',
+        description: 'Open a change set to batch many mutations',
+    },
+    {
+        id: 'queueChangeSetOperations',
+        url: '/changesets/:id/operations',
+        method: 'POST',
+        description: 'Queue operations in a change set',
+    },
+    {
+        id: 'commitChangeSet',
+        url: '/changesets/:id/commit',
+        method: 'POST',
+        description: 'Commit a change set with a single reload',
+    },
+    {
+        id: 'discardChangeSet',
+        url: '/changesets/:id',
+        method: 'DELETE',
+        description: 'Discard a change set',
+    },
 ];
 
 function genUrl(id, params) {
@@ -96,4 +120,20 @@ async function apiRequest(id, params = [], body = null) {
     };
     const response = await fetch(url, options);
     return response.json();
-}
\ No newline at end of file
+}
+
+async function applyChangeSet(operations) {
+    // Queue the operations in one change set, so Caddy reloads once for the whole batch
+    const opened = await apiRequest('openChangeSet');
+    if (!opened.id) {
+        throw new Error(opened.error || 'Could not open a change set');
+    }
+    const params = [['id', opened.id]];
+    const queued = await apiRequest('queueChangeSetOperations', params, { operations });
+    const result = queued.error ? queued : await apiRequest('commitChangeSet', params);
+    if (result.error) {
+        await apiRequest('discardChangeSet', params);
+        throw new Error(result.error);
+    }
+    return result;
+}
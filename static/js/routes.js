@@ -269,7 +269,7 @@ function returnStaticRouteHandle(handleOptions, generalOptionsValues) {
             "match": [
               {
                 "host": [
-                    getOptionValue(generalOptionsValues, 'siteURL', null)?.siteURL
+                    getOptionValue(generalOptionsValues, 'siteURL', null)
                 ]
               }
             ],
@@ -385,40 +385,47 @@ function convertWorkspaceToHandle() {
 
 
 
+async function findServerForHost(host, defaultServer = 'srv0') {
+    // Ask the route index which server already handles the host
+    if (!host) {
+        return defaultServer;
+    }
+    try {
+        const response = await fetch(`/routes/lookup?host=${encodeURIComponent(host)}`);
+        if (!response.ok) {
+            return defaultServer;
+        }
+        const result = await response.json();
+        if (debug) {
+            console.log('Route lookup:', result);
+        }
+        return result.servers?.[0] || defaultServer;
+    } catch (error) {
+        console.error('Error looking up server for host:', error);
+        return defaultServer;
+    }
+}
+
 async function addHandleToCaddy(newHandle) {
-    spinner(1000); // Show spinner
     if (newHandle === null) {
         console.error('No handle to add');
         return null;
     }
-    const path = "apps/http/servers/srv0/routes"; // The configuration path
-
-    return new Promise(async (resolve, reject) => {
-        try {
-            const response = await fetch('/config/array', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ path, items: [newHandle] }) // Send path and items
-            });
-
-            if (!response.ok) {
-                const errorDetails = await response.json();
-                reject(new Error(`Server error: ${response.status} - ${errorDetails.error || 'Unknown error'}`));
-                return;
-            }
-
-            const result = await response.json();
-            console.log('Handle added successfully:', result);
-            spinner(0, true); // Hide spinner
-            resolve(result); // Resolve the promise with the result
-        } catch (error) {
-            console.error('Error adding handle:', error);
-            spinner(0, true); // Hide spinner
-            reject(error); // Reject the promise with the error
-        }
-    });
+    spinner(1000); // Show spinner
+    const server = await findServerForHost(newHandle.match?.[0]?.host?.[0]);
+    const path = `apps/http/servers/${server}/routes`; // The configuration path
+
+    try {
+        // Committed as a change set: one request guarded by the config's Etag, rolled back on failure
+        const result = await applyChangeSet([{ action: 'add', path, items: [newHandle] }]);
+        console.log('Handle added successfully:', result);
+        return result;
+    } catch (error) {
+        console.error('Error adding handle:', error);
+        throw error;
+    } finally {
+        spinner(0, true); // Hide spinner
+    }
 }
 
 function handleDrop(event, dropzone, pallete) {
@@ -0,0 +1,32 @@
+"""
+    Shared fixtures. The modules of Birdie live at the repository root, so it is put on the path.
+"""
+import copy
+import os
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.configs import generate_config
+from benchmarks.fake_caddy import FakeCaddy
+
+
+@pytest.fixture
+def config():
+    """
+    A small synthetic configuration with two servers.
+    """
+    return generate_config(20, 2)
+
+
+@pytest.fixture
+def fake_caddy(config):
+    """
+    A fake Caddy admin API serving a copy of `config`.
+    """
+    fake = FakeCaddy(copy.deepcopy(config)).start()
+    yield fake
+    fake.stop()
@@ -0,0 +1,44 @@
+from adapt_cache import AdaptCache, cache_key
+from caddy_api import CaddyAPI
+
+
+def test_equivalent_configs_share_a_key():
+    assert cache_key('example.com {\r\n}\r\n\n', 'text/caddyfile') == cache_key('example.com {\n}', 'text/caddyfile')
+    assert cache_key({'a': 1, 'b': 2}, 'application/json') == cache_key({'b': 2, 'a': 1}, 'application/json')
+    assert cache_key('example.com', 'text/caddyfile; charset=utf-8') == cache_key('example.com', 'TEXT/CADDYFILE')
+    assert cache_key('example.com', 'text/caddyfile') != cache_key('example.com', 'application/nginx')
+
+
+def test_hits_refresh_the_least_recently_used_order():
+    cache = AdaptCache(max_entries=2)
+    cache.put('a', b'{"result": "a"}')
+    cache.put('b', b'{"result": "b"}')
+    assert cache.get('a') == b'{"result": "a"}'
+    cache.put('c', b'{"result": "c"}')
+    # b was used least recently, so it went first
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats() == {'entries': 2, 'bytes': 30, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_rate': 0.75}
+
+
+def test_byte_limit_evicts_and_skips_oversized_results():
+    cache = AdaptCache(max_entries=10, max_bytes=9)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.put('a', b'123456')
+    # Replacing an entry accounts for its old size, then the oldest entries make room
+    assert cache.stats()['bytes'] == 6
+    assert cache.get('b') is None
+    cache.put('huge', b'x' * 10)
+    assert cache.get('huge') is None
+    assert cache.stats()['entries'] == 1
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+
+
+def test_repeated_adapts_reach_caddy_once(fake_caddy):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    first = caddy_api.adapt_config('example.com {\n}\n', 'text/caddyfile')
+    assert caddy_api.adapt_config('example.com {\r\n}', 'text/caddyfile') == first
+    assert fake_caddy.requests['POST'] == 1
+    assert caddy_api.adapt_cache.stats()['hits'] == 1
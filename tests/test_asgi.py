@@ -0,0 +1,132 @@
+import asyncio
+import copy
+import threading
+import httpx
+from asgi import BirdieASGI
+from server import BirdieServer
+
+
+def birdie_asgi(fake_caddy):
+    return BirdieASGI(BirdieServer(fake_caddy.url, sampler_interval=0), heartbeat=1, workers=4)
+
+
+async def get(app, path, **kwargs):
+    return await call(app, 'GET', path, **kwargs)
+
+
+async def call(app, method, path, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url='http://birdie') as client:
+        return await client.request(method, path, **kwargs)
+
+
+def run(app, requests):
+    """
+    Send requests to the app on one event loop, which the connections of its Caddy client belong to.
+    """
+    async def send():
+        try:
+            return [await call(app, method, path, **kwargs) for method, path, kwargs in requests]
+        finally:
+            await app.caddy_api.close()
+    return asyncio.run(send())
+
+
+def test_flask_endpoints_are_bridged(fake_caddy):
+    app = birdie_asgi(fake_caddy)
+    nodes, missing = run(app, [('GET', '/fleet/nodes', {}), ('GET', '/config/changes/', {})])
+    assert nodes.status_code == 200
+    assert missing.status_code == 404
+
+
+def test_caddy_endpoints_are_served_natively(fake_caddy, config):
+    app = birdie_asgi(fake_caddy)
+    listen = 'apps/http/servers/srv0/listen'
+    blocking_reads = app.birdie.caddy_api.singleflight.stats()['leaders']
+    read, page, updated, bad, reread = run(app, [
+        ('GET', '/config', {'params': {'path': listen}}),
+        ('GET', '/config', {'params': {'path': 'apps/http/servers/srv0/routes', 'limit': 2, 'fields': 'handle'}}),
+        ('POST', '/config', {'json': {'path': listen, 'value': [':8443']}}),
+        ('POST', '/config', {'json': {'path': listen}}),
+        ('GET', '/config', {'params': {'path': listen}}),
+    ])
+    assert read.json() == config['apps']['http']['servers']['srv0']['listen']
+    assert page.json()['total'] == len(config['apps']['http']['servers']['srv0']['routes'])
+    assert len(page.json()['items']) == 2
+    assert updated.status_code == 200
+    assert bad.status_code == 400
+    assert bad.json() == {'error': 'Invalid request. "path" and "value" are required.'}
+    assert reread.json() == [':8443']
+    assert fake_caddy.snapshot()['apps']['http']['servers']['srv0']['listen'] == [':8443']
+    # The blocking client sent nothing, every request went through the async one
+    assert app.birdie.caddy_api.singleflight.stats()['leaders'] == blocking_reads
+    assert app.caddy_api.singleflight.stats()['leaders'] > 0
+
+
+def test_native_apply_and_adapt(fake_caddy, config):
+    app = birdie_asgi(fake_caddy)
+    desired = copy.deepcopy(config)
+    desired['apps']['http']['servers']['srv0']['listen'] = [':8443']
+    desired['apps']['http']['servers']['srv1']['listen'] = [':9443']
+    plan, applied, stale, adapted, invalid = run(app, [
+        ('POST', '/config/plan', {'json': {'config': desired}}),
+        ('POST', '/config/apply', {'json': {'config': desired}}),
+        ('POST', '/config/apply', {'json': {}}),
+        ('POST', '/adapt', {'content': b'example.com {\n}\n', 'headers': {'Content-Type': 'text/caddyfile'}}),
+        ('POST', '/adapt', {'content': b'{', 'headers': {'Content-Type': 'application/json'}}),
+    ])
+    assert len(plan.json()['operations']) == 2
+    assert applied.json()['applied'] is True
+    assert fake_caddy.snapshot() == desired
+    assert stale.json() == {'error': 'Invalid request. "config" is required.'}
+    assert adapted.status_code == 200
+    assert 'result' in adapted.json()
+    assert invalid.json() == {'error': 'Invalid JSON format.'}
+
+
+def test_long_poll_waits_for_a_change(fake_caddy):
+    app = birdie_asgi(fake_caddy)
+
+    async def poll():
+        latest = (await get(app, '/config/changes')).json()['generation']
+        assert (await get(app, '/config/changes', params={'since': latest, 'timeout': 0})).json()['changes'] == []
+        change = threading.Timer(0.2, app.birdie.caddy_api.replace_config_value,
+                                 ('apps/http/servers/srv0/listen', [':8443']))
+        change.start()
+        try:
+            return (await get(app, '/config/changes', params={'since': latest, 'timeout': 10})).json()
+        finally:
+            change.join()
+
+    result = asyncio.run(poll())
+    assert result['changes'][0]['operations'] == [
+        {'op': 'PATCH', 'path': 'apps/http/servers/srv0/listen/0', 'value': ':8443'}]
+
+
+def test_event_stream_unsubscribes_on_disconnect(fake_caddy):
+    app = birdie_asgi(fake_caddy)
+    broker = app.birdie.change_feed.broker
+    disconnected = asyncio.Event()
+    messages = []
+
+    async def receive():
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if message['type'] == 'http.response.body':
+            disconnected.set()
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/config/changes/stream', 'raw_path': b'/config/changes/stream',
+             'query_string': b'', 'headers': [], 'root_path': ''}
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), 10))
+    assert messages[0]['status'] == 200
+    assert (b'content-type', b'text/event-stream; charset=utf-8') in messages[0]['headers']
+    assert messages[1]['body'].startswith(b'id: ')
+    assert broker.subscriber_count == 0
+
+
+def test_unknown_import_is_not_found(fake_caddy):
+    response = asyncio.run(get(birdie_asgi(fake_caddy), '/import/missing/events'))
+    assert response.status_code == 404
+    assert response.json() == {'error': 'Unknown import: missing'}
@@ -0,0 +1,30 @@
+from server import BirdieServer
+
+
+def test_assets_are_compressed_at_startup(fake_caddy):
+    birdie = BirdieServer(fake_caddy.url, sampler_interval=0)
+    stats = birdie.assets.stats()
+    assert stats['assets'] and stats['compressed'] == stats['assets']
+    assert set(birdie.startup['steps']) == {'construct', 'assets', 'config', 'route_index'}
+
+
+def test_assets_are_compressed_on_first_use_without_prewarming(fake_caddy):
+    birdie = BirdieServer(fake_caddy.url, sampler_interval=0, prewarm=False)
+    assert birdie.assets.stats()['compressed'] == 0
+    with birdie.app.test_request_context():
+        url = birdie.assets.url('js/routes.js')
+    response = birdie.app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert birdie.assets.stats()['compressed'] == 1
+
+
+def test_fingerprinted_assets_are_immutable(fake_caddy):
+    birdie = BirdieServer(fake_caddy.url, sampler_interval=0)
+    client = birdie.app.test_client()
+    with birdie.app.test_request_context():
+        url = birdie.assets.url('js/routes.js')
+    response = client.get(url, headers={'Accept-Encoding': 'gzip;q=0, br'})
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers.get('Content-Encoding') in ('br', None)
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag'],
+                                    'Accept-Encoding': 'gzip;q=0, br'}).status_code == 304
@@ -0,0 +1,74 @@
+import asyncio
+import copy
+import pytest
+from async_caddy_api import AsyncCaddyAPI, AsyncSingleFlight
+from caddy_api import CaddyAPI, ConfigConflictError
+
+
+def test_reads_and_writes_share_the_blocking_client(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    mutations = []
+    caddy_api.add_mutation_listener(lambda paths: mutations.append(('before', paths)), before=True)
+    caddy_api.add_mutation_listener(lambda paths: mutations.append(('after', paths)))
+
+    async def run():
+        client = AsyncCaddyAPI(caddy_api)
+        try:
+            assert await client.get_config('apps/http/servers/srv0/listen') == [':443']
+            await client.replace_config_value('apps/http/servers/srv0/listen', [':8443'])
+            return await client.get_config('apps/http/servers/srv0/listen')
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == [':8443']
+    assert caddy_api.get_config('apps/http/servers/srv0/listen') == [':8443']
+    assert mutations == [('before', ['apps/http/servers/srv0/listen']), ('after', ['apps/http/servers/srv0/listen'])]
+
+
+def test_singleflight_survives_the_leader_giving_up():
+    singleflight = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'config'
+
+    async def run():
+        leader = asyncio.ensure_future(singleflight.do('config', work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(singleflight.do('config', work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == 'config'
+    assert calls == [1]
+    assert singleflight.stats() == {'leaders': 1, 'coalesced': 1, 'in_flight': 0}
+
+
+def test_apply_collapses_and_rejects_stale_plans(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    caddy_api.max_chained_operations = 1
+    desired = copy.deepcopy(config)
+    for server in desired['apps']['http']['servers'].values():
+        server['listen'] = [':8443']
+
+    async def run():
+        client = AsyncCaddyAPI(caddy_api)
+        try:
+            _, etag = await client.current_config()
+            operations = await client.apply_config(desired)
+            with pytest.raises(ConfigConflictError):
+                await client.apply_operations(operations, etag)
+            return operations
+        finally:
+            await client.close()
+
+    writes = fake_caddy.requests.get('PATCH', 0)
+    assert len(asyncio.run(run())) == 2
+    assert fake_caddy.snapshot() == desired
+    # The two operations were collapsed into one write of the servers they share
+    assert fake_caddy.requests['PATCH'] == writes + 1
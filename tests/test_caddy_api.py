@@ -0,0 +1,77 @@
+import logging
+import pytest
+import json_codec
+from benchmarks.configs import generate_config
+from benchmarks.fake_caddy import FakeCaddy
+from caddy_api import CaddyAPI, LogPayload
+from server import BirdieServer
+
+
+def test_cached_config_is_trusted_for_the_ttl(fake_caddy):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    first = caddy_api.get_config()
+    assert caddy_api.get_config() is first
+    assert fake_caddy.requests['GET'] == 1
+
+
+def test_mutation_invalidates_the_cache(fake_caddy):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    caddy_api.get_config()
+    caddy_api.replace_config_value('apps/http/servers/srv0/listen', [':8443'])
+    assert caddy_api.get_config('apps/http/servers/srv0/listen') == [':8443']
+
+
+def test_external_change_is_seen_after_the_ttl(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=0)
+    first = caddy_api.get_config()
+    # Caddy answers with the full config again; an unchanged Etag keeps the decoded snapshot
+    assert caddy_api.get_config() is first
+    config['apps']['http']['servers']['srv0']['listen'] = [':9443']
+    fake_caddy.load(config)
+    assert caddy_api.get_config('apps/http/servers/srv0/listen') == [':9443']
+    assert caddy_api.cache_stats()['misses'] == 2
+
+
+def test_log_payload_only_formats_the_ends_of_large_bodies():
+    body = b'{"apps": ' + b'x' * (20 * 1024 * 1024) + b'}'
+    for payload in (body, body.decode(), {'data': body}):
+        text = str(LogPayload(payload))
+        assert len(text) < 400
+        assert '...' in text
+    assert str(LogPayload(b'{}')) == "b'{}'"
+
+
+def test_client_leaves_the_log_level_to_the_application():
+    logger = logging.getLogger('caddy_api')
+    logger.setLevel(logging.NOTSET)
+    CaddyAPI('http://127.0.0.1:9')
+    assert logger.level == logging.NOTSET
+    assert all(handler.level == logging.NOTSET for handler in logger.handlers)
+
+
+@pytest.mark.parametrize('cache_config', [True, False])
+def test_raw_config_is_passed_through_flask_unchanged(cache_config, monkeypatch):
+    fake = FakeCaddy(generate_config(5000, 2)).start()
+    try:
+        birdie = BirdieServer(fake.url, sampler_interval=0, compress=False, prewarm=False,
+                              caddy_options={'cache_config': cache_config})
+        body, etag = fake.read('/config/')
+        assert len(body) > 1024 * 1024
+
+        def decoded(*args, **kwargs):
+            raise AssertionError('the body was decoded')
+
+        if not cache_config:
+            # The cache decodes the config once to serve paths, an uncached read never does
+            monkeypatch.setattr(json_codec, 'loads', decoded)
+        response = birdie.app.test_client().get('/config')
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'application/json'
+        assert response.headers['Etag'] == etag
+        chunks = list(response.response)
+        assert b''.join(chunks) == body
+        if not cache_config:
+            # Sent on in chunks as they arrive instead of being buffered
+            assert len(chunks) > 1
+    finally:
+        fake.stop()
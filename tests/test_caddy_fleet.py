@@ -0,0 +1,56 @@
+import threading
+import pytest
+from caddy_api import CaddyAPI
+from caddy_fleet import CaddyFleet
+
+
+def test_from_spec_registers_nodes_and_groups():
+    fleet = CaddyFleet.from_spec('{"edge-1": {"url": "http://10.0.0.1:2019", "groups": ["edge"]}, '
+                                 '"core": "http://10.0.0.2:2019"}')
+    assert fleet.describe() == {
+        'edge-1': {'api_url': 'http://10.0.0.1:2019', 'groups': ['edge']},
+        'core': {'api_url': 'http://10.0.0.2:2019', 'groups': []},
+    }
+    assert fleet.select(group='edge') == ['edge-1']
+    assert CaddyFleet.from_spec('a=http://10.0.0.1:2019, b=http://10.0.0.2:2019').select() == ['a', 'b']
+    with pytest.raises(KeyError):
+        fleet.select(['missing'])
+    with pytest.raises(ValueError):
+        CaddyFleet.from_spec('a')
+
+
+def test_call_reports_each_node(fake_caddy):
+    fleet = CaddyFleet()
+    fleet.add_node('up', fake_caddy.url)
+    fleet.add_node('down', CaddyAPI('http://127.0.0.1:9', retries=0))
+    try:
+        results = fleet.call('get_config', 'apps/http/servers/srv0/listen')
+    finally:
+        fleet.shutdown()
+    assert list(results) == ['up', 'down']
+    assert results['up']['status'] == 'ok'
+    assert results['up']['result'] == [':443']
+    assert results['down']['status'] == 'error'
+
+
+def test_unfinished_calls_are_pending_and_queued_ones_are_not_sent(fake_caddy):
+    fleet = CaddyFleet(max_workers=1)
+    fleet.add_node('slow', fake_caddy.url)
+    fleet.add_node('queued', fake_caddy.url)
+    release = threading.Event()
+    called = []
+
+    def hang(api):
+        called.append(api)
+        release.wait(10)
+        return 'applied'
+
+    try:
+        results = fleet.call(hang, timeout=0.1)
+    finally:
+        release.set()
+        fleet.shutdown()
+    # The slow node may still apply the call, so it must not be reported as failed outright
+    assert results['slow']['status'] == 'pending'
+    assert results['queued']['status'] == 'timeout'
+    assert len(called) == 1
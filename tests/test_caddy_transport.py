@@ -0,0 +1,205 @@
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from benchmarks.fake_caddy import FakeCaddy
+from caddy_api import CaddyAPI
+from caddy_transport import CaddyUnavailableError, CircuitBreaker, SingleFlight, parse_admin_address
+
+
+def test_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == 'half-open'
+    # Only one trial is in flight at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats() == {'state': 'closed', 'failures': 0}
+
+
+def test_trial_is_settled_by_any_error(monkeypatch):
+    caddy_api = CaddyAPI('http://127.0.0.1:9', breaker_threshold=1, breaker_reset_timeout=0.05, retries=0)
+    caddy_api.breaker.record_failure()
+    time.sleep(0.06)
+
+    def broken(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError('connection broken')
+
+    monkeypatch.setattr(caddy_api.session, 'request', broken)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        caddy_api.get_pki_ca('local')
+    assert caddy_api.breaker.state == 'open'
+    with pytest.raises(CaddyUnavailableError):
+        caddy_api.get_pki_ca('local')
+    time.sleep(0.06)
+    # A new trial is let through once the breaker has been open long enough again
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        caddy_api.get_pki_ca('local')
+
+
+@pytest.fixture
+def flaky():
+    """
+    A server answering 503 to the first request of every method, and 200 to the next ones.
+    """
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            status = 200 if self.command in seen else 503
+            seen.append(self.command)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        do_GET = do_POST = reply
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_reads_are_retried_and_writes_are_not(flaky):
+    url, seen = flaky
+    caddy_api = CaddyAPI(url, retries=2, backoff=0.01)
+    assert caddy_api.get_proxy_upstreams() == {}
+    assert seen == ['GET', 'GET']
+    with pytest.raises(requests.HTTPError) as error:
+        caddy_api.stop_server()
+    assert error.value.response.status_code == 503
+    assert seen == ['GET', 'GET', 'POST']
+    # A status answer means Caddy is reachable
+    assert caddy_api.breaker.state == 'closed'
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    caddy_api = CaddyAPI('http://127.0.0.1:9', backoff=1)
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    for attempt in range(6):
+        caddy_api._sleep_backoff(attempt)
+    assert all(0 <= delay <= min(caddy_api.max_backoff, 2 ** attempt) for attempt, delay in enumerate(sleeps))
+
+
+def test_unix_socket_admin_endpoint(config):
+    assert parse_admin_address('unix//run/caddy/admin.sock') == ('http://127.0.0.1', '/run/caddy/admin.sock')
+    fake = FakeCaddy(config)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'admin.sock')
+        server = socketserver.ThreadingUnixStreamServer(path, fake._handler_class())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            caddy_api = CaddyAPI(f'unix/{path}')
+            assert caddy_api.get_config('apps/http/servers/srv0/listen') == [':443']
+            caddy_api.replace_config_value('apps/http/servers/srv0/listen', [':8443'])
+            assert fake.snapshot()['apps']['http']['servers']['srv0']['listen'] == [':8443']
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def run_together(count, target):
+    results, errors = [None] * count, [None] * count
+
+    def call(position):
+        try:
+            results[position] = target()
+        except Exception as e:
+            errors[position] = e
+
+    threads = [threading.Thread(target=call, args=(position,)) for position in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_singleflight_shares_one_call_between_threads():
+    singleflight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return {'config': 'shared'}
+
+    threads, results, errors = run_together(16, lambda: singleflight.do('config', work))
+    # Let the leader finish only once every other caller waits for it
+    wait_for(lambda: singleflight.stats()['coalesced'] == 15)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert errors == [None] * 16
+    assert all(result is results[0] for result in results)
+    assert singleflight.stats() == {'leaders': 1, 'coalesced': 15, 'in_flight': 0}
+
+
+def test_singleflight_raises_the_error_in_every_waiter():
+    singleflight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise requests.ConnectionError('Caddy is down')
+
+    threads, results, errors = run_together(8, lambda: singleflight.do('config', fail))
+    wait_for(lambda: singleflight.stats()['coalesced'] == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [None] * 8
+    assert all(error is errors[0] for error in errors)
+    assert isinstance(errors[0], requests.ConnectionError)
+    # The next call starts afresh instead of replaying the error
+    assert singleflight.do('config', lambda: 'recovered') == 'recovered'
+
+
+def test_simultaneous_reads_make_one_request(config):
+    fake = FakeCaddy(config, latency=0.3).start()
+    try:
+        caddy_api = CaddyAPI(fake.url, cache_config=False)
+        barrier = threading.Barrier(12)
+
+        def read():
+            barrier.wait()
+            return caddy_api.get_proxy_upstreams()
+
+        threads, results, errors = run_together(12, read)
+        for thread in threads:
+            thread.join()
+        assert errors == [None] * 12
+        assert fake.requests == {'GET': 1}
+        assert caddy_api.singleflight.stats()['coalesced'] == 11
+    finally:
+        fake.stop()
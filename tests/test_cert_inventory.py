@@ -0,0 +1,64 @@
+import pytest
+from benchmarks.fake_caddy import CA_CERTIFICATE
+from caddy_api import CaddyAPI
+from cert_inventory import CertificateInventory, CertificateParseError, parse_certificate, pem_certificates
+
+# A version 1 certificate, which has no version field, with a subject longer than 127 bytes
+LEAF_CERTIFICATE = '''-----BEGIN CERTIFICATE-----
+MIIBlTCCATsCAQcwCgYIKoZIzj0EAwIwGzEZMBcGA1UEAwwQQmlyZGllIFRlc3Qg
+Um9vdDAeFw0yNjEwMTgwNjU0MjJaFw0yNjEwMjgwNjU0MjJaMIGRMTkwNwYDVQQK
+DDBCaXJkaWUgVGVzdCBPcmdhbml6YXRpb24gV2l0aCBBIFJhdGhlciBMb25nIE5h
+bWUxOTA3BgNVBAsMMEJpcmRpZSBUZXN0IFVuaXQgV2l0aCBBIFJhdGhlciBMb25n
+IE5hbWUgQXMgV2VsbDEZMBcGA1UEAwwQQmlyZGllIFRlc3QgTGVhZjBZMBMGByqG
+SM49AgEGCCqGSM49AwEHA0IABIjUcnnBXG0QByjLKIXuz2zCISIxVt70QZ0Hi9IO
+7C0jBRjja2ci/HwdHOKCoVVotkQg4rLBicn+Fn4ktPm2QMAwCgYIKoZIzj0EAwID
+SAAwRQIhAO+6PtX/3Vdpxl55pl/MAPMfc/GKKAPOr5vWmbdS9xpuAiA3tLA9N/np
+c9vz2ezYxUDLcepZ83HHRxv67PLNSZkeuw==
+-----END CERTIFICATE-----
+'''
+
+
+def test_parse_v3_certificate_with_generalized_time():
+    # The fields as `openssl x509 -noout -subject -issuer -serial -dates -fingerprint -sha256` shows them
+    assert parse_certificate(pem_certificates(CA_CERTIFICATE)[0]) == {
+        'subject': 'Birdie Benchmark Root CA',
+        'issuer': 'Birdie Benchmark Root CA',
+        'serial': '5462ed75be6db47d8223160741a202e8a5a61055',
+        'not_before': 1792302744,  # Oct 18 05:52:24 2026 GMT, a UTCTime
+        'not_after': 4945902744,  # Sep 24 05:52:24 2126 GMT, a GeneralizedTime
+        'fingerprint': '7e35932861d01df2c456e4d59eff3e6c9c9085de62bb3c92de166ccd263635cc',
+    }
+
+
+def test_parse_v1_certificate_with_long_subject():
+    assert parse_certificate(pem_certificates(LEAF_CERTIFICATE)[0]) == {
+        'subject': 'Birdie Test Leaf',
+        'issuer': 'Birdie Test Root',
+        'serial': '07',
+        'not_before': 1792306462,  # Oct 18 06:54:22 2026 GMT
+        'not_after': 1793170462,  # Oct 28 06:54:22 2026 GMT
+        'fingerprint': 'a6386b25d18b5ddd24e371f5bf4675f5e9eff8e24ef0bc8076bd8d6e9825f4fb',
+    }
+
+
+def test_pem_chain_is_split_in_order():
+    chain = pem_certificates(LEAF_CERTIFICATE + CA_CERTIFICATE)
+    assert [parse_certificate(der)['subject'] for der in chain] == ['Birdie Test Leaf', 'Birdie Benchmark Root CA']
+    assert pem_certificates(None) == []
+
+
+def test_truncated_certificate_is_rejected():
+    der = pem_certificates(LEAF_CERTIFICATE)[0]
+    with pytest.raises(CertificateParseError):
+        parse_certificate(der[:100])
+
+
+def test_inventory_indexes_expiry(fake_caddy, config):
+    config['apps']['pki'] = {'certificate_authorities': {'local': {'name': 'Local'}}}
+    fake_caddy.load(config)
+    inventory = CertificateInventory(CaddyAPI(fake_caddy.url))
+    assert inventory.refresh() == 2
+    assert inventory.errors == {}
+    assert [entry['role'] for entry in inventory.certificates('local')] == ['root', 'intermediate']
+    assert inventory.expiring(86400, now=4945902744 - 3600)[0]['expires_in'] == 3600
+    assert inventory.expiring(86400, now=1792302744) == []
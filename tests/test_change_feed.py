@@ -0,0 +1,23 @@
+from caddy_api import CaddyAPI
+from change_feed import ChangeFeed
+
+
+def test_changes_are_recorded_as_diffs(fake_caddy, config):
+    feed = ChangeFeed(CaddyAPI(fake_caddy.url, cache_ttl=0))
+    assert feed.poll() is False
+    assert feed.poll() is False
+    config['apps']['http']['servers']['srv1']['listen'] = [':8444']
+    fake_caddy.load(config)
+    assert feed.poll() is True
+
+    result = feed.changes(since=0)
+    assert result['generation'] == 1
+    assert result['changes'][0]['operations'] == [
+        {'op': 'PATCH', 'path': 'apps/http/servers/srv1/listen/0', 'value': ':8444'}]
+    assert feed.changes(since=feed.event_id(1))['changes'] == []
+
+
+def test_unknown_generation_resets(fake_caddy):
+    feed = ChangeFeed(CaddyAPI(fake_caddy.url))
+    feed.poll()
+    assert feed.changes(since='other:3')['reset'] is True
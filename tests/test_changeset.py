@@ -0,0 +1,91 @@
+import copy
+import pytest
+import requests
+from caddy_api import CaddyAPI, ConfigConflictError
+from changeset import ChangeSet, ChangeSetError
+from server import BirdieServer
+
+ROUTES = 'apps/http/servers/srv0/routes'
+
+
+def test_commit_is_one_write(fake_caddy, config):
+    changeset = ChangeSet(CaddyAPI(fake_caddy.url))
+    changeset.add(ROUTES, [{'@id': f'bulk-{index}'} for index in range(100)])
+    changeset.replace(f'{ROUTES}/0/terminal', False)
+    changeset.delete(f'{ROUTES}/1')
+    result = changeset.commit()
+
+    assert result == {'committed': 3, 'path': ROUTES, 'rolled_back': False}
+    assert fake_caddy.requests['PATCH'] == 1
+    routes = fake_caddy.snapshot()['apps']['http']['servers']['srv0']['routes']
+    assert routes[0]['terminal'] is False
+    assert len(routes) == len(config['apps']['http']['servers']['srv0']['routes']) - 1 + 100
+
+
+def test_commit_conflicts_with_a_concurrent_change(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    caddy_api.get_config()
+    changed = copy.deepcopy(config)
+    changed['admin']['listen'] = 'localhost:2020'
+    fake_caddy.load(changed)
+    changeset = ChangeSet(caddy_api)
+    changeset.replace(f'{ROUTES}/0/terminal', False)
+    with pytest.raises(ConfigConflictError):
+        changeset.commit()
+    assert fake_caddy.snapshot() == changed
+
+
+def test_operations_must_apply(fake_caddy):
+    changeset = ChangeSet(CaddyAPI(fake_caddy.url))
+    changeset.delete(f'{ROUTES}/999')
+    with pytest.raises(ChangeSetError):
+        changeset.commit()
+    with pytest.raises(ChangeSetError):
+        changeset.queue({'action': 'rename', 'path': ROUTES})
+
+
+def test_missing_root_is_a_change_set_error(fake_caddy):
+    changeset = ChangeSet(CaddyAPI(fake_caddy.url))
+    changeset.replace('apps/tls/automation/policies/0/issuers', [])
+    with pytest.raises(ChangeSetError):
+        changeset.commit()
+    assert not changeset.committed
+
+
+def test_rollback_does_not_overwrite_a_later_change(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=0)
+    changeset = ChangeSet(caddy_api)
+    changeset.replace(f'{ROUTES}/0/terminal', False)
+    first, second = copy.deepcopy(config), copy.deepcopy(config)
+    first['apps']['http']['servers']['srv0']['routes'][0]['@id'] = 'first'
+    second['apps']['http']['servers']['srv0']['routes'][0]['@id'] = 'second'
+    write = changeset._write
+    writes = []
+
+    def interleaved(root, value, etag=None):
+        # Another writer changes the routes right before each of the change set's writes
+        writes.append(etag)
+        fake_caddy.load(first if len(writes) == 1 else second)
+        if len(writes) == 1:
+            raise requests.ConnectionError('connection reset')
+        write(root, value, etag)
+
+    changeset._write = interleaved
+    with pytest.raises(ConfigConflictError):
+        changeset.commit()
+    assert writes[1] is not None
+    assert fake_caddy.snapshot() == second
+    assert not changeset.committed
+
+
+def test_ui_adds_a_route_through_a_change_set(fake_caddy):
+    # The requests `addHandleToCaddy` makes through `applyChangeSet` in static/js/apimgr.js
+    client = BirdieServer(fake_caddy.url, sampler_interval=0).app.test_client()
+    changeset_id = client.post('/changesets').get_json()['id']
+    route = {'@id': 'ui', 'match': [{'host': ['ui.test']}]}
+    queued = client.post(f'/changesets/{changeset_id}/operations',
+                         json={'operations': [{'action': 'add', 'path': ROUTES, 'items': [route]}]})
+    assert queued.get_json()['queued'] == 1
+    assert client.post(f'/changesets/{changeset_id}/commit').get_json()['committed'] == 1
+    assert fake_caddy.snapshot()['apps']['http']['servers']['srv0']['routes'][-1] == route
+    assert client.get(f'/changesets/{changeset_id}').status_code == 404
@@ -0,0 +1,126 @@
+import copy
+import pytest
+from benchmarks.fake_caddy import FakeCaddy
+from caddy_api import CaddyAPI, ConfigConflictError
+from config_diff import apply_operations, common_root, diff_config
+
+
+def routes(config, server='srv0'):
+    return config['apps']['http']['servers'][server]['routes']
+
+
+def edit(config):
+    """
+    Desired configurations covering inserts, deletes, appends, nested changes and new keys.
+    """
+    inserted = copy.deepcopy(config)
+    routes(inserted).insert(1, {'@id': 'new', 'match': [{'host': ['new.test']}]})
+    deleted = copy.deepcopy(config)
+    del routes(deleted)[2:4]
+    appended = copy.deepcopy(config)
+    routes(appended).extend([{'@id': 'tail-1'}, {'@id': 'tail-2'}])
+    nested = copy.deepcopy(config)
+    routes(nested)[0]['handle'][0]['routes'][0]['handle'][0]['response']['set']['X-Route'] = ['changed']
+    nested['apps']['tls'] = {'automation': {}}
+    reordered = copy.deepcopy(config)
+    routes(reordered).reverse()
+    return [inserted, deleted, appended, nested, reordered, {}]
+
+
+@pytest.mark.parametrize('index', range(6))
+def test_diff_applies_back_to_the_desired_config(config, index):
+    desired = edit(config)[index]
+    operations = diff_config(config, desired)
+    assert apply_operations(copy.deepcopy(config), operations) == desired
+
+
+def test_diff_touches_only_the_changed_route(config):
+    desired = copy.deepcopy(config)
+    routes(desired).insert(1, {'@id': 'new'})
+    assert diff_config(config, desired) == [
+        {'op': 'PUT', 'path': 'apps/http/servers/srv0/routes/1', 'value': {'@id': 'new'}}]
+
+
+def test_common_root():
+    assert common_root([{'op': 'DELETE', 'path': 'apps/http/servers/srv0/routes/3'},
+                        {'op': 'POST', 'path': 'apps/http/servers/srv0/routes/...', 'value': []}]) == \
+        'apps/http/servers/srv0/routes'.split('/')
+    assert common_root([{'op': 'PATCH', 'path': 'apps/http', 'value': {}},
+                        {'op': 'PUT', 'path': 'admin/listen', 'value': ':2019'}]) == []
+
+
+@pytest.mark.parametrize('index', range(5))
+def test_apply_config_round_trips_through_caddy(fake_caddy, config, index):
+    desired = edit(config)[index]
+    CaddyAPI(fake_caddy.url).apply_config(desired)
+    assert fake_caddy.snapshot() == desired
+
+
+def test_large_plans_are_collapsed_into_one_write(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    desired = copy.deepcopy(config)
+    for route in routes(desired):
+        route['terminal'] = False
+    operations = caddy_api.apply_config(desired)
+    assert len(operations) > caddy_api.max_chained_operations
+    assert fake_caddy.requests.get('PATCH') == 1
+    assert fake_caddy.snapshot() == desired
+
+
+def test_plans_are_collapsed_once_caddy_returns_no_etags(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    desired = copy.deepcopy(config)
+    routes(desired)[0]['terminal'] = False
+    routes(desired)[1]['terminal'] = False
+    caddy_api.apply_config(desired)
+    assert caddy_api.mutation_etags is False
+    assert fake_caddy.snapshot() == desired
+
+    writes = sum(fake_caddy.requests.get(method, 0) for method in ('PATCH', 'PUT', 'POST', 'DELETE'))
+    desired = copy.deepcopy(desired)
+    routes(desired)[2]['terminal'] = False
+    routes(desired)[3]['terminal'] = False
+    caddy_api.apply_config(desired)
+    assert sum(fake_caddy.requests.get(method, 0) for method in ('PATCH', 'PUT', 'POST', 'DELETE')) == writes + 1
+    assert fake_caddy.snapshot() == desired
+
+
+def test_small_plans_are_chained_with_etags(config):
+    fake = FakeCaddy(copy.deepcopy(config), mutation_etags=True).start()
+    try:
+        caddy_api = CaddyAPI(fake.url)
+        desired = copy.deepcopy(config)
+        routes(desired)[0]['terminal'] = False
+        routes(desired)[1]['terminal'] = False
+        caddy_api.apply_config(desired)
+        assert caddy_api.mutation_etags is True
+        assert fake.requests['PATCH'] == 2
+        assert fake.snapshot() == desired
+    finally:
+        fake.stop()
+
+
+@pytest.mark.parametrize('guarded', [True, False])
+def test_failed_plan_is_rolled_back(fake_caddy, config, guarded):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    current, etag = caddy_api.current_config()
+    operations = [
+        {'op': 'PATCH', 'path': 'apps/http/servers/srv0/listen', 'value': [':8443']},
+        {'op': 'DELETE', 'path': 'apps/http/servers/srv0/missing'},
+    ]
+    with pytest.raises(Exception):
+        caddy_api.apply_operations(operations, etag if guarded else None)
+    # The first operation and the rollback
+    assert fake_caddy.requests['PATCH'] == 2
+    assert fake_caddy.snapshot() == config
+
+
+def test_stale_plan_is_rejected(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    current, etag = caddy_api.current_config()
+    changed = copy.deepcopy(config)
+    changed['admin']['listen'] = 'localhost:2020'
+    fake_caddy.load(changed)
+    with pytest.raises(ConfigConflictError):
+        caddy_api.apply_operations([{'op': 'PATCH', 'path': 'apps/http/servers/srv0/listen', 'value': [':8443']}], etag)
+    assert fake_caddy.snapshot() == changed
@@ -0,0 +1,82 @@
+import copy
+from caddy_api import CaddyAPI
+from config_history import ARRAY_CHUNK, ConfigHistory, encode_tree
+
+
+def routes(config, server='srv0'):
+    return config['apps']['http']['servers'][server]['routes']
+
+
+def history(fake_caddy, tmp_path, **options):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    config_history = ConfigHistory(caddy_api, str(tmp_path / 'history.db'), **options)
+    config_history.flush()
+    return caddy_api, config_history
+
+
+def test_startup_and_changes_are_recorded(fake_caddy, config, tmp_path):
+    caddy_api, config_history = history(fake_caddy, tmp_path)
+    assert config_history.get(1) == config
+    caddy_api.replace_config_value('apps/http/servers/srv0/listen', [':8443'])
+    config_history.flush()
+    revisions = config_history.revisions()
+    assert [revision['reason'] for revision in revisions] == ['after apps/http/servers/srv0/listen', 'startup']
+    assert config_history.get(revisions[0]['rev'], 'apps/http/servers/srv0/listen') == [':8443']
+
+
+def test_mutations_do_not_read_the_config(fake_caddy, tmp_path):
+    caddy_api, config_history = history(fake_caddy, tmp_path, record_changes=False)
+    config_history._before_mutation(['apps/http'])
+    config_history.flush()
+    assert 'GET' not in fake_caddy.requests
+    assert config_history.revisions() == []
+
+
+def test_unchanged_config_is_recorded_once(fake_caddy, tmp_path):
+    caddy_api, config_history = history(fake_caddy, tmp_path)
+    caddy_api.get_config()
+    config_history._before_mutation(['apps/http'])
+    config_history.flush()
+    assert len(config_history.revisions()) == 1
+    config_history.record()
+    assert len(config_history.revisions()) == 1
+
+
+def test_rollback(fake_caddy, config, tmp_path):
+    caddy_api, config_history = history(fake_caddy, tmp_path)
+    caddy_api.replace_config_value('apps/http/servers/srv0/listen', [':8443'])
+    caddy_api.delete_config('apps/http/servers/srv0/routes/3')
+    config_history.flush()
+    operations = config_history.rollback(1)
+    assert fake_caddy.snapshot() == config
+    assert config_history.diff(1) == []
+    assert len(operations) == 2
+
+
+def test_long_arrays_share_unchanged_chunks(config):
+    config = copy.deepcopy(config)
+    routes(config).extend({'@id': f'route-{index}', 'terminal': True} for index in range(20 * ARRAY_CHUNK))
+    before = {}
+    encode_tree(config, before)
+    changed = copy.deepcopy(config)
+    routes(changed).insert(5 * ARRAY_CHUNK, {'@id': 'inserted'})
+    after = {}
+    encode_tree(changed, after)
+    new = [digest for digest in after if digest not in before]
+    # The inserted route, its chunk, the chunked array and the objects above it
+    assert len(new) <= 10
+
+
+def test_chunked_arrays_round_trip(fake_caddy, config, tmp_path):
+    caddy_api, config_history = history(fake_caddy, tmp_path, record_changes=False)
+    config = copy.deepcopy(config)
+    routes(config).extend({'@id': f'route-{index}'} for index in range(10 * ARRAY_CHUNK))
+    first = config_history.store(config)
+    changed = copy.deepcopy(config)
+    routes(changed)[7 * ARRAY_CHUNK]['terminal'] = True
+    second = config_history.store(changed)
+    assert config_history.get(first) == config
+    assert config_history.get(second, f'apps/http/servers/srv0/routes/{7 * ARRAY_CHUNK}') == {
+        '@id': f'route-{7 * ARRAY_CHUNK - 10}', 'terminal': True}
+    assert config_history.diff(first, second) == [
+        {'op': 'PUT', 'path': f'apps/http/servers/srv0/routes/{7 * ARRAY_CHUNK}/terminal', 'value': True}]
@@ -0,0 +1,46 @@
+import pytest
+from config_tree import ConfigPathError, get_node, query_node
+from server import BirdieServer
+
+ROUTES = 'apps/http/servers/srv0/routes'
+
+
+def test_get_node_follows_caddy_traversal(config):
+    assert get_node(config, '/apps/http/servers/srv0/listen/') == [':443']
+    assert get_node(config, f'{ROUTES}/1/@id') == 'route-2'
+    assert get_node(config, 'apps/http/servers/srv0/missing') is None
+    for path in ('apps/missing/servers', f'{ROUTES}/x', f'{ROUTES}/99', 'admin/listen/port'):
+        with pytest.raises(ConfigPathError):
+            get_node(config, path)
+
+
+def test_query_pages_filters_and_projects(config):
+    routes = get_node(config, ROUTES)
+    result = query_node(routes, offset=1, limit=2, fields=['@id', 'match'], filters={'host': ['*.tenant*.bench.test']})
+    # Every tenth route has a wildcard host, and srv0 has the even ones
+    assert result['total'] == 10
+    assert result['matched'] == 2
+    assert result['indexes'] == [5]
+    assert result['items'] == [{'@id': 'route-10', 'match': routes[5]['match']}]
+
+
+def test_filters_match_within_one_matcher_set():
+    route = {'match': [{'host': ['a.example.com']}, {'path': ['/api/*']}]}
+    assert query_node([route], filters={'host': ['a.example.com']})['matched'] == 1
+    assert query_node([route], filters={'host': ['a.example.com'], 'path': ['/api/*']})['matched'] == 0
+
+
+def test_depth_truncates_objects_and_arrays(config):
+    result = query_node(get_node(config, 'apps/http/servers'), depth=2)
+    assert result['total'] == 2
+    assert query_node(config, depth=1)['value']['apps'] == {'$truncated': 'object', '$count': 2}
+    assert result['value']['srv0'] == {'listen': {'$truncated': 'array', '$count': 1},
+                                       'routes': {'$truncated': 'array', '$count': 10}}
+
+
+def test_config_endpoint_reads_the_query(fake_caddy):
+    client = BirdieServer(fake_caddy.url, sampler_interval=0).app.test_client()
+    response = client.get('/config', query_string={'path': ROUTES, 'limit': 1, 'fields': '@id', 'match.host': 'site4.*'})
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [{'@id': 'route-4'}]
+    assert client.get('/config', query_string={'path': ROUTES, 'limit': -1}).status_code == 400
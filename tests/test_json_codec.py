@@ -0,0 +1,75 @@
+import json
+import json_codec
+from caddy_api import CaddyAPI, ConfigSnapshot
+from flask import Flask
+from server import CodecJSONProvider
+
+
+def test_remembered_encodings_are_recalled_by_key():
+    json_codec.remember('test-key', {'a': 1}, b'{"a":1}')
+    assert json_codec.recall('test-key') == b'{"a":1}'
+    json_codec.forget('test-key')
+    assert json_codec.recall('test-key') is None
+
+
+def test_forget_none_keeps_other_encodings():
+    json_codec.remember('kept', [1, 2])
+    json_codec.forget(None)
+    assert json_codec.recall('kept') == b'[1,2]'
+    json_codec.forget_all()
+    assert json_codec.recall('kept') is None
+
+
+def test_modified_objects_are_encoded_again():
+    value = {'routes': [1]}
+    json_codec.remember('modified', value)
+    value['routes'].append(2)
+    assert json.loads(json_codec.dumps(value)) == {'routes': [1, 2]}
+    json_codec.forget('modified')
+
+
+def test_snapshot_forgets_its_paths_on_release(config):
+    snapshot = ConfigSnapshot(config, json_codec.dumps(config), 'etag')
+    assert json.loads(snapshot.encode('apps/http/servers/srv0/listen')) == config['apps']['http']['servers']['srv0']['listen']
+    # A path that does not exist encodes as null and is forgotten like any other
+    assert snapshot.encode('apps/missing') == b'null'
+    snapshot.release()
+    assert json_codec.recall((snapshot, 'apps/http/servers/srv0/listen')) is None
+    assert json_codec.recall((snapshot, 'apps/missing')) is None
+
+
+def test_raw_reads_reuse_the_snapshot_encoding(fake_caddy):
+    caddy_api = CaddyAPI(fake_caddy.url, cache_ttl=60)
+    first = caddy_api.get_config('apps/http', raw=True).body
+    assert caddy_api.get_config('apps/http', raw=True).body is first
+
+
+def test_dumps_options():
+    value = {'b': 1, 'a': [1]}
+    assert json_codec.dumps(value, sort_keys=True) == b'{"a":[1],"b":1}'
+    assert json.loads(json_codec.dumps(value, indent=2)) == value
+    assert b'\n  "b": 1' in json_codec.dumps(value, indent=2)
+    assert json_codec.dumps(value, indent=4, sort_keys=True) == json.dumps(value, indent=4, sort_keys=True).encode()
+    assert json_codec.dumps({'a': 'é'}, ensure_ascii=True) == b'{"a":"\\u00e9"}'
+
+
+def test_flask_provider_passes_options():
+    app = Flask(__name__)
+    app.json = CodecJSONProvider(app)
+    assert app.json.dumps({'b': 1, 'a': 2}, sort_keys=True) == '{"a":2,"b":1}'
+    with app.app_context():
+        assert app.json.response({'b': 1}).get_data() == b'{"b":1}'
+        # Keys are sorted like with Flask's own provider
+        assert app.json.response({'b': 1, 'a': 2}).get_data() == b'{"a":2,"b":1}'
+    assert app.json.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+
+
+def test_recalled_encodings_are_evicted_last():
+    memo = json_codec._Memo(max_entries=2)
+    memo.put('a', b'1')
+    memo.put('b', b'2')
+    assert memo.get('a') == b'1'
+    memo.put('c', b'3')
+    assert memo.get('b') is None
+    assert memo.get('a') == b'1'
+    assert memo.stats() == {'entries': 2, 'bytes': 2, 'hits': 2}
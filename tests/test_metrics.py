@@ -0,0 +1,78 @@
+import re
+import pytest
+from metrics import LATENCY_BUCKETS, SIZE_BUCKETS, Counter, Histogram, Registry
+from server import BirdieServer
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+
+
+def scrape(client):
+    """
+    Parse the `/metrics` exposition into the declared types and a mapping of (name, labels) to value.
+    """
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    types, samples = {}, {}
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            name, labels, value = SAMPLE.match(line).groups()
+            samples[name, labels or ''] = float(value)
+    return types, samples
+
+
+def delta(before, after, name, labels):
+    return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+
+def test_metrics_count_requests_per_route(fake_caddy):
+    client = BirdieServer(fake_caddy.url, sampler_interval=0, compress=False).app.test_client()
+    _, before = scrape(client)
+    sizes = [len(client.get('/fleet/nodes').data) for _ in range(3)]
+    assert client.get('/config').status_code == 200
+    assert client.get('/config/array').status_code == 405
+    types, after = scrape(client)
+
+    assert types['birdie_http_requests_total'] == 'counter'
+    assert types['birdie_http_request_duration_seconds'] == 'histogram'
+    assert types['birdie_http_response_bytes'] == 'histogram'
+    assert types['birdie_http_requests_in_flight'] == 'gauge'
+    assert types['birdie_caddy_request_duration_seconds'] == 'histogram'
+    assert types['birdie_config_cache_hits_total'] == 'counter'
+    route = 'method="GET",route="/fleet/nodes"'
+    assert delta(before, after, 'birdie_http_requests_total', '{' + route + ',status="200"}') == 3
+    # Requests no rule matched share one label value, so scanners cannot blow up the label set
+    assert delta(before, after, 'birdie_http_requests_total', '{method="GET",route="<unmatched>",status="405"}') == 1
+
+    # Latency buckets are cumulative and end with +Inf, which equals the count
+    counts = [delta(before, after, 'birdie_http_request_duration_seconds_bucket', f'{{{route},le="{bound}"}}')
+              for bound in [f'{bound:g}' for bound in LATENCY_BUCKETS] + ['+Inf']]
+    assert counts == sorted(counts)
+    assert counts[-1] == 3
+    assert delta(before, after, 'birdie_http_request_duration_seconds_count', '{' + route + '}') == 3
+    assert delta(before, after, 'birdie_http_request_duration_seconds_sum', '{' + route + '}') > 0
+
+    # Every response lands in the first size bucket that holds it
+    for bound in SIZE_BUCKETS:
+        expected = sum(size <= bound for size in sizes)
+        assert delta(before, after, 'birdie_http_response_bytes_bucket', f'{{{route},le="{bound}"}}') == expected
+    assert delta(before, after, 'birdie_http_response_bytes_sum', '{' + route + '}') == sum(sizes)
+    assert after['birdie_http_requests_in_flight', ''] == 1
+
+
+def test_labels_are_escaped_and_checked():
+    registry = Registry()
+    counter = Counter('test_total', 'A test counter.', ['path'], registry=registry)
+    counter.labels('say "hi"\n').inc(2)
+    histogram = Histogram('test_seconds', 'A test histogram.', buckets=(1, 0.5), registry=registry)
+    histogram.labels().observe(0.7)
+    text = registry.expose()
+    assert 'test_total{path="say \\"hi\\"\\n"} 2' in text
+    assert 'test_seconds_bucket{le="0.5"} 0' in text
+    assert 'test_seconds_bucket{le="1"} 1' in text
+    assert 'test_seconds_bucket{le="+Inf"} 1' in text
+    with pytest.raises(ValueError):
+        counter.labels('a', 'b')
@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import pytest
+import route_compiler
+from route_compiler import RouteCompileError, compile_route, iter_lines, read_records
+
+RECORDS = [
+    {'siteURL': 'app.example.com', 'proxyURL': '10.0.0.5:8080'},
+    {'siteURL': 'files.example.com', 'folderPath': '/srv/files', 'browseable': True},
+    {'siteURL': 'www.example.com', 'folderPath': '/srv/www'},
+    {'siteURL': 'browse.example.com', 'browseable': True},
+    {'siteURL': 'plain.example.com'},
+]
+
+
+def js_builder(name, source):
+    match = re.search(r'^function ' + name + r'\(.*?^}', source, re.DOTALL | re.MULTILINE)
+    return match.group(0)
+
+
+def js_routes(records):
+    """
+    Build the routes of site records with the builders of the drag and drop workspace, in Node.
+    """
+    with open(os.path.join(os.path.dirname(route_compiler.__file__), 'static', 'js', 'routes.js')) as routes_js:
+        source = routes_js.read()
+    script = '\n'.join([
+        'const debug = false;',
+        js_builder('getOptionValue', source),
+        js_builder('returnProxyHandle', source),
+        js_builder('returnStaticRouteHandle', source),
+        f'const records = {json.dumps(records)};',
+        'console.log(JSON.stringify(records.map(record => {',
+        '    const general = [{siteURL: record.siteURL}];',
+        '    if (record.proxyURL) return returnProxyHandle([{proxyURL: record.proxyURL}], general);',
+        '    const options = [{browseable: !!record.browseable}];',
+        '    if (record.folderPath) options.push({folderPath: record.folderPath});',
+        '    return returnStaticRouteHandle(options, general);',
+        '})));',
+    ])
+    return json.loads(subprocess.run(['node', '-e', script], capture_output=True, check=True, text=True).stdout)
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='Node.js is not installed')
+def test_routes_match_the_workspace_builders():
+    assert [compile_route(record) for record in RECORDS] == js_routes(RECORDS)
+
+
+@pytest.mark.parametrize('record, error', [
+    ({'proxyURL': '10.0.0.5:8080'}, '"siteURL" is required.'),
+    ({'siteURL': 'bad host', 'proxyURL': '10.0.0.5:8080'}, '"siteURL" is not a valid host'),
+    ({'siteURL': 'a.example.com', 'type': 'reverse_proxy'}, '"proxyURL" is required'),
+    ({'siteURL': 'a.example.com', 'proxyURL': 'http://10.0.0.5'}, 'must be a host:port dial address'),
+    ({'siteURL': 'a.example.com', 'type': 'redirect'}, 'Unknown route type'),
+    ({'siteURL': 'a.example.com', 'browseable': 'maybe'}, '"browseable" must be a boolean'),
+])
+def test_invalid_records_are_rejected(record, error):
+    with pytest.raises(RouteCompileError, match=re.escape(error)):
+        compile_route(record)
+
+
+def test_records_are_read_from_csv_and_ndjson():
+    csv_body = '﻿type,siteURL,proxyURL,folderPath,browseable\n' \
+               'reverse_proxy,App.Example.com,10.0.0.5:8080,,\n' \
+               ',,,,\n' \
+               'static,files.example.com,,/srv/files,yes\n' \
+               'static,extra.example.com,,,,no\n'
+    records = list(read_records(io.BytesIO(csv_body.encode('utf-8')), 'csv'))
+    assert [number for number, _ in records] == [2, 4, 5]
+    assert compile_route(records[0][1]) == compile_route(RECORDS[0])
+    assert compile_route(records[1][1]) == compile_route(RECORDS[1])
+    assert isinstance(records[2][1], RouteCompileError)
+
+    ndjson_body = b'\n'.join(json.dumps(record).encode('utf-8') for record in RECORDS) + b'\n{broken\n'
+    records = list(read_records(io.BytesIO(ndjson_body)))
+    assert [record for _, record in records[:-1]] == RECORDS
+    assert records[-1][0] == len(RECORDS) + 1
+    assert isinstance(records[-1][1], RouteCompileError)
+
+
+def test_lines_are_not_split_at_chunk_boundaries():
+    body = b'first line\nsecond\n\nlast without newline'
+    assert list(iter_lines(io.BytesIO(body), chunk_size=4)) == [b'first line\n', b'second\n', b'\n', b'last without newline']
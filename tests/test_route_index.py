@@ -0,0 +1,77 @@
+import copy
+import pytest
+import requests
+from caddy_api import CaddyAPI
+from route_index import RouteIndex
+
+
+def index(fake_caddy, **options):
+    return RouteIndex(CaddyAPI(fake_caddy.url, cache_ttl=60), **options)
+
+
+def test_lookups(fake_caddy):
+    route_index = index(fake_caddy)
+    assert route_index.lookup_host('SITE2.bench.test:443')['routes'] == [
+        {'server': 'srv0', 'path': 'apps/http/servers/srv0/routes/1'}]
+    # route-10 matches *.tenant10.bench.test and proxies through a subroute
+    assert route_index.lookup_host('a.tenant10.bench.test')['routes'] == [
+        {'server': 'srv0', 'path': 'apps/http/servers/srv0/routes/5'}]
+    assert route_index.lookup_dial('10.0.0.10:8081') == [
+        {'server': 'srv0', 'path': 'apps/http/servers/srv0/routes/5/handle/0/routes/1',
+         'handler': 'apps/http/servers/srv0/routes/5/handle/0/routes/1/handle/0'}]
+    assert route_index.lookup_id('route-3') == [{'server': 'srv1', 'path': 'apps/http/servers/srv1/routes/1'}]
+    assert [entry['path'] for entry in route_index.lookup_path('/api/v1/users')] == [
+        'apps/http/servers/srv0/routes/0', 'apps/http/servers/srv1/routes/7']
+    assert list(route_index.search('host', 'site1', limit=3)) == ['site1.bench.test', 'site10.bench.test', 'site11.bench.test']
+
+
+def test_changes_through_the_client_reindex_only_their_server(fake_caddy):
+    route_index = index(fake_caddy)
+    route_index.refresh()
+    route_index.caddy_api.add_to_config_array('apps/http/servers/srv1/routes', [
+        {'@id': 'added', 'match': [{'host': ['added.example.com']}], 'handle': [{'handler': 'static_response'}]}])
+    gets = fake_caddy.requests.get('GET', 0)
+    assert route_index.lookup_host('added.example.com')['servers'] == ['srv1']
+    assert route_index.has_host('site2.bench.test')
+    # The config was read once, to index the changed server again
+    assert fake_caddy.requests['GET'] == gets + 1
+
+
+def test_external_changes_are_found_on_revalidation(fake_caddy, config):
+    route_index = index(fake_caddy, max_age=0)
+    route_index.refresh()
+    config['apps']['http']['servers']['srv0']['routes'][0]['match'][0]['host'] = ['renamed.example.com']
+    fake_caddy.load(config)
+    route_index.caddy_api.invalidate_config_cache()
+    assert not route_index.has_host('site0.bench.test')
+    assert route_index.has_host('renamed.example.com')
+
+
+def test_external_changes_are_not_hidden_by_changes_through_the_client(fake_caddy, config):
+    route_index = index(fake_caddy, max_age=0)
+    route_index.refresh()
+    # Someone else renames a host of srv0 before Birdie changes srv1
+    external = copy.deepcopy(config)
+    external['apps']['http']['servers']['srv0']['routes'][0]['match'][0]['host'] = ['renamed.example.com']
+    fake_caddy.load(external)
+    route_index.caddy_api.invalidate_config_cache()
+    route_index.caddy_api.replace_config_value('apps/http/servers/srv1/listen', [':8443'])
+    route_index.refresh()
+    assert route_index.has_host('renamed.example.com')
+    assert not route_index.has_host('site0.bench.test')
+
+
+def test_servers_stay_dirty_until_they_are_read(fake_caddy, monkeypatch):
+    route_index = index(fake_caddy)
+    route_index.refresh()
+    route_index.caddy_api.add_to_config_array('apps/http/servers/srv1/routes', [
+        {'match': [{'host': ['added.example.com']}], 'handle': [{'handler': 'static_response'}]}])
+
+    def unavailable(path=None, raw=False):
+        raise requests.ConnectionError('Caddy is restarting')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(route_index.caddy_api, 'get_config', unavailable)
+        with pytest.raises(requests.ConnectionError):
+            route_index.refresh()
+    assert route_index.has_host('added.example.com')
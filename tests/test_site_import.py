@@ -0,0 +1,50 @@
+import io
+import json
+from caddy_api import CaddyAPI
+from route_compiler import proxy_route
+from route_index import RouteIndex
+from server import BirdieServer
+from site_import import ImportJob
+
+ROUTES = 'apps/http/servers/srv0/routes'
+
+
+def upload(*records):
+    return io.BytesIO(b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records))
+
+
+def test_sites_are_added_in_batches(fake_caddy, config):
+    caddy_api = CaddyAPI(fake_caddy.url)
+    job = ImportJob(caddy_api, batch_size=2, host_exists=RouteIndex(caddy_api).has_host)
+    result = job.run(upload(
+        {'siteURL': 'a.example.com', 'proxyURL': '10.1.0.1:8080'},
+        {'siteURL': 'site2.bench.test', 'proxyURL': '10.1.0.2:8080'},
+        {'siteURL': 'b.example.com', 'proxyURL': 'no port'},
+        {'siteURL': 'A.example.com', 'proxyURL': '10.1.0.3:8080'},
+        {'siteURL': 'c.example.com', 'folderPath': '/srv/c'},
+        {'siteURL': 'd.example.com', 'proxyURL': '10.1.0.4:8080'},
+    ))
+    assert result['status'] == 'completed'
+    assert (result['records'], result['added'], result['skipped'], result['batches']) == (6, 3, 1, 2)
+    assert [error['line'] for error in result['errors']] == [3, 4]
+    routes = caddy_api.get_config(ROUTES)
+    assert len(routes) == len(config['apps']['http']['servers']['srv0']['routes']) + 3
+    assert routes[-3] == proxy_route('a.example.com', '10.1.0.1:8080')
+
+
+def test_dry_run_changes_nothing(fake_caddy):
+    job = ImportJob(CaddyAPI(fake_caddy.url), dry_run=True)
+    assert job.run(upload({'siteURL': 'a.example.com', 'proxyURL': '10.1.0.1:8080'}))['added'] == 1
+    assert fake_caddy.requests.get('POST', 0) == 0
+
+
+def test_import_endpoints(fake_caddy):
+    client = BirdieServer(fake_caddy.url, sampler_interval=0).app.test_client()
+    job = client.post('/import', json={'format': 'csv'}).get_json()
+    response = client.post(f"/import/{job['id']}/upload", data=b'siteURL,proxyURL\nimported.example.com,10.1.0.9:8080\n')
+    assert response.status_code == 200
+    assert response.get_json()['added'] == 1
+    assert client.post(f"/import/{job['id']}/upload", data=b'').status_code == 409
+    events = client.get(f"/import/{job['id']}/events").get_data()
+    assert events.startswith(b'id: 1\nevent: completed\n')
+    assert client.get('/routes/lookup', query_string={'host': 'imported.example.com'}).get_json()['routes']
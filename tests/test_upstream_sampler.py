@@ -0,0 +1,67 @@
+import json
+import upstream_sampler
+from upstream_sampler import RingBuffer, UpstreamSampler
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(3)
+    for second in range(5):
+        buffer.append(float(second), second * 10, second % 2)
+    assert len(buffer) == 3
+    # The two oldest samples were overwritten
+    assert buffer.range() == {'timestamps': [2.0, 3.0, 4.0], 'num_requests': [20, 30, 40], 'fails': [0, 1, 0]}
+
+
+def test_ring_buffer_range_is_inclusive():
+    buffer = RingBuffer(4)
+    for second in range(6):
+        buffer.append(float(second), second, 0)
+    assert buffer.range(since=3)['timestamps'] == [3.0, 4.0, 5.0]
+    assert buffer.range(until=3)['timestamps'] == [2.0, 3.0]
+    assert buffer.range(since=3, until=4)['num_requests'] == [3, 4]
+    assert buffer.range(since=6)['timestamps'] == []
+    assert RingBuffer(2).range() == {'timestamps': [], 'num_requests': [], 'fails': []}
+
+
+class ScriptedCaddy:
+    """
+    Answers `get_proxy_upstreams` with one scripted sample after the other.
+    """
+
+    def __init__(self, samples):
+        self.samples = iter(samples)
+
+    def get_proxy_upstreams(self):
+        return next(self.samples)
+
+
+def test_sampler_keeps_a_history_per_upstream(monkeypatch):
+    clock = iter(range(100, 110))
+    monkeypatch.setattr(upstream_sampler.time, 'time', lambda: float(next(clock)))
+    sampler = UpstreamSampler(ScriptedCaddy([
+        [{'address': 'a:80', 'num_requests': 1, 'fails': 0}],
+        [{'address': 'a:80', 'num_requests': 2, 'fails': 1}, {'address': 'b:80', 'num_requests': 5, 'fails': 0}],
+        None,
+        [{'address': 'a:80', 'num_requests': 3, 'fails': 0}],
+    ]), capacity=2)
+    for _ in range(4):
+        sampler.sample()
+    history = sampler.history()
+    assert history['a:80'] == {'timestamps': [101.0, 103.0], 'num_requests': [2, 3], 'fails': [1, 0]}
+    assert history['b:80'] == {'timestamps': [101.0], 'num_requests': [5], 'fails': [0]}
+    assert sampler.history('a:80', since=102) == {'a:80': {'timestamps': [103.0], 'num_requests': [3], 'fails': [0]}}
+    assert sampler.history('missing:80') == {}
+    assert sampler.latest == {'timestamp': 103.0, 'upstreams': [{'address': 'a:80', 'num_requests': 3, 'fails': 0}]}
+
+
+def test_samples_are_published_to_subscribers():
+    sampler = UpstreamSampler(ScriptedCaddy([[{'address': 'a:80', 'num_requests': 4, 'fails': 0}]]))
+    subscriber = sampler.broker.subscribe()
+    sample = sampler.sample()
+    message = subscriber.get_nowait()
+    lines = message.decode('utf-8').splitlines()
+    assert 'event: sample' in lines
+    assert f'id: {sample["timestamp"]!r}' in lines
+    data = next(line for line in lines if line.startswith('data: '))
+    assert json.loads(data[len('data: '):]) == sample
+    sampler.broker.unsubscribe(subscriber)
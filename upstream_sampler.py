@@ -0,0 +1,191 @@
+"""
+    Background sampling of Caddy's reverse proxy upstreams.
+    `UpstreamSampler` polls `/reverse_proxy/upstreams` of one Caddy instance at a fixed interval
+    and keeps the `num_requests` and `fails` counters of every upstream in a fixed-size ring buffer.
+    Dashboards read the history or subscribe to the live samples, so the load on Caddy stays
+    constant no matter how many of them are open.
+"""
+import logging
+import threading
+import time
+from array import array
+from sse import EventBroker
+
+
+class RingBuffer:
+    """
+    A fixed-capacity time series of upstream counters backed by typed arrays.
+
+    Attributes:
+        capacity (int): The maximum number of samples kept; older samples are overwritten.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initializes an empty ring buffer.
+
+        Args:
+            capacity (int): The maximum number of samples kept.
+        """
+        self.capacity = capacity
+        self.timestamps = array('d', [0.0]) * capacity
+        self.num_requests = array('q', [0]) * capacity
+        self.fails = array('q', [0]) * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, num_requests, fails):
+        """
+        Add a sample, overwriting the oldest one when the buffer is full.
+
+        Args:
+            timestamp (float): The UNIX time of the sample.
+            num_requests (int): The number of requests in flight to the upstream.
+            fails (int): The number of recent failures of the upstream.
+        """
+        index = (self._start + self._count) % self.capacity
+        self.timestamps[index] = timestamp
+        self.num_requests[index] = num_requests
+        self.fails[index] = fails
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def _slot(self, position):
+        return (self._start + position) % self.capacity
+
+    def _bisect(self, timestamp):
+        """
+        Get the position of the first sample at or after the given time.
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[self._slot(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(self, since=None, until=None):
+        """
+        Get the samples within a time range.
+
+        Args:
+            since (float, optional): The earliest UNIX time to include.
+            until (float, optional): The latest UNIX time to include.
+
+        Returns:
+            dict: The `timestamps`, `num_requests` and `fails` of the samples as parallel lists.
+        """
+        first = self._bisect(since) if since is not None else 0
+        last = self._bisect(until + 1e-9) if until is not None else self._count
+        slots = [self._slot(position) for position in range(first, last)]
+        return {
+            'timestamps': [self.timestamps[slot] for slot in slots],
+            'num_requests': [self.num_requests[slot] for slot in slots],
+            'fails': [self.fails[slot] for slot in slots],
+        }
+
+
+class UpstreamSampler:
+    """
+    Polls the proxy upstreams of one Caddy instance in a background thread.
+
+    Attributes:
+        caddy_api (CaddyAPI): The client of the sampled Caddy instance.
+        interval (float): Seconds between samples.
+        capacity (int): The number of samples kept per upstream.
+        broker (EventBroker): Publishes every sample to live subscribers.
+        latest (dict): The most recent sample, or None before the first one.
+    """
+
+    def __init__(self, caddy_api, interval=5, capacity=720):
+        """
+        Initializes a stopped sampler.
+
+        Args:
+            caddy_api (CaddyAPI): The client of the Caddy instance to sample.
+            interval (float, optional): Seconds between samples. Defaults to 5.
+            capacity (int, optional): The number of samples kept per upstream. Defaults to 720,
+                one hour at the default interval.
+        """
+        self.caddy_api = caddy_api
+        self.interval = interval
+        self.capacity = capacity
+        self.broker = EventBroker()
+        self.latest = None
+        self.logger = logging.getLogger(__name__)
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start sampling in a daemon thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='upstream-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+        """
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.error(f'Error sampling proxy upstreams: {e}')
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def sample(self):
+        """
+        Take one sample of all upstreams and publish it.
+
+        Returns:
+            dict: The sample, with its `timestamp` and the `upstreams` as reported by Caddy.
+        """
+        upstreams = self.caddy_api.get_proxy_upstreams() or []
+        timestamp = time.time()
+        with self._lock:
+            for upstream in upstreams:
+                address = upstream.get('address')
+                buffer = self._buffers.get(address)
+                if buffer is None:
+                    buffer = self._buffers[address] = RingBuffer(self.capacity)
+                buffer.append(timestamp, upstream.get('num_requests', 0), upstream.get('fails', 0))
+            self.latest = {'timestamp': timestamp, 'upstreams': upstreams}
+        self.broker.publish(self.latest, event='sample', id=repr(timestamp))
+        return self.latest
+
+    def history(self, address=None, since=None, until=None):
+        """
+        Get the sampled counters of one or all upstreams within a time range.
+
+        Args:
+            address (str, optional): The upstream address. Defaults to all upstreams.
+            since (float, optional): The earliest UNIX time to include.
+            until (float, optional): The latest UNIX time to include.
+
+        Returns:
+            dict: Mapping of upstream address to its samples.
+        """
+        with self._lock:
+            if address is not None:
+                buffers = {address: self._buffers[address]} if address in self._buffers else {}
+            else:
+                buffers = dict(self._buffers)
+            return {name: buffer.range(since, until) for name, buffer in buffers.items()}